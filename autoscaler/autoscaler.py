@@ -1,6 +1,12 @@
+import math
 import requests
 import time
-from utils.k8s_client import K8sClient
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from utils.k8s_client import K8sClient, list_deployments
+from utils.instrumentation import TRACE_HEADER, DECISIONS, current_trace_id, start_metrics_server, start_trace, timed
 import os
 import logging
 
@@ -8,46 +14,212 @@ logging.basicConfig(level=logging.INFO)
 
 SUGGESTION_SERVICE_URL = os.getenv("SUGGESTION_SERVICE_URL", "http://suggestion-service:5000/suggestion")
 POLL_INTERVAL_SECONDS = int(os.getenv("POLL_INTERVAL_SECONDS", 60))
-NAMESPACE = "default"
-DEPLOYMENT = 'nginx'
-
-client = K8sClient(deployment_name=DEPLOYMENT, namespace=NAMESPACE)
-
-def get_scaling_suggestion():
-    try:
-        params = {
-            'deployment': DEPLOYMENT,
-            'namespace': NAMESPACE
-        }
-        response = requests.get(SUGGESTION_SERVICE_URL, params=params)
-        response.raise_for_status()
-        action = response.json()['action']
-        return action
-    except Exception as e:
-        logging.error(f"[Error] Failed to get suggestion: {e}")
+# Namespace whose deployments are managed
+NAMESPACE = os.getenv("WATCH_NAMESPACE", "default")
+# Deployments carrying this label are managed (empty = every deployment in the namespace)
+LABEL_SELECTOR = os.getenv("AUTOSCALE_LABEL_SELECTOR", "maestro/autoscale=true")
+# How often the managed set is refreshed from the informer cache to pick up new or deleted deployments
+DISCOVERY_INTERVAL_SECONDS = int(os.getenv("DISCOVERY_INTERVAL_SECONDS", 5))
+# Decision cycles that may run at the same time
+MAX_CONCURRENT_DECISIONS = int(os.getenv("MAX_CONCURRENT_DECISIONS", 32))
+# Timeout of one call to the suggestion service
+SUGGESTION_TIMEOUT_SECONDS = float(os.getenv("SUGGESTION_TIMEOUT_SECONDS", 15))
+# Longest a scale action waits for its pods to become ready
+SCALE_TIMEOUT_SECONDS = float(os.getenv("SCALE_TIMEOUT_SECONDS", 60))
+# Port of the Prometheus /metrics endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+
+# Deployment annotations read by the controller
+ENABLED_ANNOTATION = "maestro/autoscale"  # "false" opts a labelled deployment out
+POLL_INTERVAL_ANNOTATION = "maestro/poll-interval"  # per-deployment override, in seconds
+
+
+class AutoscalerController:
+    """
+    Runs decision cycles for every discovered deployment on a bounded worker pool.
+    Each deployment has its own schedule, so a slow scale-out only occupies
+    one worker and never delays the cycles of other deployments.
+    """
+    def __init__(self, namespace=NAMESPACE, label_selector=LABEL_SELECTOR,
+                 max_workers=MAX_CONCURRENT_DECISIONS, poll_interval=POLL_INTERVAL_SECONDS,
+                 discovery_interval=DISCOVERY_INTERVAL_SECONDS):
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.poll_interval = poll_interval
+        self.discovery_interval = discovery_interval
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='decision')
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=max_workers))
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=max_workers))
+        self.intervals = {}  # deployment -> poll interval in seconds
+        self.invalid_intervals = {}  # deployment -> rejected poll interval annotation, warned about once
+        self.clients = {}  # deployment -> K8sClient
+        self.schedule = []  # heap of (due time, deployment)
+        self.in_flight = set()
+        self.wakeup = threading.Condition()
+        self.stopped = threading.Event()
+
+    def discover(self):
+        """Refresh the set of managed deployments; new ones are scheduled immediately."""
+        try:
+            deployments = list_deployments(self.namespace, self.label_selector)
+        except Exception as e:
+            logging.error(f"[Error] Failed to list deployments in '{self.namespace}': {e}")
+            return
+        intervals = {}
+        for deployment in deployments:
+            annotations = deployment.metadata.annotations or {}
+            if annotations.get(ENABLED_ANNOTATION, "true").lower() == "false":
+                continue
+            intervals[deployment.metadata.name] = self.annotated_interval(deployment.metadata.name, annotations)
+        for name in self.invalid_intervals.keys() - intervals.keys():
+            del self.invalid_intervals[name]
+        with self.wakeup:
+            now = time.monotonic()
+            scheduled = {name for _, name in self.schedule}
+            for name in intervals.keys() - self.intervals.keys():
+                logging.info(f"[Discovery] Managing '{self.namespace}/{name}' every {intervals[name]}s")
+                self.clients[name] = K8sClient(deployment_name=name, namespace=self.namespace)
+                if name not in scheduled:
+                    heapq.heappush(self.schedule, (now, name))
+            for name in self.intervals.keys() - intervals.keys():
+                logging.info(f"[Discovery] No longer managing '{self.namespace}/{name}'")
+                client = self.clients.pop(name, None)
+                if client is not None:
+                    client.close()
+            self.intervals = intervals
+
+    def annotated_interval(self, deployment, annotations):
+        """
+        The poll interval of a deployment: its poll interval annotation if that is a
+        positive number of seconds, else the default (with a warning, once per value).
+        """
+        value = annotations.get(POLL_INTERVAL_ANNOTATION)
+        if value is None:
+            self.invalid_intervals.pop(deployment, None)
+            return self.poll_interval
+        try:
+            interval = float(value)
+        except ValueError:
+            interval = math.nan
+        if math.isfinite(interval) and interval > 0:
+            self.invalid_intervals.pop(deployment, None)
+            return interval
+        if self.invalid_intervals.get(deployment) != value:
+            logging.warning(f"[Discovery] Ignoring {POLL_INTERVAL_ANNOTATION}={value!r} on '{self.namespace}/{deployment}': "
+                            f"not a positive number of seconds, polling every {self.poll_interval}s")
+            self.invalid_intervals[deployment] = value
+        return self.poll_interval
+
+    def get_scaling_suggestion(self, deployment):
+        try:
+            params = {
+                'deployment': deployment,
+                'namespace': self.namespace
+            }
+            with timed('suggestion_request'):
+                response = self.session.get(SUGGESTION_SERVICE_URL, params=params, timeout=SUGGESTION_TIMEOUT_SECONDS,
+                                            headers={TRACE_HEADER: current_trace_id.get()})
+                response.raise_for_status()
+                action = response.json()['action']
+            return action
+        except Exception as e:
+            logging.error(f"[Error] Failed to get suggestion for '{deployment}': {e}")
+            return None
+
+    def perform_scaling_action(self, deployment, action):
+        """
+        Apply the suggested action without waiting for the rollout.
+        Returns:
+            A Future resolving to whether the new pods became ready, or None if nothing was scaled.
+        """
+        try:
+            DECISIONS.labels(action).inc()
+            client = self.clients[deployment]
+            current_replicas = client.get_current_replicas()
+            new_replicas = max(1, current_replicas + action - 1)
+
+            if new_replicas != current_replicas:
+                rollout = client.scale_deployment_async(new_replicas, timeout=SCALE_TIMEOUT_SECONDS)
+                logging.info(f"[Scale] {action} → '{deployment}' from {current_replicas} to {new_replicas} replicas")
+                return rollout
+            else:
+                logging.info(f"[Info] No scaling needed for '{deployment}'; already at {current_replicas} replicas")
+
+        except Exception as e:
+            logging.error(f"[Error] Failed to scale deployment '{deployment}': {e}")
         return None
 
-def perform_scaling_action(action):
-    try:
-        
-        current_replicas = client.get_current_replicas()
-        new_replicas = max(1, current_replicas + action - 1)
-        
-        if new_replicas != current_replicas:
-            client.scale_deployment(new_replicas)
-            logging.info(f"[Scale] {action} → '{DEPLOYMENT}' from {current_replicas} to {new_replicas} replicas")
-        else:
-            logging.info(f"[Info] No scaling needed; already at {current_replicas} replicas")
-
-    except Exception as e:
-        logging.error(f"[Error] Failed to scale deployment '{DEPLOYMENT}': {e}")
+    def run_cycle(self, deployment):
+        """One decision cycle for one deployment."""
+        rollout = None
+        trace_id = start_trace()
+        try:
+            logging.info(f"--- New cycle for {self.namespace}/{deployment} (trace {trace_id}) ---")
+            with timed('decision_cycle'):
+                action = self.get_scaling_suggestion(deployment)
+                if action is not None:
+                    rollout = self.perform_scaling_action(deployment, action)
+        finally:
+            if rollout is None:
+                self.release(deployment)
+            else:
+                # The deployment stays in flight until its rollout finishes, but the worker is freed now
+                rollout.add_done_callback(lambda future: self.rollout_done(deployment, future, trace_id))
+
+    def rollout_done(self, deployment, future, trace_id=None):
+        try:
+            if future.result():
+                logging.info(f"[Scale] '{deployment}' is ready (trace {trace_id})")
+            else:
+                logging.warning(f"[Scale] '{deployment}' did not become ready within {SCALE_TIMEOUT_SECONDS}s "
+                                f"(trace {trace_id})")
+        except Exception as e:
+            logging.error(f"[Error] Failed to wait for '{deployment}' to become ready (trace {trace_id}): {e}")
+        finally:
+            self.release(deployment)
+
+    def release(self, deployment):
+        with self.wakeup:
+            self.in_flight.discard(deployment)
+            self.wakeup.notify()
+
+    def run(self):
+        logging.info(f"Starting Custom autoscaler Controller for namespace '{self.namespace}' "
+                     f"(selector '{self.label_selector}', {self.max_workers} workers)...")
+        next_discovery = time.monotonic()
+        while not self.stopped.is_set():
+            if time.monotonic() >= next_discovery:
+                self.discover()
+                next_discovery = time.monotonic() + self.discovery_interval
+            with self.wakeup:
+                now = time.monotonic()
+                deferred = []
+                while self.schedule and self.schedule[0][0] <= now:
+                    due, name = heapq.heappop(self.schedule)
+                    if name not in self.intervals:
+                        continue
+                    if name in self.in_flight:
+                        # Previous cycle still running; check again in a second
+                        deferred.append((now + 1, name))
+                        continue
+                    self.in_flight.add(name)
+                    # Fixed-rate schedule: the next cycle is due one interval after this one was
+                    heapq.heappush(self.schedule, (max(due + self.intervals[name], now), name))
+                    self.executor.submit(self.run_cycle, name)
+                for item in deferred:
+                    heapq.heappush(self.schedule, item)
+                next_due = self.schedule[0][0] if self.schedule else next_discovery
+                self.wakeup.wait(max(min(next_due, next_discovery) - time.monotonic(), 0))
+
+    def stop(self):
+        """Stop scheduling new cycles; cycles already running finish on their own."""
+        with self.wakeup:
+            self.stopped.set()
+            self.wakeup.notify()
+
 
 if __name__ == "__main__":
-    logging.info("Starting Custom autoscaler Controller...")
-    while True:
-        logging.info(f"--- New cycle for {NAMESPACE}/{DEPLOYMENT} ---")
-        action = get_scaling_suggestion()
-        if action is not None:
-            perform_scaling_action(action)
-        logging.info(f"--- Cycle complete. Waiting for {POLL_INTERVAL_SECONDS} seconds. ---")
-        time.sleep(POLL_INTERVAL_SECONDS)
+    start_metrics_server(METRICS_PORT)
+    AutoscalerController().run()
@@ -1,146 +1,170 @@
-import random
-import time
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
 
-class PodKillException(Exception):
-    pass
+CHAOS_GROUP = "chaos-mesh.org"
+CHAOS_VERSION = "v1alpha1"
+# Labels put on every experiment created by the manager, used to find leftovers of earlier runs
+MANAGED_BY_LABEL = "maestro/managed-by"
+TARGET_LABEL = "maestro/chaos-target"
+PLURALS = {
+    'StressChaos': 'stresschaos',
+    'PodChaos': 'podchaos',
+    'NetworkChaos': 'networkchaos',
+}
 
 class ChaosExperimentManager:
-    def __init__(self, custom_api, deployment_name, namespace):
+    """
+    Creates Chaos Mesh experiments against one deployment and removes them again.
+    Only experiments created by this manager are deleted. Deletion is requested
+    and confirmed on a background thread, so cleanup_chaos returns immediately;
+    every experiment gets a unique name, so new ones never collide with
+    experiments that are still terminating.
+    """
+    def __init__(self, custom_api, deployment_name, namespace, deletion_timeout=30):
         self.custom_api = custom_api
         self.deployment_name = deployment_name
         self.namespace = namespace
-        self.active_chaos_instances = set()
-        self.chaos_experiments = {
-            'cpu_stress_failure': {
-                'apiVersion': 'chaos-mesh.org/v1alpha1',
-                'kind': 'StressChaos',
-                'metadata': {
-                    'name': 'cpu-stress',
-                    'namespace': self.namespace
-                },
-                'spec': {
-                    'mode': 'all',
-                    'selector': {
-                        'labelSelectors': {
-                            'app': self.deployment_name
-                        }
-                    },
-                    'stressors': {
-                        'cpu': {
-                            'workers': 4,
-                            'load': 100
-                        }
-                    },
-                    'duration': '270s'
-                }
-            },
-            'pod_kill': {
-                'apiVersion': 'chaos-mesh.org/v1alpha1',
-                'kind': 'PodChaos',
-                'metadata': {
-                    'name': 'pod-kill',
-                    'namespace': self.namespace
-                },
-                'spec': {
-                    'action': 'pod-kill',
-                    'mode': 'all',
-                    'selector': {
-                        'labelSelectors': {
-                            'app': self.deployment_name
-                        }
-                    },
-                }
+        self.deletion_timeout = deletion_timeout
+        self.active_chaos_instances = {}  # name -> plural of experiments that have not been cleaned up
+        self.pending_deletions = {}  # name -> Future resolving once the deletion is confirmed
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='chaos-cleanup')
+        self.labels = {
+            MANAGED_BY_LABEL: 'chaos-experiment-manager',
+            TARGET_LABEL: self.deployment_name,
+        }
+
+    def create_experiment(self, kind, name, spec):
+        """
+        Create a Chaos Mesh experiment and track it for cleanup.
+        Args:
+            kind: Chaos Mesh kind, e.g. 'StressChaos', 'NetworkChaos' or 'PodChaos'.
+            name: Name prefix; a random suffix keeps names unique.
+            spec: Experiment spec; the selector is filled in with the target deployment.
+        Returns:
+            The name of the created experiment.
+        """
+        experiment = {
+            'apiVersion': f'{CHAOS_GROUP}/{CHAOS_VERSION}',
+            'kind': kind,
+            'metadata': {
+                'name': f"{name}-{uuid.uuid4().hex[:8]}",
+                'namespace': self.namespace,
+                'labels': dict(self.labels),
             },
-            'cpu_stress': {
-                'apiVersion': 'chaos-mesh.org/v1alpha1',
-                'kind': 'StressChaos',
-                'metadata': {
-                    'name': 'cpu-stress',
-                    'namespace': self.namespace
+            'spec': {
+                'selector': {
+                    'labelSelectors': {
+                        'app': self.deployment_name
+                    }
                 },
-                'spec': {
-                    'mode': 'all',
-                    'selector': {
-                        'labelSelectors': {
-                            'app': self.deployment_name
-                        }
-                    },
-                    'stressors': {
-                        'cpu': {
-                            'workers': 4,
-                            'load': 50
-                        }
-                    },
-                    'duration': '270s'
-                }
+                **spec
             }
         }
+        plural = PLURALS[kind]
+        self.custom_api.create_namespaced_custom_object(
+            group=CHAOS_GROUP,
+            version=CHAOS_VERSION,
+            namespace=self.namespace,
+            plural=plural,
+            body=experiment
+        )
+        with self._lock:
+            self.active_chaos_instances[experiment['metadata']['name']] = plural
+        print(f"Injected {kind} chaos experiment {experiment['metadata']['name']}")
+        return experiment['metadata']['name']
 
-    def inject_chaos(self, wait_for_pods_ready):
-        if self.active_chaos_instances:
-            return False
-        if random.random() < 0.1:
-            experiment = random.choice([
-                self.chaos_experiments['cpu_stress'],
-                self.chaos_experiments['cpu_stress_failure']
-            ])
-            try:
-                self.custom_api.create_namespaced_custom_object(
-                    group="chaos-mesh.org",
-                    version="v1alpha1",
-                    namespace=self.namespace,
-                    plural="stresschaos",
-                    body=experiment
-                )
-                self.active_chaos_instances.add(experiment['metadata']['name'])
-                print(f"Injected {experiment['kind']} chaos experiment")
-                if experiment == self.chaos_experiments['cpu_stress_failure']:
-                    pod_kill_experiment = self.chaos_experiments['pod_kill']
-                    self.custom_api.create_namespaced_custom_object(
-                        group="chaos-mesh.org",
-                        version="v1alpha1",
-                        namespace=self.namespace,
-                        plural="podchaos",
-                        body=pod_kill_experiment
-                    )
-                    self.active_chaos_instances.add(pod_kill_experiment['metadata']['name'])
-                    print("Applied pod kill experiment")
-                    wait_for_pods_ready(0)
-                    raise PodKillException("All pods killed")
-            except PodKillException as e:
-                raise e
-            except Exception as e:
-                print(f"Failed to inject chaos: {str(e)}")
-                return False
-        return False
+    def delete_experiments(self, names):
+        """Schedule deletion of some of the tracked experiments; does not wait for it."""
+        with self._lock:
+            for name in names:
+                plural = self.active_chaos_instances.pop(name, None)
+                if plural is not None:
+                    self.pending_deletions[name] = self._executor.submit(self._delete, name, plural)
 
     def cleanup_chaos(self):
-        for experiment in self.chaos_experiments.values():
-            kind = experiment['kind']
-            name = experiment['metadata']['name']
-            plural = 'podchaos' if kind == 'PodChaos' else 'stresschaos'
+        """Schedule deletion of every experiment this manager created; does not wait for it."""
+        self.delete_experiments(list(self.active_chaos_instances))
+
+    def sweep_stale(self):
+        """Schedule deletion of experiments left behind for this deployment by earlier runs."""
+        selector = ','.join(f'{key}={value}' for key, value in self.labels.items())
+        for plural in PLURALS.values():
             try:
-                self.custom_api.delete_namespaced_custom_object(
-                    group="chaos-mesh.org",
-                    version="v1alpha1",
+                experiments = self.custom_api.list_namespaced_custom_object(
+                    group=CHAOS_GROUP,
+                    version=CHAOS_VERSION,
                     namespace=self.namespace,
                     plural=plural,
-                    name=name
-                )
-            except Exception:
-                pass
-            for _ in range(10):
-                time.sleep(0.5)
-                try:
-                    self.custom_api.get_namespaced_custom_object(
-                        group="chaos-mesh.org",
-                        version="v1alpha1",
-                        namespace=self.namespace,
-                        plural=plural,
-                        name=name
-                    )
-                except:
-                    break
-            if name in self.active_chaos_instances:
-                self.active_chaos_instances.discard(name)
-                print(f"Deleted {kind} chaos experiment") 
\ No newline at end of file
+                    label_selector=selector
+                )['items']
+            except Exception as e:
+                print(f"Failed to list {plural} experiments: {str(e)}")
+                continue
+            with self._lock:
+                for experiment in experiments:
+                    name = experiment['metadata']['name']
+                    if name not in self.active_chaos_instances and name not in self.pending_deletions:
+                        self.pending_deletions[name] = self._executor.submit(self._delete, name, plural)
+
+    def wait_for_cleanup(self, timeout=None):
+        """Block until every scheduled deletion is confirmed; returns whether they all were."""
+        with self._lock:
+            futures = list(self.pending_deletions.values())
+        _, not_done = wait(futures, timeout)
+        return not not_done
+
+    def _delete(self, name, plural):
+        try:
+            self.custom_api.delete_namespaced_custom_object(
+                group=CHAOS_GROUP,
+                version=CHAOS_VERSION,
+                namespace=self.namespace,
+                plural=plural,
+                name=name
+            )
+            if self._wait_until_deleted(name, plural):
+                print(f"Deleted chaos experiment {name}")
+            else:
+                print(f"Chaos experiment {name} still terminating after {self.deletion_timeout}s")
+        except ApiException as e:
+            if e.status != 404:
+                print(f"Failed to delete chaos experiment {name}: {e.reason}")
+        except Exception as e:
+            print(f"Failed to delete chaos experiment {name}: {str(e)}")
+        finally:
+            with self._lock:
+                self.pending_deletions.pop(name, None)
+
+    def _wait_until_deleted(self, name, plural):
+        """Watch a deleted experiment until it is gone (its finalizers may keep it around for a while)."""
+        try:
+            experiment = self.custom_api.get_namespaced_custom_object(
+                group=CHAOS_GROUP,
+                version=CHAOS_VERSION,
+                namespace=self.namespace,
+                plural=plural,
+                name=name
+            )
+        except ApiException as e:
+            if e.status == 404:
+                return True
+            raise
+        w = watch.Watch()
+        for event in w.stream(
+            self.custom_api.list_namespaced_custom_object,
+            group=CHAOS_GROUP,
+            version=CHAOS_VERSION,
+            namespace=self.namespace,
+            plural=plural,
+            field_selector=f'metadata.name={name}',
+            resource_version=experiment['metadata']['resourceVersion'],
+            timeout_seconds=self.deletion_timeout
+        ):
+            if event['type'] == 'DELETED':
+                w.stop()
+                return True
+        return False
@@ -0,0 +1,349 @@
+"""
+Declarative chaos scenarios.
+A scenario file (YAML) lists faults injected at fixed steps and/or a random
+fault drawn with some probability per step. The engine draws from the
+environment's seeded generator, so the same seed reproduces the same fault
+sequence on Chaos Mesh and in the simulated environment.
+
+Example:
+    name: network-and-kill
+    faults:
+      - type: network_delay
+        at_step: [20, 120]
+        duration_steps: 3
+        latency_ms: 200
+      - type: pod_kill
+        at_step: 60
+        percent: 50
+    random:
+      probability: 0.1     # per step, only while no fault is active
+      choices:
+        - {type: cpu_stress, load: 50}
+        - [{type: load_spike, multiplier: 2}, {type: memory_stress, size_mb: 256}]
+"""
+import argparse
+import os
+import numpy as np
+import yaml
+
+# Bundled scenarios, looked up by name
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios')
+
+# Fault types and the default value of each of their parameters
+FAULT_TYPES = {
+    'cpu_stress': {'load': 50, 'workers': 4},
+    'memory_stress': {'size_mb': 256, 'workers': 1},
+    'network_delay': {'latency_ms': 100, 'jitter_ms': 0},
+    'network_loss': {'loss_percent': 10},
+    'pod_kill': {'percent': 100},
+    'load_spike': {'multiplier': 2.0},
+}
+# Keys of a fault entry that are not fault parameters
+SCHEDULE_KEYS = ('type', 'at_step', 'probability', 'duration_steps')
+
+
+class PodKillException(Exception):
+    """Raised when a fault kills every pod of the deployment."""
+    pass
+
+
+def _fault(entry, scheduled):
+    """Validate one fault entry and fill in its defaults."""
+    if not isinstance(entry, dict) or entry.get('type') not in FAULT_TYPES:
+        raise ValueError(f"Unknown fault {entry!r}; expected one of {sorted(FAULT_TYPES)}")
+    params = {key: value for key, value in entry.items() if key not in SCHEDULE_KEYS}
+    unknown = params.keys() - FAULT_TYPES[entry['type']].keys()
+    if unknown:
+        raise ValueError(f"Unknown parameters for {entry['type']}: {sorted(unknown)}")
+    fault = {
+        'type': entry['type'],
+        'duration_steps': int(entry.get('duration_steps', 1)),
+        'params': {**FAULT_TYPES[entry['type']], **params},
+    }
+    if scheduled:
+        at_step = entry.get('at_step')
+        if at_step is None:
+            raise ValueError(f"Scheduled fault {entry['type']} needs at_step")
+        fault['at_step'] = {int(step) for step in (at_step if isinstance(at_step, list) else [at_step])}
+    return fault
+
+
+def load_scenario(path):
+    """
+    Load and validate a scenario file.
+    Args:
+        path: Path of a YAML file, or the name of a bundled scenario (e.g. 'default').
+    Returns:
+        Dict with 'name', 'faults' (scheduled faults) and 'random' (None or probability and choices).
+    """
+    if not os.path.exists(path):
+        bundled = os.path.join(SCENARIO_DIR, path if path.endswith('.yaml') else f'{path}.yaml')
+        if not os.path.exists(bundled):
+            raise FileNotFoundError(f"No scenario file or bundled scenario named '{path}'")
+        path = bundled
+    with open(path) as f:
+        raw = yaml.safe_load(f) or {}
+    scenario = {
+        'name': raw.get('name', os.path.splitext(os.path.basename(path))[0]),
+        'faults': [_fault(entry, scheduled=True) for entry in raw.get('faults', [])],
+        'random': None,
+    }
+    if raw.get('random'):
+        choices = raw['random'].get('choices') or []
+        if not choices:
+            raise ValueError("random needs at least one choice")
+        scenario['random'] = {
+            'probability': float(raw['random'].get('probability', 0.1)),
+            # Each choice is a group of faults started together
+            'choices': [[_fault(entry, scheduled=False) for entry in (choice if isinstance(choice, list) else [choice])]
+                        for choice in choices],
+        }
+    return scenario
+
+
+class ChaosScenarioEngine:
+    """
+    Plays a scenario against a backend, one call to step() per environment step.
+    A fault started at step k is active for duration_steps steps and stopped at
+    the beginning of step k + duration_steps. Every start and stop is logged in
+    events for recovery analysis (see recovery_times).
+    """
+    def __init__(self, scenario, backend):
+        self.scenario = scenario
+        self.backend = backend
+        self.rng = np.random.default_rng()
+        self.current_step = 0
+        self.active = []  # [end step, fault, handle, id]
+        self.events = []
+        self._next_id = 0
+
+    def reset(self, rng=None):
+        """Stop every active fault and restart the scenario, drawing from rng (e.g. the env's np_random)."""
+        self.stop_all()
+        if rng is not None:
+            self.rng = rng
+        self.current_step = 0
+        self.events = []
+
+    def step(self):
+        """Stop expired faults and start the faults due at the current step; returns the started faults."""
+        step = self.current_step
+        self.current_step += 1
+        for entry in [entry for entry in self.active if entry[0] <= step]:
+            self._stop(entry, step)
+        due = [fault for fault in self.scenario['faults'] if step in fault['at_step']]
+        random_faults = self.scenario['random']
+        # The draw happens on every step so the sequence does not depend on what else is active
+        if random_faults is not None and self.rng.random() < random_faults['probability']:
+            choice = random_faults['choices'][int(self.rng.integers(len(random_faults['choices'])))]
+            if not self.active:
+                due.extend(choice)
+        for fault in due:
+            self._next_id += 1
+            self.events.append({'id': self._next_id, 'step': step, 'event': 'start',
+                                'type': fault['type'], 'params': fault['params']})
+            # Track the fault before starting it, so it is stopped even if starting raises (e.g. PodKillException)
+            entry = [step + fault['duration_steps'], fault, None, self._next_id]
+            self.active.append(entry)
+            entry[2] = self.backend.start(fault)
+        return due
+
+    def stop_all(self):
+        for entry in list(self.active):
+            self._stop(entry, self.current_step)
+        self.backend.stop_all()
+
+    def _stop(self, entry, step):
+        self.active.remove(entry)
+        self.events.append({'id': entry[3], 'step': step, 'event': 'stop',
+                            'type': entry[1]['type'], 'params': entry[1]['params']})
+        if entry[2] is not None:
+            self.backend.stop(entry[2])
+
+
+def recovery_times(events, slo_met):
+    """
+    Steps needed to meet the SLO again after each fault.
+    Args:
+        events: ChaosScenarioEngine.events.
+        slo_met: Per-step booleans, e.g. latency below the soft constraint after each step.
+    Returns:
+        List of dicts with the fault type, start and stop steps and the recovery time in
+        steps after the stop (0 if the SLO was met right away, None if never).
+    """
+    faults = []
+    started = {}
+    for event in events:
+        if event['event'] == 'start':
+            started[event['id']] = event['step']
+            continue
+        if event['id'] not in started:
+            continue
+        start, stop = started.pop(event['id']), event['step']
+        recovery = next((step - stop for step in range(stop, len(slo_met)) if slo_met[step]), None)
+        faults.append({'type': event['type'], 'start': start, 'stop': stop, 'recovery_steps': recovery})
+    return faults
+
+
+class ChaosMeshBackend:
+    """Turns scenario faults into Chaos Mesh experiments through a ChaosExperimentManager."""
+    def __init__(self, manager, action_interval, wait_for_pods_ready):
+        self.manager = manager
+        self.action_interval = action_interval
+        self.wait_for_pods_ready = wait_for_pods_ready
+
+    def start(self, fault):
+        params = fault['params']
+        # Experiments also expire on their own in case the process dies before deleting them
+        duration = f"{fault['duration_steps'] * self.action_interval * 2}s"
+        if fault['type'] == 'cpu_stress':
+            return [self.manager.create_experiment('StressChaos', 'cpu-stress', {
+                'mode': 'all',
+                'stressors': {'cpu': {'workers': params['workers'], 'load': params['load']}},
+                'duration': duration,
+            })]
+        if fault['type'] == 'memory_stress':
+            return [self.manager.create_experiment('StressChaos', 'memory-stress', {
+                'mode': 'all',
+                'stressors': {'memory': {'workers': params['workers'], 'size': f"{params['size_mb']}MB"}},
+                'duration': duration,
+            })]
+        if fault['type'] == 'network_delay':
+            return [self.manager.create_experiment('NetworkChaos', 'network-delay', {
+                'action': 'delay',
+                'mode': 'all',
+                'delay': {'latency': f"{params['latency_ms']}ms", 'jitter': f"{params['jitter_ms']}ms"},
+                'duration': duration,
+            })]
+        if fault['type'] == 'network_loss':
+            return [self.manager.create_experiment('NetworkChaos', 'network-loss', {
+                'action': 'loss',
+                'mode': 'all',
+                'loss': {'loss': str(params['loss_percent'])},
+                'duration': duration,
+            })]
+        if fault['type'] == 'pod_kill':
+            if params['percent'] >= 100:
+                self.manager.create_experiment('PodChaos', 'pod-kill', {'action': 'pod-kill', 'mode': 'all'})
+                self.wait_for_pods_ready(0)
+                raise PodKillException("All pods killed")
+            return [self.manager.create_experiment('PodChaos', 'pod-kill', {
+                'action': 'pod-kill',
+                'mode': 'fixed-percent',
+                'value': str(params['percent']),
+            })]
+        # Load is generated by k6 outside the cluster; Chaos Mesh cannot change it
+        print(f"Skipping {fault['type']}: not supported on Chaos Mesh")
+        return None
+
+    def stop(self, handle):
+        self.manager.delete_experiments(handle)
+
+    def stop_all(self):
+        self.manager.cleanup_chaos()
+
+
+class SimulatedChaosBackend:
+    """
+    Applies scenario faults to a SimulatedMicroserviceEnv through its faults dict.
+    The effects are rough stand-ins for the real faults: stress takes a share of
+    each pod's capacity, network faults add latency, pod kills restart pods.
+    Killing every pod raises PodKillException, like ChaosMeshBackend, so the
+    episode ends the same way in simulation and on the cluster.
+    """
+    def __init__(self, env):
+        self.env = env
+        self.active = []
+
+    def start(self, fault):
+        if fault['type'] == 'pod_kill':
+            self.env.kill_pods(min(fault['params']['percent'], 100) / 100.0)
+            if fault['params']['percent'] >= 100:
+                raise PodKillException("All pods killed")
+            return None
+        self.active.append(fault)
+        self._apply()
+        return fault
+
+    def stop(self, handle):
+        self.active.remove(handle)
+        self._apply()
+
+    def stop_all(self):
+        self.active = []
+        self._apply()
+
+    def _apply(self):
+        faults = dict(self.env.NO_FAULTS)
+        for fault in self.active:
+            params = fault['params']
+            if fault['type'] == 'cpu_stress':
+                # The stressor competes with the service for the pod's CPU
+                faults['capacity_factor'] *= 1.0 - 0.5 * min(params['load'], 100) / 100.0
+                faults['cpu_percent_per_pod'] += params['load'] * params['workers']
+            elif fault['type'] == 'memory_stress':
+                faults['memory_per_pod'] += params['size_mb'] * 1024 * 1024
+            elif fault['type'] == 'network_delay':
+                faults['latency_ms'] += params['latency_ms'] + params['jitter_ms']
+            elif fault['type'] == 'network_loss':
+                # Lost packets are retransmitted after roughly a second
+                faults['latency_ms'] += params['loss_percent'] / 100.0 * 1000.0
+                faults['capacity_factor'] *= 1.0 - params['loss_percent'] / 100.0
+            elif fault['type'] == 'load_spike':
+                faults['load_multiplier'] *= params['multiplier']
+        self.env.faults = faults
+
+
+def run_scenario(model, scenario, seed=0, episodes=1):
+    """
+    Run a policy on the simulated environment under a scenario.
+    Returns:
+        Per-episode dicts with the total reward, SLO violations and fault recovery times.
+    """
+    from rl_model.sim_env import SimulatedMicroserviceEnv
+    env = SimulatedMicroserviceEnv(chaos_scenario=scenario)
+    soft_limit = float(env.annotations['latencySoftConstraint'])
+    results = []
+    for episode in range(episodes):
+        state, _ = env.reset(seed=seed + episode)
+        total_reward, slo_met, done = 0.0, [], False
+        while not done:
+            action, _ = model.predict(state, deterministic=True)
+            state, reward, terminated, truncated, _ = env.step(int(action))
+            total_reward += reward
+            slo_met.append(bool(state[3] <= soft_limit))
+            done = terminated or truncated
+        results.append({
+            'seed': seed + episode,
+            'total_reward': total_reward,
+            'steps': len(slo_met),
+            'slo_violations': slo_met.count(False),
+            'faults': recovery_times(env.chaos_engine.events, slo_met),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a policy on the simulated environment under a chaos scenario")
+    parser.add_argument("model", help="Policy exported to .npz (rl_model/export.py) or a PPO .zip")
+    parser.add_argument("scenario", help="Scenario file or bundled scenario name")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--episodes", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.model.endswith('.npz'):
+        from utils.numpy_policy import NumpyPolicy
+        model = NumpyPolicy.load(args.model)
+    else:
+        from stable_baselines3 import PPO
+        model = PPO.load(args.model, device='cpu')
+    for result in run_scenario(model, args.scenario, args.seed, args.episodes):
+        recoveries = [fault['recovery_steps'] for fault in result['faults'] if fault['recovery_steps'] is not None]
+        print(f"seed {result['seed']}: reward {result['total_reward']:.2f}, "
+              f"{result['slo_violations']}/{result['steps']} steps over the soft latency limit, "
+              f"{len(result['faults'])} faults, mean recovery "
+              f"{np.mean(recoveries) if recoveries else float('nan'):.2f} steps")
+
+
+if __name__ == "__main__":
+    main()
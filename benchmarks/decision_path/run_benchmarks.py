@@ -0,0 +1,389 @@
+"""
+Micro- and component benchmarks of the scaling decision path, compared
+against a stored baseline to catch performance regressions.
+
+    python -m benchmarks.decision_path.run_benchmarks --output results.json
+    python -m benchmarks.decision_path.run_benchmarks --update-baseline
+
+Benchmarks:
+    state_builder.build_state     one state vector per call
+    state_builder.build_states    vectorized, per state
+    reward.calculate_reward       one reward per call
+    reward.calculate_rewards      vectorized, per state
+    model_server.predict          /predict requests through the Flask app
+    model_server.predict_batch    /predict_batch requests, per observation
+    suggestion_server.suggestion  concurrent /suggestion requests through the Quart
+                                  app, against the fake Kubernetes API and Prometheus
+                                  of benchmarks/local_stack and a stub model server
+    sim_env.step                  SimulatedMicroserviceEnv steps
+    batch_env.step                BatchedSimulatedEnv steps, per environment
+
+Every benchmark reports ops_per_second (higher is better); a benchmark
+regresses when it drops more than --tolerance below the baseline. The
+request payloads come from payloads.jsonl, one /predict body per line,
+sampled from the simulator (regenerate with --write-corpus).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(BENCHMARK_DIR, 'payloads.jsonl')
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+# Number of passes over the inputs of a benchmark; the fastest pass is reported, as with timeit,
+# since slower passes measure interference from the rest of the machine
+REPEAT = 7
+
+
+def load_corpus(path=CORPUS_PATH):
+    """Read the payload corpus: one /predict JSON body per line."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_corpus(path=CORPUS_PATH, size=256, seed=0):
+    """Sample /predict payloads from simulated episodes under random actions."""
+    from rl_model.sim_env import SimulatedMicroserviceEnv
+    env = SimulatedMicroserviceEnv()
+    rng = np.random.default_rng(seed)
+    env.reset(seed=seed)
+    with open(path, 'w') as f:
+        for _ in range(size):
+            _, _, terminated, truncated, _ = env.step(int(rng.integers(0, 3)))
+            if terminated or truncated:
+                env.reset()
+            payload = {
+                'cpu_usage': round(env.metrics['cpu_usage_percent'] / 100, 4),  # cores, as Prometheus reports them
+                'memory_usage': int(env.metrics['memory_bytes']),
+                'replicas': env._replicas,
+                'latency': round(env.metrics['p95_latency_ms'], 2),
+                'rps': round(env.metrics['rps'], 2),
+            }
+            f.write(json.dumps(payload) + '\n')
+
+
+def percentile_us(values, q):
+    return float(np.percentile(values, q) * 1e6)
+
+
+def measure(fn, inputs, repeat=REPEAT, ops_per_call=1):
+    """
+    Time fn over every item of inputs, repeat times.
+    Returns:
+        Dict with ops_per_second and mean_us of the fastest pass.
+    """
+    for item in inputs[:10]:
+        fn(item)
+    passes = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            fn(item)
+        passes.append(time.perf_counter() - start)
+    elapsed = min(passes)
+    ops = len(inputs) * ops_per_call
+    return {'ops_per_second': ops / elapsed, 'mean_us': elapsed / ops * 1e6}
+
+
+def measure_requests(send, inputs, repeat=REPEAT, ops_per_call=1):
+    """Like measure, but time every call to also report request latency percentiles."""
+    for item in inputs[:10]:
+        send(item)
+    latencies, passes = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            call_start = time.perf_counter()
+            send(item)
+            latencies.append(time.perf_counter() - call_start)
+        passes.append(time.perf_counter() - start)
+    return {
+        'ops_per_second': len(inputs) * ops_per_call / min(passes),
+        'p50_us': percentile_us(latencies, 50),
+        'p95_us': percentile_us(latencies, 95),
+    }
+
+
+def corpus_states(corpus):
+    from utils.state_builder import StateBuilder
+    return [
+        StateBuilder.build_state(p['cpu_usage'] * 100, p['memory_usage'], p['replicas'], p['latency'], p['rps'])
+        for p in corpus
+    ]
+
+
+def bench_build_state(corpus):
+    from utils.state_builder import StateBuilder
+    return measure(lambda p: StateBuilder.build_state(
+        p['cpu_usage'], p['memory_usage'], p['replicas'], p['latency'], p['rps']
+    ), corpus)
+
+
+def bench_build_states(corpus):
+    from utils.state_builder import StateBuilder
+    columns = {key: np.array([p[key] for p in corpus]) for key in corpus[0]}
+    return measure(lambda c: StateBuilder.build_states(
+        c['cpu_usage'], c['memory_usage'], c['replicas'], c['latency'], c['rps']
+    ), [columns] * 100, ops_per_call=len(corpus))
+
+
+def bench_calculate_reward(corpus):
+    from rl_model.config import SIMULATION_CONFIG, TRAINING_CONFIG
+    from rl_model.reward import RewardCalculator
+    annotations = SIMULATION_CONFIG['annotations']
+    max_replicas = TRAINING_CONFIG.get('max_replicas', 15)
+    return measure(lambda s: RewardCalculator.calculate_reward(s, annotations, max_replicas), corpus_states(corpus))
+
+
+def bench_calculate_rewards(corpus):
+    from rl_model.config import SIMULATION_CONFIG, TRAINING_CONFIG
+    from rl_model.reward import RewardCalculator
+    annotations = SIMULATION_CONFIG['annotations']
+    max_replicas = TRAINING_CONFIG.get('max_replicas', 15)
+    states = np.stack(corpus_states(corpus))
+    return measure(lambda s: RewardCalculator.calculate_rewards(s, annotations, max_replicas),
+                   [states] * 100, ops_per_call=len(states))
+
+
+def model_server_client():
+    """Flask test client of model-server/model_server.py serving the bundled model, without micro-batching."""
+    os.environ.setdefault('PREDICT_BATCH_WINDOW_MS', '0')
+    model_dir = os.path.join(REPO_ROOT, 'model-server')
+    if model_dir not in sys.path:
+        sys.path.insert(0, model_dir)
+    import model_server
+    return model_server.app.test_client()
+
+
+def bench_predict(corpus):
+    client = model_server_client()
+
+    def send(payload):
+        response = client.post('/predict', json=payload)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return measure_requests(send, corpus, repeat=3)
+
+
+def bench_predict_batch(corpus, batch_size=64):
+    client = model_server_client()
+    batches = [corpus[i:i + batch_size] for i in range(0, len(corpus) - batch_size + 1, batch_size)]
+
+    def send(batch):
+        response = client.post('/predict_batch', json=batch)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return measure_requests(send, batches * 10, repeat=3, ops_per_call=batch_size)
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    """Model server stand-in that answers every /predict with 'do nothing'."""
+    protocol_version = 'HTTP/1.1'
+    body = json.dumps({'action': 1}).encode()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+def bench_suggestion(corpus, deployments=20, requests_per_deployment=25, concurrency=32):
+    """Concurrent /suggestion requests; every request fetches metrics (the metrics cache is disabled)."""
+    from benchmarks.local_stack.fake_cluster import FakeCluster
+    # Slow clock: the benchmark measures serving cost, not simulated dynamics
+    cluster = FakeCluster(tick_seconds=3600)
+    names = [f'app-{i}' for i in range(deployments)]
+    for name in names:
+        cluster.add_deployment(name)
+    k8s_url, prometheus_url = cluster.start()
+    stub = ThreadingHTTPServer(('127.0.0.1', 0), StubModelHandler)
+    stub.daemon_threads = True
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    os.environ.update({
+        'KUBERNETES_API_URL': k8s_url,
+        'PROMETHEUS_URL': prometheus_url,
+        'RL_API_URL': f'http://127.0.0.1:{stub.server_address[1]}/predict',
+        'METRICS_CACHE_TTL_SECONDS': '0',
+    })
+    suggestion_dir = os.path.join(REPO_ROOT, 'suggestion-server')
+    if suggestion_dir not in sys.path:
+        sys.path.insert(0, suggestion_dir)
+    import suggestion_server
+    logging.getLogger().setLevel(logging.WARNING)
+
+    async def run():
+        async with suggestion_server.app.test_app() as test_app:
+            client = test_app.test_client()
+            latencies = []
+
+            async def send(name):
+                start = time.perf_counter()
+                response = await client.get('/suggestion', query_string={'deployment': name})
+                assert response.status_code == 200, await response.get_data(as_text=True)
+                latencies.append(time.perf_counter() - start)
+
+            # Warm up connection pools and the deployment informer
+            await asyncio.gather(*(send(name) for name in names))
+            latencies.clear()
+            queue = asyncio.Queue()
+            for _ in range(requests_per_deployment):
+                for name in names:
+                    queue.put_nowait(name)
+
+            async def worker():
+                while not queue.empty():
+                    await send(queue.get_nowait())
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            return {
+                'ops_per_second': len(latencies) / elapsed,
+                'p50_us': percentile_us(latencies, 50),
+                'p95_us': percentile_us(latencies, 95),
+            }
+
+    try:
+        return asyncio.run(run())
+    finally:
+        stub.shutdown()
+        stub.server_close()
+        cluster.stop()
+
+
+def bench_sim_env(corpus, steps=2000):
+    from rl_model.sim_env import SimulatedMicroserviceEnv
+    env = SimulatedMicroserviceEnv()
+    env.reset(seed=0)
+    actions = np.random.default_rng(0).choice(3, size=steps, p=[0.2, 0.6, 0.2])
+
+    def step(action):
+        _, _, terminated, truncated, _ = env.step(action)
+        if terminated or truncated:
+            env.reset()
+    return measure(step, list(actions))
+
+
+def bench_batch_env(corpus, num_envs=256, steps=100):
+    from rl_model.batch_env import BatchedSimulatedEnv
+    env = BatchedSimulatedEnv(num_envs=num_envs, seed=0)
+    env.reset()
+    rng = np.random.default_rng(0)
+    actions = [rng.choice(3, size=num_envs, p=[0.2, 0.6, 0.2]) for _ in range(steps)]
+    return measure(lambda a: env.step(a), actions, ops_per_call=num_envs)
+
+
+BENCHMARKS = {
+    'state_builder.build_state': bench_build_state,
+    'state_builder.build_states': bench_build_states,
+    'reward.calculate_reward': bench_calculate_reward,
+    'reward.calculate_rewards': bench_calculate_rewards,
+    'model_server.predict': bench_predict,
+    'model_server.predict_batch': bench_predict_batch,
+    'suggestion_server.suggestion': bench_suggestion,
+    'sim_env.step': bench_sim_env,
+    'batch_env.step': bench_batch_env,
+}
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run(names=None, corpus_path=CORPUS_PATH):
+    """
+    Run the selected benchmarks (all by default).
+    Returns:
+        Dict with the environment and the results of every benchmark.
+    """
+    corpus = load_corpus(corpus_path)
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if names and not any(name.startswith(selected) for selected in names):
+            continue
+        results[name] = bench(corpus)
+    return {'environment': environment(), 'benchmarks': results}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline.
+    Returns:
+        List of (name, current ops/s, baseline ops/s or None, ratio or None, regressed).
+    """
+    rows = []
+    for name, result in results['benchmarks'].items():
+        reference = baseline.get('benchmarks', {}).get(name)
+        if reference is None:
+            rows.append((name, result['ops_per_second'], None, None, False))
+            continue
+        ratio = result['ops_per_second'] / reference['ops_per_second']
+        rows.append((name, result['ops_per_second'], reference['ops_per_second'], ratio, ratio < 1 - tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scaling decision path against a stored baseline")
+    parser.add_argument("--only", help="Comma-separated benchmark names or prefixes, e.g. reward,sim_env")
+    parser.add_argument("--corpus", default=CORPUS_PATH, help="Payload corpus, one /predict JSON body per line")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative drop in ops/s before a benchmark counts as regressed")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--write-corpus", action="store_true", help="Regenerate the payload corpus and exit")
+    args = parser.parse_args()
+
+    if args.write_corpus:
+        write_corpus(args.corpus)
+        print(f"Wrote {args.corpus}")
+        return
+
+    results = run(args.only.split(',') if args.only else None, args.corpus)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != results['environment']:
+            print("Note: the baseline was recorded in a different environment; compare with care.")
+    rows = compare(results, baseline, args.tolerance)
+    print(f"{'benchmark':32} {'ops/s':>14} {'baseline':>14} {'change':>8}")
+    for name, current, reference, ratio, regressed in rows:
+        reference_text = f"{reference:14.1f}" if reference is not None else f"{'-':>14}"
+        change_text = f"{(ratio - 1) * 100:+7.1f}%" if ratio is not None else f"{'-':>8}"
+        print(f"{name:32} {current:14.1f} {reference_text} {change_text}{'  REGRESSION' if regressed else ''}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif any(row[4] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
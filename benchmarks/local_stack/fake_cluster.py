@@ -0,0 +1,437 @@
+"""
+In-process stand-ins for the Kubernetes API and the Prometheus HTTP API, backed
+by SimulatedMicroserviceEnv, so the autoscaler, suggestion server and model
+server can run unchanged on a dev box or in CI.
+
+Only what those components use is implemented:
+    Kubernetes: list/watch/get deployments and get/patch their /scale subresource (apps/v1)
+    Prometheus: instant and range queries (/api/v1/query, /api/v1/query_range) for the
+                CPU, memory, latency and RPS series
+"""
+import bisect
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from rl_model.sim_env import SimulatedMicroserviceEnv
+from utils.deployment_informer import matches, parse_label_selector
+from utils.prometheus_client import SAMPLE_TIME_LABEL
+
+DEPLOYMENT_PATH = re.compile(r'^/apis/apps/v1/namespaces/([^/]+)/deployments(?:/([^/]+))?(/scale)?/?$')
+# Number of watch events kept for resuming watches; older resource versions get 410 Gone
+EVENT_HISTORY = 10000
+# Number of ticks of metrics kept per deployment for range queries
+METRIC_HISTORY = 10000
+
+
+class FakeDeployment:
+    """A simulated deployment and the Kubernetes metadata exposed for it."""
+    def __init__(self, namespace, name, labels, annotations, env):
+        self.namespace = namespace
+        self.name = name
+        self.labels = labels
+        self.annotations = annotations
+        self.env = env
+        self.generation = 1
+        self.observed_generation = 1
+        self.resource_version = 0
+        self.metric_times = []  # wall-clock time of every tick
+        self.metric_history = []  # simulator metrics at each tick
+
+    def record_metrics(self):
+        self.metric_times.append(time.time())
+        self.metric_history.append(dict(self.env.metrics))
+        del self.metric_times[:-METRIC_HISTORY]
+        del self.metric_history[:-METRIC_HISTORY]
+
+    def to_dict(self):
+        ready = self.env._ready
+        return {
+            'apiVersion': 'apps/v1',
+            'kind': 'Deployment',
+            'metadata': {
+                'name': self.name,
+                'namespace': self.namespace,
+                'labels': self.labels,
+                'annotations': self.annotations,
+                'generation': self.generation,
+                'resourceVersion': str(self.resource_version),
+            },
+            'spec': {
+                'replicas': self.env._replicas,
+                'selector': {'matchLabels': {'app': self.name}},
+                'template': {
+                    'metadata': {'labels': {'app': self.name}},
+                    'spec': {'containers': [{'name': self.name, 'image': 'simulated'}]},
+                },
+            },
+            'status': {
+                'observedGeneration': self.observed_generation,
+                'replicas': self.env._replicas,
+                'updatedReplicas': self.env._replicas,
+                'readyReplicas': ready,
+                'availableReplicas': ready,
+            },
+        }
+
+    def scale_dict(self):
+        return {
+            'apiVersion': 'autoscaling/v1',
+            'kind': 'Scale',
+            'metadata': {
+                'name': self.name,
+                'namespace': self.namespace,
+                'resourceVersion': str(self.resource_version),
+            },
+            'spec': {'replicas': self.env._replicas},
+            'status': {'replicas': self.env._replicas, 'selector': f'app={self.name}'},
+        }
+
+
+class FakeCluster:
+    """
+    Simulated deployments served over a fake Kubernetes API and a fake Prometheus.
+    Every tick_seconds of wall-clock time, each deployment advances by one
+    simulated action interval, so time runs action_interval / tick_seconds
+    times faster than in a real cluster.
+    """
+    def __init__(self, tick_seconds=1.0, seed=0):
+        self.tick_seconds = tick_seconds
+        self.seed = seed
+        self.deployments = {}  # (namespace, name) -> FakeDeployment
+        self.resource_version = 0
+        self.events = []  # (resource version, namespace, event type, deployment dict)
+        self.changed = threading.Condition()
+        self.stats = {'k8s_requests': 0, 'prometheus_queries': 0, 'scale_patches': 0}
+        self._stopped = threading.Event()
+        self._servers = []
+
+    def add_deployment(self, name, namespace='default', labels=None, annotations=None, chaos_scenario=None):
+        env = SimulatedMicroserviceEnv(name, namespace, chaos_scenario=chaos_scenario)
+        env.reset(seed=self.seed + len(self.deployments))
+        deployment = FakeDeployment(
+            namespace, name,
+            {'app': name, 'maestro/autoscale': 'true', **(labels or {})},
+            {**env.annotations, **(annotations or {})},
+            env
+        )
+        with self.changed:
+            deployment.record_metrics()
+            self.deployments[(namespace, name)] = deployment
+            self._publish(deployment, 'ADDED')
+        return deployment
+
+    def _publish(self, deployment, event_type):
+        """Record a change of deployment; call with self.changed held."""
+        self.resource_version += 1
+        deployment.resource_version = self.resource_version
+        self.events.append((self.resource_version, deployment.namespace, event_type, deployment.to_dict()))
+        del self.events[:-EVENT_HISTORY]
+        self.changed.notify_all()
+
+    def scale(self, namespace, name, replicas):
+        with self.changed:
+            deployment = self.deployments[(namespace, name)]
+            self.stats['scale_patches'] += 1
+            if replicas != deployment.env._replicas:
+                deployment.env._scale_pods(int(replicas))
+                deployment.generation += 1
+                self._publish(deployment, 'MODIFIED')
+            return deployment
+
+    def tick(self):
+        """Advance every deployment by one action interval."""
+        with self.changed:
+            for deployment in self.deployments.values():
+                if deployment.env.chaos_engine is not None:
+                    deployment.env.chaos_engine.step()
+                deployment.env._state = deployment.env._with_features(deployment.env._simulate_interval())
+                deployment.observed_generation = deployment.generation
+                deployment.record_metrics()
+                self._publish(deployment, 'MODIFIED')
+
+    def find(self, namespace, name):
+        """The deployment called name (in any namespace if namespace is None), or None; call with self.changed held."""
+        if namespace is None:
+            return next((d for (ns, n), d in self.deployments.items() if n == name), None)
+        return self.deployments.get((namespace, name))
+
+    def metric(self, namespace, name, metric):
+        """Latest simulated value of one metric, or None for an unknown deployment."""
+        with self.changed:
+            deployment = self.find(namespace, name)
+            return None if deployment is None else deployment.env.metrics.get(metric)
+
+    def metric_time(self, namespace, name):
+        """Wall-clock time of the latest simulated sample, or None for an unknown deployment."""
+        with self.changed:
+            deployment = self.find(namespace, name)
+            return None if deployment is None or not deployment.metric_times else deployment.metric_times[-1]
+
+    def metric_range(self, namespace, name, metric, start, end, step):
+        """
+        Values of one metric every step seconds from start to end, as Prometheus
+        would evaluate them: the last tick at or before each time.
+        Returns:
+            List of (timestamp, value), or None for an unknown deployment.
+        """
+        with self.changed:
+            deployment = self.find(namespace, name)
+            if deployment is None:
+                return None
+            samples = []
+            t = start
+            while t <= end:
+                tick = bisect.bisect_right(deployment.metric_times, t) - 1
+                if tick >= 0 and metric in deployment.metric_history[tick]:
+                    samples.append((t, deployment.metric_history[tick][metric]))
+                t += step
+            return samples
+
+    def start(self, host='127.0.0.1', k8s_port=0, prometheus_port=0):
+        """
+        Serve both APIs and start the clock in background threads.
+        Returns:
+            Tuple of (Kubernetes API URL, Prometheus URL).
+        """
+        k8s_server = ThreadingHTTPServer((host, k8s_port), _handler(self, KubernetesHandler))
+        prometheus_server = ThreadingHTTPServer((host, prometheus_port), _handler(self, PrometheusHandler))
+        for server in (k8s_server, prometheus_server):
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self._servers.append(server)
+        threading.Thread(target=self._clock, name='fake-cluster-clock', daemon=True).start()
+        return (f'http://{host}:{k8s_server.server_address[1]}',
+                f'http://{host}:{prometheus_server.server_address[1]}')
+
+    def stop(self):
+        self._stopped.set()
+        with self.changed:
+            self.changed.notify_all()
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+
+    def _clock(self):
+        next_tick = time.monotonic() + self.tick_seconds
+        while not self._stopped.wait(max(next_tick - time.monotonic(), 0)):
+            self.tick()
+            next_tick += self.tick_seconds
+
+
+def _handler(cluster, base):
+    return type(base.__name__, (base,), {'cluster': cluster})
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    cluster = None
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_status(self, code, reason, message):
+        self.send_json(code, {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure',
+                              'reason': reason, 'message': message, 'code': code})
+
+
+class KubernetesHandler(_JSONHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def handle_one_request(self):
+        if self.cluster._stopped.is_set():
+            # Kept-alive connections outlive the listening socket; refuse them too
+            self.close_connection = True
+            self.raw_requestline = self.rfile.readline(65537)
+            if self.raw_requestline and self.parse_request():
+                self.send_status(503, 'ServiceUnavailable', 'The fake cluster was stopped')
+            return
+        super().handle_one_request()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        match = DEPLOYMENT_PATH.match(url.path)
+        if not match:
+            return self.send_status(404, 'NotFound', f'{url.path} is not served by the fake cluster')
+        namespace, name, scale = match.groups()
+        with self.cluster.changed:
+            self.cluster.stats['k8s_requests'] += 1
+        if name is None:
+            if params.get('watch', '').lower() in ('true', '1'):
+                return self.watch(namespace, params)
+            return self.list(namespace, params)
+        deployment = self.cluster.deployments.get((namespace, name))
+        if deployment is None:
+            return self.send_status(404, 'NotFound', f'deployments.apps "{name}" not found')
+        with self.cluster.changed:
+            body = deployment.scale_dict() if scale else deployment.to_dict()
+        self.send_json(200, body)
+
+    def do_PATCH(self):
+        match = DEPLOYMENT_PATH.match(urlparse(self.path).path)
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not match or not match.group(3):
+            return self.send_status(405, 'MethodNotAllowed', 'Only the /scale subresource can be patched')
+        namespace, name, _ = match.groups()
+        if (namespace, name) not in self.cluster.deployments:
+            return self.send_status(404, 'NotFound', f'deployments.apps "{name}" not found')
+        replicas = body.get('spec', {}).get('replicas')
+        if not isinstance(replicas, int) or replicas < 0:
+            return self.send_status(422, 'Invalid', 'spec.replicas must be a non-negative integer')
+        deployment = self.cluster.scale(namespace, name, replicas)
+        with self.cluster.changed:
+            body = deployment.scale_dict()
+        self.send_json(200, body)
+
+    def selected(self, namespace, params):
+        requirements = parse_label_selector(params.get('labelSelector'))
+        field = params.get('fieldSelector', '')
+        name = field[len('metadata.name='):] if field.startswith('metadata.name=') else None
+
+        def select(obj):
+            metadata = obj['metadata']
+            return (metadata['namespace'] == namespace and (name is None or metadata['name'] == name)
+                    and matches(metadata['labels'], requirements))
+        return select
+
+    def list(self, namespace, params):
+        select = self.selected(namespace, params)
+        with self.cluster.changed:
+            items = [d.to_dict() for d in self.cluster.deployments.values()]
+            resource_version = self.cluster.resource_version
+        self.send_json(200, {
+            'apiVersion': 'apps/v1',
+            'kind': 'DeploymentList',
+            'metadata': {'resourceVersion': str(resource_version)},
+            'items': [item for item in items if select(item)],
+        })
+
+    def watch(self, namespace, params):
+        select = self.selected(namespace, params)
+        deadline = time.monotonic() + float(params.get('timeoutSeconds', 300))
+        # Chunked, so the client receives every event as soon as it is written
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            self.stream_events(namespace, params, select, deadline)
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def stream_events(self, namespace, params, select, deadline):
+        cluster = self.cluster
+        with cluster.changed:
+            if params.get('resourceVersion'):
+                since = int(params['resourceVersion'])
+                if cluster.events and since < cluster.events[0][0] - 1:
+                    self.send_event({'type': 'ERROR', 'object': {
+                        'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'reason': 'Expired',
+                        'message': f'too old resource version: {since}', 'code': 410}})
+                    return
+                pending = [('event', event) for event in cluster.events if event[0] > since]
+            else:
+                since = cluster.resource_version
+                pending = [('added', d.to_dict()) for d in cluster.deployments.values()]
+        while True:
+            for kind, item in pending:
+                if kind == 'added':
+                    if select(item):
+                        self.send_event({'type': 'ADDED', 'object': item})
+                    continue
+                since, _, event_type, obj = item
+                if select(obj):
+                    self.send_event({'type': event_type, 'object': obj})
+            with cluster.changed:
+                while cluster.resource_version <= since and not cluster._stopped.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    cluster.changed.wait(remaining)
+                if cluster._stopped.is_set():
+                    return
+                pending = [('event', event) for event in cluster.events if event[0] > since]
+
+    def send_event(self, event):
+        line = json.dumps(event).encode() + b'\n'
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+        self.wfile.flush()
+
+
+class PrometheusHandler(_JSONHandler):
+    protocol_version = 'HTTP/1.1'
+    # Series used by the env and the suggestion server, and the simulator metric behind each
+    SERIES = (
+        ('container_cpu_usage_seconds_total', 'cpu_usage_percent'),
+        ('container_memory', 'memory_bytes'),
+        ('istio_request_duration_milliseconds_bucket', 'p95_latency_ms'),
+        ('istio_requests_total', 'rps'),
+        ('kube_deployment_spec_replicas', 'replicas'),
+    )
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.query(url.path, {key: values[-1] for key, values in parse_qs(url.query).items()})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if length:
+            params.update({key: values[-1] for key, values in parse_qs(self.rfile.read(length).decode()).items()})
+        self.query(url.path, params)
+
+    @staticmethod
+    def step_seconds(step):
+        """A query_range step, given in seconds or as a duration such as '15s' or '1m'."""
+        units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+        match = re.fullmatch(r'([\d.]+)(ms|s|m|h|d)?', step)
+        return float(match.group(1)) * units[match.group(2) or 's']
+
+    def query(self, path, params):
+        if path not in ('/api/v1/query', '/api/v1/query_range'):
+            return self.send_json(404, {'status': 'error', 'errorType': 'not_found', 'error': path})
+        with self.cluster.changed:
+            self.cluster.stats['prometheus_queries'] += 1
+        promql = params.get('query', '')
+        metric = next((metric for series, metric in self.SERIES if series in promql), None)
+        name = (re.search(r'pod=~"(.+?)-\.\*"', promql) or re.search(r'destination_workload="([^"]+)"', promql)
+                or re.search(r'deployment="([^"]+)"', promql))
+        namespace = re.search(r'namespace="([^"]+)"', promql)
+        # The cpu series is in cores; the env's query converts it to percent itself
+        scale = 0.01 if metric == 'cpu_usage_percent' and not re.search(r'\*\s*100\s*$', promql) else 1.0
+        if path == '/api/v1/query_range':
+            samples = None
+            if metric and name:
+                samples = self.cluster.metric_range(
+                    namespace.group(1) if namespace else None, name.group(1), metric,
+                    float(params['start']), float(params['end']), self.step_seconds(params['step'])
+                )
+            result = [{'metric': {}, 'values': [[t, str(value * scale)] for t, value in samples]}] if samples else []
+            return self.send_json(200, {'status': 'success', 'data': {'resultType': 'matrix', 'result': result}})
+        if metric and name and 'max(timestamp(' in promql:
+            # Staleness queries (see utils/prometheus_client.py) ask for the sample time of every named series
+            value = self.cluster.metric_time(namespace.group(1) if namespace else None, name.group(1))
+            result = []
+            if value is not None:
+                result = [{'metric': {SAMPLE_TIME_LABEL: query}, 'value': [time.time(), str(value)]}
+                          for query in re.findall(rf'"{SAMPLE_TIME_LABEL}", "([^"]+)"', promql)]
+            return self.send_json(200, {'status': 'success', 'data': {'resultType': 'vector', 'result': result}})
+        value = None
+        if metric and name:
+            value = self.cluster.metric(namespace.group(1) if namespace else None, name.group(1), metric)
+        result = []
+        if value is not None:
+            result = [{'metric': {}, 'value': [time.time(), str(value * scale)]}]
+        self.send_json(200, {'status': 'success', 'data': {'resultType': 'vector', 'result': result}})
@@ -0,0 +1,206 @@
+"""
+Run the full decision loop locally: autoscaler -> suggestion server -> model server,
+against the fake Kubernetes API and Prometheus of fake_cluster.py, and report
+end-to-end control-loop latency and throughput.
+
+    python -m benchmarks.local_stack.run_local_stack --deployments 50 --duration 60
+
+The suggestion and model servers run as subprocesses from their own
+directories, exactly as in their containers; the autoscaler runs in this
+process so each decision cycle can be timed.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import requests
+from prometheus_client import REGISTRY, generate_latest
+from prometheus_client.parser import text_string_to_metric_families
+from .fake_cluster import FakeCluster
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_service(command, cwd, env, verbose):
+    output = None if verbose else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=os.path.join(REPO_ROOT, cwd), env=env, stdout=output, stderr=output)
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def load_autoscaler():
+    """Import autoscaler/autoscaler.py (it is a script, not part of a package)."""
+    spec = importlib.util.spec_from_file_location('autoscaler_controller', os.path.join(REPO_ROOT, 'autoscaler', 'autoscaler.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile_ms(values, q):
+    return float(np.percentile(values, q) * 1000) if values else None
+
+
+def stage_summary(metrics_text):
+    """Count and mean duration of every stage in a /metrics payload (see utils/instrumentation.py)."""
+    totals = {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != 'maestro_stage_duration_seconds':
+            continue
+        for sample in family.samples:
+            if sample.name.endswith('_sum') or sample.name.endswith('_count'):
+                stage = totals.setdefault(sample.labels['stage'], {})
+                stage[sample.name.rsplit('_', 1)[1]] = sample.value
+    return {
+        name: {'count': int(stage.get('count', 0)),
+               'mean_ms': stage['sum'] / stage['count'] * 1000 if stage.get('count') else None}
+        for name, stage in sorted(totals.items())
+    }
+
+
+def run(deployments=10, duration=30.0, tick_seconds=1.0, poll_interval=1.0, seed=0,
+        model_dir=None, chaos_scenario=None, verbose=False):
+    """
+    Run the local stack for duration seconds.
+    Returns:
+        Dict of throughput and latency results.
+    """
+    cluster = FakeCluster(tick_seconds=tick_seconds, seed=seed)
+    for i in range(deployments):
+        cluster.add_deployment(f'app-{i}', annotations={'maestro/poll-interval': str(poll_interval)},
+                               chaos_scenario=chaos_scenario)
+    k8s_url, prometheus_url = cluster.start()
+    model_port, suggestion_port = free_port(), free_port()
+    env = {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get('PYTHONPATH')])),
+        'KUBERNETES_API_URL': k8s_url,
+        'PROMETHEUS_URL': prometheus_url,
+        'RL_API_URL': f'http://127.0.0.1:{model_port}/predict',
+        'METRICS_CACHE_TTL_SECONDS': str(tick_seconds),
+        'MODEL_DIR': model_dir or os.path.join(REPO_ROOT, 'model-server'),
+    }
+    controller = None
+    # Components print progress from background threads; keep it out of the results unless asked for
+    stdout = sys.stdout
+    if not verbose:
+        sys.stdout = open(os.devnull, 'w')
+    processes = [
+        start_service([sys.executable, '-m', 'flask', '--app', 'model_server', 'run',
+                       '--host', '127.0.0.1', '--port', str(model_port)], 'model-server', env, verbose),
+        start_service([sys.executable, '-m', 'hypercorn', '-b', f'127.0.0.1:{suggestion_port}',
+                       'suggestion_server:app'], 'suggestion-server', env, verbose),
+    ]
+    try:
+        wait_until_up(f'http://127.0.0.1:{model_port}/models', processes[0])
+        wait_until_up(f'http://127.0.0.1:{suggestion_port}/health', processes[1])
+
+        os.environ['KUBERNETES_API_URL'] = k8s_url
+        os.environ['SUGGESTION_SERVICE_URL'] = f'http://127.0.0.1:{suggestion_port}/suggestion'
+        autoscaler = load_autoscaler()
+        if not verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+        cycle_latencies, failures = [], []
+
+        class TimedController(autoscaler.AutoscalerController):
+            def get_scaling_suggestion(self, deployment):
+                action = super().get_scaling_suggestion(deployment)
+                if action is None:
+                    failures.append(deployment)
+                return action
+
+            def run_cycle(self, deployment):
+                start = time.perf_counter()
+                try:
+                    super().run_cycle(deployment)
+                finally:
+                    cycle_latencies.append(time.perf_counter() - start)
+
+        controller = TimedController(namespace='default')
+        threading.Thread(target=controller.run, name='autoscaler', daemon=True).start()
+        time.sleep(duration)
+        latencies = list(cycle_latencies)
+        stats = dict(cluster.stats)
+        stages = {
+            'autoscaler': stage_summary(generate_latest(REGISTRY).decode()),
+            'suggestion_server': stage_summary(requests.get(f'http://127.0.0.1:{suggestion_port}/metrics').text),
+            'model_server': stage_summary(requests.get(f'http://127.0.0.1:{model_port}/metrics').text),
+        }
+        return {
+            'deployments': deployments,
+            'duration_seconds': duration,
+            'cycles': len(latencies),
+            'cycles_per_second': len(latencies) / duration,
+            'failed_suggestions': len(failures),
+            'cycle_latency_ms': {
+                'p50': percentile_ms(latencies, 50),
+                'p95': percentile_ms(latencies, 95),
+                'p99': percentile_ms(latencies, 99),
+                'max': percentile_ms(latencies, 100),
+            },
+            'scale_patches': stats['scale_patches'],
+            'k8s_requests': stats['k8s_requests'],
+            'prometheus_queries': stats['prometheus_queries'],
+            'stages': stages,
+        }
+    finally:
+        # Cycles still in flight fail against the stopped servers; those errors are expected
+        logging.getLogger().setLevel(logging.CRITICAL)
+        if controller is not None:
+            controller.stop()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+        cluster.stop()
+        sys.stdout = stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the autoscaling loop against a simulated cluster")
+    parser.add_argument("--deployments", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run the loop")
+    parser.add_argument("--tick-seconds", type=float, default=1.0,
+                        help="Wall-clock seconds per simulated action interval")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between decisions per deployment")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model-dir", help="Directory with the models to serve (default: model-server/)")
+    parser.add_argument("--chaos-scenario", help="Chaos scenario applied to every simulated deployment")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show the logs of every component")
+    args = parser.parse_args()
+
+    results = run(args.deployments, args.duration, args.tick_seconds, args.poll_interval, args.seed,
+                  args.model_dir, args.chaos_scenario, args.verbose)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
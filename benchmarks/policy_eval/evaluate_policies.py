@@ -0,0 +1,290 @@
+"""
+Offline evaluation of scaling policies: candidate models and rule-based
+HPA-style baselines, run against recorded traces (rl_model.replay_env) and
+the simulator (rl_model.sim_env), every episode in its own worker process.
+
+    python -m benchmarks.policy_eval.evaluate_policies \\
+        Results/best_model/best_model.zip threshold target-tracking \\
+        --traces datasets/default/nginx --simulated --episodes 20 --output eval.json
+
+Policies:
+    path/to/model.zip   PPO model (rl_model/train.py)
+    path/to/model.npz   numpy export (rl_model/export.py)
+    threshold           scale up above --scale-up-utilization, down below --scale-down-utilization
+    target-tracking     HPA algorithm: desired = ceil(replicas * utilization / target)
+
+The baselines read CPU utilization relative to the pod's CPU request
+(--cpu-request-percent), as the HPA does, and move one replica per action
+like the agent. Traces are cut into consecutive episodes of max_steps
+actions covering the whole trace; simulated episodes use seeds seed, seed + 1, ...
+
+Episodes run their full length: a hard latency violation ends a training
+episode, but here it is counted and the policy keeps control, so every
+policy is scored over the same time. An action beyond the replica bounds
+does not advance the environment; it is counted as invalid (with its reward
+penalty) and the replicas are held for that interval instead, as the
+autoscaler does. Per policy and source the report has:
+    reward                 mean episode reward (RewardCalculator)
+    replica_hours          replicas held after each action, over all episodes
+    slo_violation_seconds  time with p95 latency above latencySoftConstraint
+    hard_violation_seconds time with p95 latency above latencyHardConstraint
+    scale_events           actions that changed the replica count
+    invalid_actions        actions beyond the replica bounds
+    decision_ms            p50/p95/p99 of the policy's per-decision inference time
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+SIMULATOR = 'simulator'
+
+# Policies and environments of the current worker process, loaded once per process
+_policies = {}
+_envs = {}
+
+
+class ThresholdPolicy:
+    """Step scaling on CPU utilization: up above scale_up, down below scale_down."""
+    def __init__(self, cpu_request_percent=25.0, scale_up=0.8, scale_down=0.4):
+        self.cpu_request_percent = cpu_request_percent
+        self.scale_up = scale_up
+        self.scale_down = scale_down
+
+    def predict(self, observation, deterministic=True):
+        x = np.asarray(observation, dtype=np.float64).reshape(-1, np.shape(observation)[-1])
+        utilization = x[:, 0] / np.maximum(x[:, 2], 1) / self.cpu_request_percent
+        actions = np.where(utilization > self.scale_up, 2, np.where(utilization < self.scale_down, 0, 1))
+        return (actions[0] if np.ndim(observation) == 1 else actions), None
+
+
+class TargetTrackingPolicy:
+    """
+    The HPA's algorithm on CPU utilization: desired replicas are
+    ceil(replicas * utilization / target), unchanged while the ratio is within
+    tolerance of 1, approached one replica per action.
+    """
+    def __init__(self, cpu_request_percent=25.0, target=0.6, tolerance=0.1):
+        self.cpu_request_percent = cpu_request_percent
+        self.target = target
+        self.tolerance = tolerance
+
+    def predict(self, observation, deterministic=True):
+        x = np.asarray(observation, dtype=np.float64).reshape(-1, np.shape(observation)[-1])
+        replicas = np.maximum(x[:, 2], 1)
+        ratio = x[:, 0] / replicas / self.cpu_request_percent / self.target
+        desired = np.where(np.abs(ratio - 1) <= self.tolerance, replicas, np.ceil(replicas * ratio))
+        actions = (np.sign(desired - replicas) + 1).astype(np.int64)
+        return (actions[0] if np.ndim(observation) == 1 else actions), None
+
+
+def load_policy(spec, baseline_config):
+    """A policy with a stable-baselines3 style predict() for a policy spec (see the module docstring)."""
+    if spec == 'threshold':
+        return ThresholdPolicy(baseline_config['cpu_request_percent'],
+                               baseline_config['scale_up_utilization'], baseline_config['scale_down_utilization'])
+    if spec == 'target-tracking':
+        return TargetTrackingPolicy(baseline_config['cpu_request_percent'],
+                                    baseline_config['target_utilization'], baseline_config['tolerance'])
+    if spec.endswith('.npz'):
+        from utils.numpy_policy import NumpyPolicy
+        return NumpyPolicy.load(spec)
+    if spec.endswith('.zip'):
+        import torch
+        from stable_baselines3 import PPO
+        # Every worker process runs one policy at a time; more threads only oversubscribe the cores
+        torch.set_num_threads(1)
+        return PPO.load(spec, device='cpu')
+    raise ValueError(f"Unknown policy {spec!r}: expected a .zip, a .npz, 'threshold' or 'target-tracking'")
+
+
+def make_env(source, chaos_scenario=None):
+    """The environment of a source: SIMULATOR or a trace directory."""
+    if source == SIMULATOR:
+        from rl_model.sim_env import SimulatedMicroserviceEnv
+        return SimulatedMicroserviceEnv(chaos_scenario=chaos_scenario)
+    from rl_model.replay_env import ReplayEnv
+    return ReplayEnv(source)
+
+
+def trace_episodes(trace_dir):
+    """Start times of consecutive episodes covering a whole trace; gaps in the trace are skipped."""
+    env = make_env(trace_dir)
+    timestamps = env.trace['timestamp']
+    span = env.max_steps * env.action_interval
+    starts = []
+    start = float(timestamps[0])
+    while start < timestamps[-1]:
+        starts.append(start)
+        start = float(timestamps[min(np.searchsorted(timestamps, start + span), len(timestamps) - 1)])
+    return starts
+
+
+def run_episode(policy_spec, source, episode, baseline_config, chaos_scenario=None):
+    """
+    Run one episode of a policy.
+    Args:
+        policy_spec: Policy spec, see load_policy.
+        source: SIMULATOR or a trace directory.
+        episode: Seed of a simulated episode, start time of a trace episode.
+        baseline_config: Parameters of the rule-based baselines.
+        chaos_scenario: Chaos scenario of the simulator, if any.
+    Returns:
+        Dict with the episode's metrics and decision times.
+    """
+    if policy_spec not in _policies:
+        _policies[policy_spec] = load_policy(policy_spec, baseline_config)
+    if source not in _envs:
+        _envs[source] = make_env(source, chaos_scenario)
+    policy, env = _policies[policy_spec], _envs[source]
+    if source == SIMULATOR:
+        state, _ = env.reset(seed=int(episode))
+    else:
+        state, _ = env.reset(options={'start_time': episode})
+    interval = env.action_interval
+    replicas = env._get_current_replicas()
+    total_reward = replica_seconds = slo_seconds = hard_seconds = 0.0
+    scale_events = invalid_actions = 0
+    decision_times = []
+    for step in range(env.max_steps):
+        start = time.perf_counter()
+        action, _ = policy.predict(state, deterministic=True)
+        decision_times.append(time.perf_counter() - start)
+        state, reward, _, truncated, info = env.step(int(action))
+        total_reward += float(reward)
+        if info.get('invalid_action'):
+            invalid_actions += 1
+            # Time stood still; hold the replicas so every step still covers one interval
+            state, reward, _, truncated, info = env.step(1)
+            total_reward += float(reward)
+        if info['current_replicas'] != replicas:
+            scale_events += 1
+        replicas = info['current_replicas']
+        annotations = env._get_annotations()
+        soft = float(annotations.get('latencySoftConstraint', -1))
+        hard = float(annotations.get('latencyHardConstraint', -1))
+        replica_seconds += replicas * interval
+        if soft != -1 and state[3] > soft:
+            slo_seconds += interval
+        if hard != -1 and state[3] > hard:
+            hard_seconds += interval
+        if truncated:
+            break
+    return {
+        'policy': policy_spec,
+        'source': source,
+        'episode': episode,
+        'steps': step + 1,
+        'reward': total_reward,
+        'replica_hours': replica_seconds / 3600,
+        'slo_violation_seconds': slo_seconds,
+        'hard_violation_seconds': hard_seconds,
+        'scale_events': scale_events,
+        'invalid_actions': invalid_actions,
+        'decision_times': decision_times,
+    }
+
+
+def summarize(episodes):
+    """Aggregate episode results per (policy, source)."""
+    groups = {}
+    for result in episodes:
+        groups.setdefault((result['policy'], result['source']), []).append(result)
+    summary = []
+    for (policy, source), results in groups.items():
+        decision_ms = np.concatenate([result['decision_times'] for result in results]) * 1000
+        summary.append({
+            'policy': policy,
+            'source': source,
+            'episodes': len(results),
+            'steps': sum(result['steps'] for result in results),
+            'reward': float(np.mean([result['reward'] for result in results])),
+            'replica_hours': sum(result['replica_hours'] for result in results),
+            'slo_violation_seconds': sum(result['slo_violation_seconds'] for result in results),
+            'hard_violation_seconds': sum(result['hard_violation_seconds'] for result in results),
+            'scale_events': sum(result['scale_events'] for result in results),
+            'invalid_actions': sum(result['invalid_actions'] for result in results),
+            'decision_ms': {
+                f'p{q}': float(np.percentile(decision_ms, q)) for q in (50, 95, 99)
+            },
+        })
+    return summary
+
+
+def evaluate(policies, sources, episodes=10, seed=0, workers=None, baseline_config=None, chaos_scenario=None):
+    """
+    Evaluate every policy on every source.
+    Args:
+        policies: Policy specs, see load_policy.
+        sources: SIMULATOR and/or trace directories.
+        episodes: Number of simulated episodes per policy.
+        seed: Seed of the first simulated episode.
+        workers: Worker processes, all cores by default; 1 runs in this process.
+        baseline_config: Parameters of the rule-based baselines.
+        chaos_scenario: Chaos scenario of the simulator, if any.
+    Returns:
+        Tuple of (summary, per-episode results without decision times).
+    """
+    jobs = []
+    for source in sources:
+        starts = range(seed, seed + episodes) if source == SIMULATOR else trace_episodes(source)
+        jobs.extend((policy, source, start) for policy in policies for start in starts)
+    workers = workers or os.cpu_count() or 1
+    print(f"Running {len(jobs)} episodes of {len(policies)} policies on {len(sources)} sources with {workers} workers")
+    if workers == 1:
+        results = [run_episode(*job, baseline_config, chaos_scenario) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_episode, *job, baseline_config, chaos_scenario) for job in jobs]
+            results = [future.result() for future in futures]
+    summary = summarize(results)
+    for result in results:
+        del result['decision_times']
+    return summary, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare scaling policies on recorded traces and the simulator")
+    parser.add_argument("policies", nargs="+", help="Model .zip/.npz files, 'threshold' or 'target-tracking'")
+    parser.add_argument("--traces", nargs="*", default=[], help="Trace or dataset directories to replay")
+    parser.add_argument("--simulated", action="store_true", help="Also evaluate on the simulator")
+    parser.add_argument("--episodes", type=int, default=10, help="Simulated episodes per policy")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first simulated episode")
+    parser.add_argument("--chaos-scenario", help="Chaos scenario of the simulator (benchmarks/chaos_mesh/scenarios)")
+    parser.add_argument("--workers", type=int, help="Worker processes, defaults to the number of cores")
+    parser.add_argument("--cpu-request-percent", type=float, default=25.0,
+                        help="CPU request of one pod in percent of a core, for the baselines' utilization")
+    parser.add_argument("--scale-up-utilization", type=float, default=0.8)
+    parser.add_argument("--scale-down-utilization", type=float, default=0.4)
+    parser.add_argument("--target-utilization", type=float, default=0.6)
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Target-tracking tolerance, as the HPA's")
+    parser.add_argument("--output", help="Write the summary and per-episode results to this JSON file")
+    args = parser.parse_args()
+
+    sources = list(args.traces) + ([SIMULATOR] if args.simulated or not args.traces else [])
+    baseline_config = {
+        'cpu_request_percent': args.cpu_request_percent,
+        'scale_up_utilization': args.scale_up_utilization,
+        'scale_down_utilization': args.scale_down_utilization,
+        'target_utilization': args.target_utilization,
+        'tolerance': args.tolerance,
+    }
+    start = time.perf_counter()
+    summary, episodes = evaluate(args.policies, sources, args.episodes, args.seed, args.workers,
+                                 baseline_config, args.chaos_scenario)
+    print(f"Evaluated in {time.perf_counter() - start:.1f}s")
+    print(f"{'policy':28} {'source':20} {'reward':>8} {'replica-h':>10} {'SLO viol s':>11} "
+          f"{'hard viol s':>11} {'scales':>7} {'p95 ms':>7}")
+    for row in summary:
+        print(f"{os.path.basename(row['policy'])[:28]:28} {os.path.basename(row['source'].rstrip('/'))[:20]:20} "
+              f"{row['reward']:8.2f} {row['replica_hours']:10.2f} {row['slo_violation_seconds']:11.0f} "
+              f"{row['hard_violation_seconds']:11.0f} {row['scale_events']:7d} {row['decision_ms']['p95']:7.3f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'summary': summary, 'episodes': episodes, 'baselines': baseline_config}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
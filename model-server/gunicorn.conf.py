@@ -0,0 +1,7 @@
+# Gunicorn settings of the model server (see model.dockerfile)
+from utils.instrumentation import mark_worker_dead
+
+
+def child_exit(server, worker):
+    """Remove the live gauges of a worker that exited (see utils/instrumentation.py)."""
+    mark_worker_dead(worker.pid)
@@ -0,0 +1,68 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Groups observations submitted concurrently from request threads into a
+    single batched call of predict_fn(model, observations) per model.
+    A background thread takes the first waiting observation, collects more for
+    up to window_ms (or until max_batch_size is reached) and runs one forward
+    pass for each model present in the batch.
+    """
+    def __init__(self, predict_fn, max_batch_size=256, window_ms=2.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def predict(self, model, observation, timeout=None):
+        """Predict the action of model for one observation, batched with concurrent callers."""
+        return self.submit(model, observation).result(timeout)
+
+    def submit(self, model, observation):
+        """Queue one observation for model and return a Future of its action."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((model, observation, future))
+        return future
+
+    def _ensure_started(self):
+        # Started lazily so the thread belongs to the serving (post-fork) process
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            by_model = {}
+            for model, observation, future in batch:
+                by_model.setdefault(id(model), (model, [], []))
+                by_model[id(model)][1].append(observation)
+                by_model[id(model)][2].append(future)
+            for model, observations, futures in by_model.values():
+                self._predict(model, observations, futures)
+
+    def _predict(self, model, observations, futures):
+        try:
+            actions = self.predict_fn(model, np.stack(observations))
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, action in zip(futures, actions):
+            future.set_result(action)
@@ -0,0 +1,107 @@
+import os
+import glob
+import threading
+import time
+from utils.numpy_policy import NumpyPolicy
+
+# Artifact types in order of preference when a name exists in several formats
+MODEL_EXTENSIONS = ('.npz', '.zip')
+
+
+def load_model(path):
+    """
+    Load a numpy export (.npz) or a stable-baselines3 PPO model (.zip).
+    Raises:
+        ImportError: If path is a .zip and stable-baselines3 is not installed,
+            as in the model server image.
+    """
+    if path.endswith('.npz'):
+        return NumpyPolicy.load(path)
+    # Only needed for .zip artifacts, which pull in torch
+    try:
+        from stable_baselines3 import PPO
+    except ImportError:
+        raise ImportError(
+            f"{path} is a PPO .zip but stable-baselines3 is not installed; "
+            f"export it with 'python -m rl_model.export {path} <name>.npz' and serve the .npz"
+        ) from None
+    return PPO.load(path, device='cpu')
+
+
+class ModelRegistry:
+    """
+    Serves every model artifact found in a directory, by file name without extension.
+    A background thread polls the directory (a plain directory or a ConfigMap
+    mount) and loads new or changed artifacts off the request path; the set of
+    models is then replaced in one assignment, so requests never wait on a load
+    and in-flight requests keep the model object they already resolved.
+    """
+    def __init__(self, directory, default_model='best_model', poll_interval=10):
+        self.directory = directory
+        self.default_model = default_model
+        self.poll_interval = poll_interval
+        self._models = {}  # name -> (signature, model)
+        self._failed = {}  # name -> signature of the artifact that could not be loaded
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get(self, name=None):
+        """Return the model registered under name (the default model if None), or None."""
+        self._ensure_started()
+        entry = self._models.get(name or self.default_model)
+        return entry[1] if entry else None
+
+    def names(self):
+        return sorted(self._models)
+
+    def refresh(self):
+        """Load new or changed artifacts and drop deleted ones."""
+        current = self._models
+        models = {}
+        for path in self._scan():
+            name = os.path.splitext(os.path.basename(path))[0]
+            stat = os.stat(path)
+            signature = (path, stat.st_mtime_ns, stat.st_size)
+            if name in current and current[name][0] == signature:
+                models[name] = current[name]
+                continue
+            if self._failed.get(name) == signature:
+                # Reported already; retried once the file changes
+                if name in current:
+                    models[name] = current[name]
+                continue
+            try:
+                models[name] = (signature, load_model(path))
+                self._failed.pop(name, None)
+                print(f"Loaded model '{name}' from {path}")
+            except Exception as e:
+                self._failed[name] = signature
+                print(f"Could not load model '{name}' from {path}: {e}")
+                if name in current:
+                    models[name] = current[name]
+        for name in current.keys() - models.keys():
+            print(f"Unloaded model '{name}'")
+        self._models = models
+
+    def _scan(self):
+        """Artifact paths in the directory, one per model name."""
+        paths = {}
+        for extension in reversed(MODEL_EXTENSIONS):
+            for path in glob.glob(os.path.join(self.directory, f'*{extension}')):
+                paths[os.path.splitext(os.path.basename(path))[0]] = path
+        return paths.values()
+
+    def _ensure_started(self):
+        # Started lazily so the thread belongs to the serving (post-fork) process
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._watch, name='model-registry', daemon=True)
+                self._thread.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Model registry refresh failed: {e}")
@@ -1,28 +1,117 @@
+import os
+import json
+import numpy as np
 from flask import Flask, request, jsonify
-from stable_baselines3 import PPO
 from utils.state_builder import StateBuilder
+from utils.observation_features import feature_groups
+from utils.instrumentation import TRACE_HEADER, DECISIONS, ERRORS, metrics_payload, start_trace, timed
+from micro_batcher import MicroBatcher
+from model_registry import ModelRegistry
 from pathlib import Path
 
 app = Flask(__name__)
 
-# Load the model once when the application starts.
-try:
-    script_dir = Path(__file__).parent
-    model_path = script_dir / "best_model"
-    model = PPO.load(str(model_path))
+# Concurrent /predict calls arriving within this window share one forward pass (0 disables batching)
+PREDICT_BATCH_WINDOW_MS = float(os.getenv('PREDICT_BATCH_WINDOW_MS', 2))
+PREDICT_MAX_BATCH_SIZE = int(os.getenv('PREDICT_MAX_BATCH_SIZE', 256))
+# Directory (or ConfigMap mount) holding the model artifacts, one model per file name
+MODEL_DIR = os.getenv('MODEL_DIR', str(Path(__file__).parent))
+# Model used when a request does not name one
+DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'best_model')
+# How often MODEL_DIR is checked for new or changed models
+MODEL_POLL_INTERVAL_SECONDS = float(os.getenv('MODEL_POLL_INTERVAL_SECONDS', 10))
+
+# Load the models once when the application starts; later changes are picked up in the background.
+# Numpy exports (see rl_model/export.py) are preferred over PPO .zip files of the same name;
+# they predict the same actions without importing torch or stable-baselines3.
+registry = ModelRegistry(MODEL_DIR, DEFAULT_MODEL, MODEL_POLL_INTERVAL_SECONDS)
+registry.refresh()
+if registry.get() is None:
+    print(f"FATAL: Could not load model '{DEFAULT_MODEL}' from {MODEL_DIR}")
+else:
     print("Model loaded successfully.")
-except Exception as e:
-    print(f"FATAL: Could not load model. Error: {e}")
-    model = None
+
+
+def predict_batch(model, observations):
+    """Predict actions of model for a batch of observations of shape (n, 5)."""
+    with timed('inference'):
+        actions, _ = model.predict(observations, deterministic=True)
+    return actions
+
+
+batcher = MicroBatcher(predict_batch, PREDICT_MAX_BATCH_SIZE, PREDICT_BATCH_WINDOW_MS)
+
+
+def requested_model():
+    """Resolve the ?model= query parameter to a loaded model, or an error response."""
+    name = request.args.get('model')
+    model = registry.get(name)
+    if model is None:
+        ERRORS.labels('model_lookup').inc()
+        if name:
+            return None, (jsonify({"error": f"Unknown model '{name}'"}), 404)
+        return None, (jsonify({"error": "Model is not loaded on the server"}), 500)
+    return model, None
+
+
+def observation_dim(model):
+    """Length of the observations a model takes: 5 for a state snapshot, more with extra features."""
+    if hasattr(model, 'observation_dim'):
+        return model.observation_dim
+    return model.observation_space.shape[0]
+
+
+def with_features(model, observations, items):
+    """
+    Append the extra features the model was trained with ('history', 'forecast';
+    see utils/observation_features.py) from the request items to their observations.
+    Raises:
+        ValueError: If the model needs features an item does not carry.
+    """
+    parts = [observations]
+    for field, names in feature_groups(observation_dim(model) - observations.shape[-1]):
+        values = [item.get(field) for item in items]
+        if any(not isinstance(features, list) or len(features) != len(names) for features in values):
+            raise ValueError(f"Model expects {len(names)} '{field}' features per observation: {', '.join(names)}")
+        parts.append(np.asarray(values, dtype=np.float32).reshape(observations.shape[:-1] + (len(names),)))
+    return np.concatenate(parts, axis=-1)
+
+
+# Fields of a /predict payload that make up the state vector; all must be numbers
+STATE_FIELDS = ('cpu_usage', 'memory_usage', 'replicas', 'latency', 'rps')
+
+
+def invalid_state_field(item):
+    """A message naming the first missing or non-numeric state field of a /predict payload, or None."""
+    if not isinstance(item, dict):
+        return "is not a JSON object"
+    for field in STATE_FIELDS:
+        if field not in item:
+            return f"is missing key '{field}'"
+        value = item[field]
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"has a non-numeric '{field}': {json.dumps(value)}"
+    return None
+
+
+def bad_request(message):
+    ERRORS.labels('predict_request').inc()
+    return jsonify({"error": message}), 400
+
 
 @app.route('/predict', methods=['POST'])
 def predict_action():
-    if model is None:
-        return jsonify({"error": "Model is not loaded on the server"}), 500
+    trace_id = start_trace(request.headers.get(TRACE_HEADER))
+    model, error = requested_model()
+    if error:
+        return error
 
     data = request.get_json()
     if not data:
-        return jsonify({"error": "Request body must be JSON"}), 400
+        return bad_request("Request body must be JSON")
+    error = invalid_state_field(data)
+    if error:
+        return bad_request(f"Request body {error}")
 
     try:
         # Construct the observation array from the received JSON
@@ -33,14 +122,70 @@ def predict_action():
             p95_latency_ms=data['latency'],
             rps=data['rps']
         )
-    except KeyError as e:
-        return jsonify({"error": f"Missing key in request: {e}"}), 400
+        observation = with_features(model, observation, [data])
+    except ValueError as e:
+        return bad_request(str(e))
 
     # Use the loaded model to predict the action
-    action, _ = model.predict(observation, deterministic=True)
-    
-    return jsonify({"action": int(action)})
+    with timed('prediction'):
+        if PREDICT_BATCH_WINDOW_MS > 0:
+            action = batcher.predict(model, observation)
+        else:
+            with timed('inference'):
+                action, _ = model.predict(observation, deterministic=True)
+    DECISIONS.labels(int(action)).inc()
+
+    return jsonify({"action": int(action)}), 200, {TRACE_HEADER: trace_id}
+
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_actions():
+    """Predict actions for many deployments at once; the body is a JSON list of /predict payloads."""
+    trace_id = start_trace(request.headers.get(TRACE_HEADER))
+    model, error = requested_model()
+    if error:
+        return error
+
+    data = request.get_json()
+    if not isinstance(data, list):
+        return bad_request("Request body must be a JSON list")
+    if not data:
+        return jsonify({"actions": []})
+    for i, item in enumerate(data):
+        error = invalid_state_field(item)
+        if error:
+            return bad_request(f"List item {i} {error}")
+
+    try:
+        observations = StateBuilder.build_states(
+            cpu_usage_percent=[item['cpu_usage'] for item in data],
+            memory_bytes=[item['memory_usage'] for item in data],
+            n_replicas=[item['replicas'] for item in data],
+            p95_latency_ms=[item['latency'] for item in data],
+            rps=[item['rps'] for item in data]
+        )
+        observations = with_features(model, observations, data)
+    except ValueError as e:
+        return bad_request(str(e))
+
+    actions = [int(action) for action in predict_batch(model, observations)]
+    for action in actions:
+        DECISIONS.labels(action).inc()
+    return jsonify({"actions": actions}), 200, {TRACE_HEADER: trace_id}
+
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    return jsonify({"models": registry.names(), "default": DEFAULT_MODEL})
+
+
+# Prometheus metrics of this service (all gunicorn workers when PROMETHEUS_MULTIPROC_DIR is set)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = metrics_payload(request.headers.get('Accept'))
+    return body, 200, {'Content-Type': content_type}
+
 
 if __name__ == '__main__':
     # This block is for local testing. In production, Gunicorn runs the app.
-    app.run(host='0.0.0.0', port=8000)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=8000, threaded=True)
@@ -35,4 +35,8 @@ kubectl label namespace default istio-injection=enabled
 Write-Host "Applying Istio-Prometheus integration..."
 kubectl apply -f ./monitoring/istio-prometheus-operator.yaml
 
+# Autoscaler, suggestion server and model server metrics
+Write-Host "Applying MAESTRO services PodMonitor..."
+kubectl apply -f ./monitoring/maestro-podmonitor.yaml
+
 Write-Host "Monitoring installation complete!" 
\ No newline at end of file
@@ -21,4 +21,7 @@ helm install istio-ingressgateway istio/gateway -n istio-system
 kubectl label namespace default istio-injection=enabled
 
 # Istio - Prometeus integration
-kubectl apply -f ./monitoring/istio-prometheus-operator.yaml
\ No newline at end of file
+kubectl apply -f ./monitoring/istio-prometheus-operator.yaml
+
+# Autoscaler, suggestion server and model server metrics
+kubectl apply -f ./monitoring/maestro-podmonitor.yaml
\ No newline at end of file
@@ -0,0 +1,191 @@
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import VecEnv
+from .reward import RewardCalculator
+from .sim_env import load_profile_knots, users_at, p95_latency_ms, warmup_weights
+from utils.state_builder import StateBuilder
+from utils.observation_features import ObservationFeatures
+from .config import TRAINING_CONFIG, SIMULATION_CONFIG
+
+
+class BatchedSimulatedEnv(VecEnv):
+    """
+    Steps num_envs simulated deployments at once as numpy arrays.
+    Follows the same dynamics as SimulatedMicroserviceEnv, but every quantity
+    (replicas, load, latency, reward, ...) has shape (num_envs,), so a single
+    process can feed PPO without per-environment Python overhead.
+    Finished environments are reset automatically, as with any SB3 VecEnv.
+    """
+    def __init__(self, num_envs=1024, seed=None):
+        self.render_mode = None
+        self.max_replicas = TRAINING_CONFIG.get('max_replicas', 15)
+        # Action space: 0=down, 1=nothing, 2=up
+        action_space = spaces.Discrete(3)
+        # Observation space: [cpu, mem, replicas, latency, rps]
+        observation_space = spaces.Box(
+            low=np.array([0, 0, 1, 0, -100], dtype=np.float32),
+            high=np.array([500, 1, self.max_replicas, 5000, 100], dtype=np.float32),
+            shape=(5,),
+            dtype=np.float32
+        )
+        # Observed RPS is clipped to the bound, as in SimulatedMicroserviceEnv
+        self.max_observed_rps = float(observation_space.high[4])
+        # Optionally followed by RPS/latency trend and forecast features (utils/observation_features.py)
+        self.features = ObservationFeatures.from_config(TRAINING_CONFIG, n=num_envs)
+        if self.features is not None:
+            observation_space = self.features.observation_space(observation_space)
+        super().__init__(num_envs, observation_space, action_space)
+        self.sim_config = SIMULATION_CONFIG
+        self.action_interval = TRAINING_CONFIG.get('action_interval', 30)
+        self.max_memory_per_pod = TRAINING_CONFIG.get('max_memory_per_pod', 512 * 1024 * 1024)
+        self.annotations = dict(self.sim_config['annotations'])
+        self.max_steps = 200
+        self._knots = load_profile_knots(self.sim_config['load_stages'])
+        self._warmup = warmup_weights(self.action_interval, self.sim_config)
+        self._rng = np.random.default_rng(seed)
+        self._actions = np.ones(num_envs, dtype=np.int64)
+        # Simulation state, one entry (or row) per environment
+        self._time = np.zeros(num_envs)
+        self._peak_scale = np.ones(num_envs)
+        self._replicas = np.ones(num_envs, dtype=np.int64)
+        self._ready = np.ones(num_envs, dtype=np.int64)
+        self._starting = np.zeros((num_envs, len(self._warmup)), dtype=np.int64)
+        self._backlog = np.zeros(num_envs)
+        self._step_count = np.zeros(num_envs, dtype=np.int64)
+        self._state = np.zeros((num_envs,) + observation_space.shape, dtype=np.float32)
+
+    def reset(self):
+        """Reset every environment and return the batch of initial states."""
+        if self._seeds[0] is not None:
+            self._rng = np.random.default_rng(self._seeds[0])
+        self._reset_seeds()
+        self._reset_envs(np.ones(self.num_envs, dtype=bool))
+        return self._state.copy()
+
+    def step_async(self, actions):
+        self._actions = np.asarray(actions, dtype=np.int64).reshape(self.num_envs)
+
+    def step_wait(self):
+        state = self._state
+        replica_change = self._actions - 1
+        target = self._replicas + replica_change
+        invalid = (replica_change != 0) & ((target < 1) | (target > self.max_replicas))
+        self._scale_pods(np.where(invalid, self._replicas, target))
+        # Invalid actions leave the deployment untouched and end the episode:
+        # their simulations, load clocks and features do not advance
+        new_state = state.copy()
+        valid = np.flatnonzero(~invalid)
+        if len(valid):
+            new_state[valid] = self._with_features(self._simulate_interval(valid), valid)
+        rewards, terminated = RewardCalculator.calculate_rewards(new_state, self.annotations, self.max_replicas)
+        rewards[invalid] = -1.0
+        terminated |= invalid
+        self._state = new_state
+        self._step_count += 1
+        truncated = (self._step_count >= self.max_steps) & ~terminated
+        dones = terminated | truncated
+        infos = [{'current_replicas': int(replicas)} for replicas in self._replicas]
+        if dones.any():
+            for i in np.flatnonzero(dones):
+                infos[i]['terminal_observation'] = new_state[i].copy()
+                infos[i]['TimeLimit.truncated'] = bool(truncated[i])
+                if invalid[i]:
+                    infos[i]['invalid_action'] = True
+            self._reset_envs(dones)
+        return self._state.copy(), rewards, dones, infos
+
+    def _reset_envs(self, mask: np.ndarray):
+        """Reset the environments selected by mask to a random point of the load profile."""
+        n = int(mask.sum())
+        initial_replicas = self.sim_config.get('initial_replicas')
+        if initial_replicas is None:
+            replicas = self._rng.integers(1, max(self.max_replicas // 2, 1) + 1, size=n)
+        else:
+            replicas = np.full(n, int(initial_replicas))
+        self._replicas[mask] = replicas
+        self._ready[mask] = replicas
+        self._starting[mask] = 0
+        self._backlog[mask] = 0.0
+        self._step_count[mask] = 0
+        self._time[mask] = self._rng.uniform(0, self._knots[0][-1], size=n)
+        self._peak_scale[mask] = self._rng.uniform(*self.sim_config['peak_scale_range'], size=n)
+        # Observe the first interval with all pods ready
+        idx = np.flatnonzero(mask)
+        if self.features is not None:
+            self.features.reset(idx)
+        self._state[mask] = self._with_features(self._simulate_interval(idx), idx)
+
+    def _scale_pods(self, target: np.ndarray):
+        """Start new pods, or stop the youngest pods first when scaling down (at most one per step)."""
+        up = target > self._replicas
+        self._starting[up, 0] += target[up] - self._replicas[up]
+        down = np.flatnonzero(target < self._replicas)
+        if len(down):
+            starting = self._starting[down] > 0
+            has_starting = starting.any(axis=1)
+            youngest = np.argmax(starting, axis=1)
+            self._starting[down[has_starting], youngest[has_starting]] -= 1
+            self._ready[down[~has_starting]] -= 1
+        self._replicas = target.astype(np.int64)
+
+    def _with_features(self, states: np.ndarray, idx=None) -> np.ndarray:
+        """Append the enabled observation features to the states of the environments in idx (all by default)."""
+        return states if self.features is None else self.features.update(states, idx)
+
+    def _simulate_interval(self, idx=slice(None)) -> np.ndarray:
+        """
+        Advance the simulations selected by idx (all by default) by one action
+        interval and build the batch of observations Prometheus would report at its end.
+        """
+        cfg = self.sim_config
+        self._time[idx] += self.action_interval
+        replicas = self._replicas[idx]
+        starting = self._starting[idx]
+        n = len(replicas)
+        users = users_at(self._time[idx], *self._knots) * self._peak_scale[idx] + cfg['baseline_users']
+        offered = users * cfg['rps_per_user'] * self._rng.lognormal(0.0, cfg['rps_noise'], size=n)
+        serving = self._ready[idx] + starting @ self._warmup
+        capacity = serving * cfg['pod_capacity_rps']
+        served = np.minimum(offered + self._backlog[idx] / self.action_interval, capacity)
+        # k6 users are closed-loop, so each has at most one request waiting
+        backlog = np.clip(self._backlog[idx] + (offered - served) * self.action_interval, 0.0, users)
+        self._backlog[idx] = backlog
+        latency = p95_latency_ms(offered, serving, backlog, cfg)
+        latency = np.minimum(latency * self._rng.lognormal(0.0, cfg['latency_noise'], size=n), cfg['max_latency_ms'])
+        # Age starting pods; the oldest slot becomes ready
+        self._ready[idx] += starting[:, -1]
+        self._starting[idx] = np.concatenate([np.zeros((n, 1), dtype=np.int64), starting[:, :-1]], axis=1)
+        cpu = replicas * cfg['idle_cpu_percent'] + served * cfg['cpu_percent_per_rps']
+        memory = (replicas * cfg['pod_base_memory'] + served * cfg['memory_per_rps'] +
+                  backlog * cfg['memory_per_queued_request'])
+        return StateBuilder.build_states(
+            cpu,
+            memory,
+            replicas,
+            latency,
+            np.minimum(served, self.max_observed_rps),
+            self.max_memory_per_pod
+        )
+
+    def _get_current_replicas(self) -> np.ndarray:
+        """Get the current number of replicas of every simulated deployment."""
+        return self._replicas.copy()
+
+    def close(self):
+        pass
+
+    def get_attr(self, attr_name, indices=None):
+        value = getattr(self, attr_name)
+        return [value for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        if method_name == '_get_current_replicas':
+            return [int(self._replicas[i]) for i in self._get_indices(indices)]
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        return [result for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [False for _ in self._get_indices(indices)]
@@ -0,0 +1,180 @@
+"""Build an offline dataset of one deployment from Prometheus range queries, for ReplayEnv"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from utils.prometheus_client import PrometheusClient
+from utils.trace_recorder import TRACE_COLUMNS, DATASET_METADATA, trace_directory
+
+# Prometheus rejects range queries of more than 11000 points per series
+MAX_POINTS = 10000
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_duration(text):
+    """Seconds in a duration such as '90', '15s', '12h' or '4w'."""
+    text = text.strip()
+    if text[-1:] in DURATION_UNITS:
+        return int(float(text[:-1]) * DURATION_UNITS[text[-1]])
+    return int(float(text))
+
+
+def dataset_queries(namespace, deployment):
+    """PromQL query of every metric column, matching the live environment's queries."""
+    return {
+        'cpu_usage_percent': f'sum(rate(container_cpu_usage_seconds_total{{namespace="{namespace}", pod=~"{deployment}-.*"}}[1m])) * 100',
+        'memory_bytes': f'sum(container_memory_working_set_bytes{{namespace="{namespace}", pod=~"{deployment}-.*"}})',
+        'replicas': f'sum(kube_deployment_spec_replicas{{namespace="{namespace}", deployment="{deployment}"}})',
+        'p95_latency_ms': f'histogram_quantile(0.95, sum(rate(istio_request_duration_milliseconds_bucket{{reporter="destination", destination_workload="{deployment}"}}[5m])) by (le))',
+        'rps': f'sum(rate(istio_requests_total{{reporter="destination", destination_workload="{deployment}"}}[1m]))',
+    }
+
+
+def build_dataset(prom_client, namespace, deployment, start, end, step, output,
+                  workers=8, max_points=MAX_POINTS, retries=3, latency_soft=-1, latency_hard=-1):
+    """
+    Fetch the metrics of a deployment between start and end onto a grid of one
+    row every step seconds and write them as one .npy file per TRACE_COLUMNS entry.
+    The range is split into chunks of max_points rows per metric, fetched in
+    parallel; every chunk is written straight into memory-mapped columns, so
+    memory use is bounded by workers chunks whatever the duration. Rows a
+    series has no sample for are NaN. The metadata file is written last, so
+    an interrupted build is never mistaken for a complete one.
+    Args:
+        prom_client: PrometheusClient to query.
+        namespace: Namespace of the deployment.
+        deployment: Name of the deployment.
+        start: Unix time of the first row (rounded down to the step).
+        end: Unix time of the last row.
+        step: Whole seconds between rows.
+        output: Destination directory.
+        workers: Number of range queries in flight.
+        max_points: Rows per range query.
+        retries: Attempts per range query before giving up.
+        latency_soft: Soft latency constraint stored with every row, -1 for the simulator's default.
+        latency_hard: Hard latency constraint stored with every row, -1 for the simulator's default.
+    Returns:
+        Dict with the metadata written next to the columns.
+    Raises:
+        ValueError: If no row has a replica count, since such a dataset cannot be replayed.
+    """
+    step = int(step)
+    if step < 1:
+        raise ValueError("Step must be at least 1 second")
+    # Aligned to the step so rows land on the same times Prometheus evaluates
+    first = int(start) // step * step
+    rows = int((end - first) // step) + 1
+    if rows < 1:
+        raise ValueError("End is before start")
+    os.makedirs(output, exist_ok=True)
+    metadata_path = os.path.join(output, DATASET_METADATA)
+    if os.path.exists(metadata_path):
+        os.remove(metadata_path)
+
+    columns = {
+        name: np.lib.format.open_memmap(os.path.join(output, f'{name}.npy'), mode='w+', dtype=np.float64, shape=(rows,))
+        for name in TRACE_COLUMNS
+    }
+    columns['timestamp'][:] = first + step * np.arange(rows, dtype=np.float64)
+    columns['action'][:] = -1
+    columns['latency_soft_constraint'][:] = latency_soft
+    columns['latency_hard_constraint'][:] = latency_hard
+    queries = dataset_queries(namespace, deployment)
+    for name in queries:
+        columns[name][:] = np.nan
+
+    def fetch(name, begin, stop):
+        """Fetch rows [begin, stop) of one metric into its column; returns the number of samples."""
+        for attempt in range(retries):
+            try:
+                timestamps, values = prom_client.query_range(
+                    queries[name], first + begin * step, first + (stop - 1) * step, step
+                )
+                break
+            except Exception as e:
+                if attempt == retries - 1:
+                    raise RuntimeError(f"Range query for {name} failed: {e}") from e
+                time.sleep(2 ** attempt)
+        index = np.rint((timestamps - first) / step).astype(np.int64)
+        inside = (index >= begin) & (index < stop)
+        columns[name][index[inside]] = values[inside]
+        return int(inside.sum())
+
+    chunks = [(begin, min(begin + max_points, rows)) for begin in range(0, rows, max_points)]
+    print(f"Fetching {rows} rows of {deployment} in {len(chunks)} chunks per metric with {workers} workers")
+    fetch_start = time.perf_counter()
+    samples = {name: 0 for name in queries}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dataset-query') as executor:
+        futures = [(name, executor.submit(fetch, name, begin, stop)) for begin, stop in chunks for name in queries]
+        for name, future in futures:
+            samples[name] += future.result()
+    for column in columns.values():
+        column.flush()
+    elapsed = time.perf_counter() - fetch_start
+    coverage = {name: samples[name] / rows for name in queries}
+    if not samples['replicas']:
+        raise ValueError(f"No replica counts for {namespace}/{deployment} in the range, not writing '{metadata_path}' "
+                         "(coverage: " + ", ".join(f"{name} {share:.0%}" for name, share in coverage.items()) + ")")
+
+    metadata = {
+        'namespace': namespace,
+        'deployment': deployment,
+        'start': first,
+        'end': first + (rows - 1) * step,
+        'step': step,
+        'rows': rows,
+        'columns': list(TRACE_COLUMNS),
+        'coverage': coverage,
+        'queries': queries,
+        'fetch_seconds': round(elapsed, 3),
+    }
+    tmp_path = metadata_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, metadata_path)
+    print(f"Wrote {rows} rows to '{output}' in {elapsed:.1f}s, coverage: " +
+          ", ".join(f"{name} {share:.0%}" for name, share in metadata['coverage'].items()))
+    return metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a replay dataset of a deployment from Prometheus history")
+    parser.add_argument("--deployment", required=True, help="Name of the deployment")
+    parser.add_argument("--namespace", default="default", help="Namespace of the deployment")
+    parser.add_argument("--duration", default="7d", help="How far back to fetch, e.g. 12h, 7d or 4w")
+    parser.add_argument("--end", type=float, help="Unix time of the last row, defaults to now")
+    parser.add_argument("--step", default="15s", help="Time between rows, in whole seconds")
+    parser.add_argument("--workers", type=int, default=8, help="Number of range queries in flight")
+    parser.add_argument("--max-points", type=int, default=MAX_POINTS, help="Rows per range query")
+    parser.add_argument("--output", help="Destination directory, defaults to <root>/<namespace>/<deployment>")
+    parser.add_argument("--root", default="datasets", help="Root directory of datasets when --output is not set")
+    parser.add_argument("--latency-soft", type=float, default=-1, help="Soft latency constraint of the deployment in ms")
+    parser.add_argument("--latency-hard", type=float, default=-1, help="Hard latency constraint of the deployment in ms")
+    parser.add_argument("--prometheus-url", help="Prometheus URL, defaults to PROMETHEUS_URL")
+    args = parser.parse_args()
+
+    end = time.time() if args.end is None else args.end
+    output = args.output or trace_directory(args.root, args.namespace, args.deployment)
+    prom_client = PrometheusClient(args.prometheus_url, pool_size=args.workers, timeout=60)
+    try:
+        build_dataset(
+            prom_client,
+            args.namespace,
+            args.deployment,
+            end - parse_duration(args.duration),
+            end,
+            parse_duration(args.step),
+            output,
+            workers=args.workers,
+            max_points=args.max_points,
+            latency_soft=args.latency_soft,
+            latency_hard=args.latency_hard,
+        )
+    except ValueError as e:
+        raise SystemExit(f"Dataset build failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,18 +6,33 @@ class PodTrackingCallback(BaseCallback):
         super().__init__(verbose)
         self.pod_counts = []
         self.steps = []
-        
+        self._initial_counts = None
+
+    def _on_training_start(self):
+        # Infos of failed steps may lack current_replicas; start from the replicas the
+        # environments have, so the history never holds a missing count
+        self._initial_counts = self.training_env.env_method('_get_current_replicas')
+
     def _on_step(self):
-        # Get the current number of pods from the environment
-        current_pods = self.training_env.envs[0].env._get_current_replicas()
+        # Read the pod counts reported by every environment in this step. Using the
+        # step infos avoids a round trip to each worker process of a SubprocVecEnv.
+        infos = self.locals.get('infos', [])
+        last_counts = self.pod_counts[-1] if self.pod_counts else self._initial_counts
+        current_pods = [
+            info.get('current_replicas', last) for info, last in zip(infos, last_counts)
+        ]
         self.pod_counts.append(current_pods)
         self.steps.append(self.num_timesteps)
         return True
-        
+
     def plot_pod_history(self, save_path='pod_scaling_history.png'):
         """Plot and save the pod scaling history"""
         plt.figure(figsize=(12, 6))
-        plt.plot(self.steps, self.pod_counts, 'b-', label='Number of Pods')
+        n_envs = len(self.pod_counts[0]) if self.pod_counts else 1
+        labels = ['Number of Pods'] if n_envs == 1 else [f'Number of Pods (env {i})' for i in range(n_envs)]
+        lines = plt.plot(self.steps, self.pod_counts)
+        for line, label in zip(lines, labels):
+            line.set_label(label)
         plt.xlabel('Steps')
         plt.ylabel('Number of Pods')
         plt.title('Pod Scaling Over Time')
@@ -25,4 +40,4 @@ class PodTrackingCallback(BaseCallback):
         plt.legend()
         plt.savefig(save_path)
         plt.close()
-        print(f"Plot has been saved as '{save_path}'") 
\ No newline at end of file
+        print(f"Plot has been saved as '{save_path}'")
@@ -0,0 +1,203 @@
+"""Periodic checkpoints of a PPO training run, and resuming from the latest one"""
+import json
+import os
+import pickle
+import shutil
+import signal
+import threading
+import time
+import numpy as np
+from stable_baselines3 import PPO
+from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import VecNormalize
+
+# Rollout buffer arrays filled step by step during a rollout
+ROLLOUT_FIELDS = ('observations', 'actions', 'rewards', 'episode_starts', 'values', 'log_probs')
+# Callback attributes restored on resume (evaluation history, pod history, call counters)
+CALLBACK_STATE = (
+    'n_calls',
+    'best_mean_reward',
+    'last_mean_reward',
+    'evaluations_results',
+    'evaluations_timesteps',
+    'evaluations_length',
+    'evaluations_successes',
+    'pod_counts',
+    'steps',
+)
+
+
+class ResumablePPO(PPO):
+    """
+    PPO whose rollout can continue from a checkpoint taken in the middle of it.
+    pending_rollout, set by load_checkpoint, holds the transitions collected
+    before the checkpoint; the next rollout starts from them and collects only
+    the remaining steps, so no experience from a live cluster is thrown away.
+    """
+    pending_rollout = None
+
+    def collect_rollouts(self, env, callback, rollout_buffer, n_rollout_steps):
+        pending, self.pending_rollout = self.pending_rollout, None
+        if pending is None or not pending['pos']:
+            return super().collect_rollouts(env, callback, rollout_buffer, n_rollout_steps)
+        pos = int(pending['pos'])
+
+        def reset():
+            type(rollout_buffer).reset(rollout_buffer)
+            for name in ROLLOUT_FIELDS:
+                getattr(rollout_buffer, name)[:pos] = pending[name]
+            rollout_buffer.pos = pos
+
+        # collect_rollouts starts by resetting the buffer; refill it there instead
+        rollout_buffer.reset = reset
+        try:
+            return super().collect_rollouts(env, callback, rollout_buffer, n_rollout_steps - pos)
+        finally:
+            del rollout_buffer.reset
+
+
+def save_checkpoint(model, directory, callbacks=(), wandb_run_id=None, keep=3):
+    """
+    Write a checkpoint of a training run in the middle of a step (from a callback's _on_step).
+    The model file holds the policy and its optimizer state; next to it go the
+    transitions of the current rollout, VecNormalize statistics (if the env is
+    wrapped) and the callbacks' histories. The checkpoint is written to a
+    temporary directory and renamed, so a crash never leaves a partial one;
+    only the newest keep checkpoints are kept.
+    Returns:
+        Path of the checkpoint directory.
+    """
+    env = model.get_env()
+    # The transition of the current step is not in the rollout buffer yet and is dropped
+    timesteps = model.num_timesteps - (env.num_envs if env is not None else 0)
+    name = f"checkpoint-{timesteps:012d}"
+    path = os.path.join(directory, name)
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    model.save(os.path.join(tmp_path, 'model.zip'))
+    buffer = model.rollout_buffer
+    pos = 0 if buffer.full else buffer.pos
+    np.savez(os.path.join(tmp_path, 'rollout.npz'), pos=pos,
+             **{field: getattr(buffer, field)[:pos] for field in ROLLOUT_FIELDS})
+    vec_normalize = model.get_vec_normalize_env()
+    if vec_normalize is not None:
+        vec_normalize.save(os.path.join(tmp_path, 'vecnormalize.pkl'))
+    states = {type(callback).__name__: {name: getattr(callback, name) for name in CALLBACK_STATE if hasattr(callback, name)}
+              for callback in callbacks}
+    with open(os.path.join(tmp_path, 'callbacks.pkl'), 'wb') as f:
+        pickle.dump(states, f)
+    with open(os.path.join(tmp_path, 'checkpoint.json'), 'w') as f:
+        json.dump({'timesteps': timesteps, 'wandb_run_id': wandb_run_id, 'saved_at': time.time()}, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    for old in list_checkpoints(directory)[:-keep] if keep else []:
+        shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+def list_checkpoints(directory):
+    """Complete checkpoint directories under directory, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory)
+                   if name.startswith('checkpoint-') and os.path.exists(os.path.join(directory, name, 'checkpoint.json')))
+    return [os.path.join(directory, name) for name in names]
+
+
+def latest_checkpoint(directory):
+    """
+    The newest checkpoint under directory.
+    Returns:
+        Dict with its 'path', 'timesteps' and 'wandb_run_id', or None if there is none.
+    """
+    checkpoints = list_checkpoints(directory)
+    if not checkpoints:
+        return None
+    with open(os.path.join(checkpoints[-1], 'checkpoint.json')) as f:
+        return {'path': checkpoints[-1], **json.load(f)}
+
+
+def load_checkpoint(checkpoint, env, callbacks=(), **kwargs):
+    """
+    Restore a training run from a checkpoint (see latest_checkpoint).
+    The first rollout after resuming continues from the saved transitions;
+    the environments are reset, so the interrupted episodes count as ended
+    at the checkpoint.
+    Args:
+        checkpoint: Checkpoint dict from latest_checkpoint.
+        env: Training environment, built as for a new run.
+        callbacks: Callbacks whose histories are restored.
+        kwargs: Passed on to ResumablePPO.load (e.g. tensorboard_log).
+    Returns:
+        Tuple of (model, env); env is wrapped in VecNormalize if the run used it.
+    """
+    path = checkpoint['path']
+    vec_normalize_path = os.path.join(path, 'vecnormalize.pkl')
+    if os.path.exists(vec_normalize_path):
+        env = VecNormalize.load(vec_normalize_path, env)
+    model = ResumablePPO.load(os.path.join(path, 'model.zip'), env=env, device='cpu', **kwargs)
+    model.num_timesteps = checkpoint['timesteps']
+    # Start from fresh observations; the saved ones describe a cluster that has moved on
+    model._last_obs = None
+    with np.load(os.path.join(path, 'rollout.npz')) as rollout:
+        model.pending_rollout = {name: rollout[name] for name in rollout.files}
+    with open(os.path.join(path, 'callbacks.pkl'), 'rb') as f:
+        states = pickle.load(f)
+    for callback in callbacks:
+        for name, value in states.get(type(callback).__name__, {}).items():
+            setattr(callback, name, value)
+    print(f"Resumed from '{path}' at {model.num_timesteps} timesteps")
+    return model, env
+
+
+class CheckpointCallback(BaseCallback):
+    """
+    Checkpoints the run every checkpoint_freq timesteps or checkpoint_interval
+    seconds, whichever comes first (see save_checkpoint). On SIGTERM, e.g. when
+    the pod is preempted, it checkpoints after the current step and stops
+    training; preempted is then True.
+    """
+    def __init__(self, directory, checkpoint_freq=None, checkpoint_interval=None, keep=3,
+                 callbacks=(), wandb_run_id=None, verbose=0):
+        super().__init__(verbose)
+        self.directory = directory
+        self.checkpoint_freq = checkpoint_freq
+        self.checkpoint_interval = checkpoint_interval
+        self.keep = keep
+        self.callbacks = callbacks
+        self.wandb_run_id = wandb_run_id
+        self.preempted = False
+        self._stop_requested = False
+        self._previous_handler = None
+        self._last_timesteps = 0
+        self._last_time = 0.0
+
+    def _on_training_start(self):
+        self._last_timesteps = self.num_timesteps
+        self._last_time = time.monotonic()
+        if threading.current_thread() is threading.main_thread():
+            self._previous_handler = signal.signal(signal.SIGTERM, self._request_stop)
+
+    def _request_stop(self, signum, frame):
+        print("SIGTERM received, checkpointing after the current step")
+        self._stop_requested = True
+
+    def _on_step(self):
+        due = (self.checkpoint_freq and self.num_timesteps - self._last_timesteps >= self.checkpoint_freq) or \
+              (self.checkpoint_interval and time.monotonic() - self._last_time >= self.checkpoint_interval)
+        if due or self._stop_requested:
+            path = save_checkpoint(self.model, self.directory, self.callbacks, self.wandb_run_id, self.keep)
+            if self.verbose:
+                print(f"Saved checkpoint '{path}'")
+            self._last_timesteps = self.num_timesteps
+            self._last_time = time.monotonic()
+        if self._stop_requested:
+            self.preempted = True
+            return False
+        return True
+
+    def _on_training_end(self):
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGTERM, self._previous_handler)
+            self._previous_handler = None
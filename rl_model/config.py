@@ -27,6 +27,13 @@ TRAINING_CONFIG = {
     "max_memory_per_pod": 512 * 1024 * 1024,  # 512MiB
     "action_interval": 30,  # Seconds between actions
     "metric_window": "30s",  # Metrics averaging window
+    "reset_mode": "wait",  # "wait": settle for 2 action intervals on reset; "reuse": start from the current cluster state
+    "trace_dir": None,  # Record every observation under this directory (see utils/trace_recorder.py)
+    "chaos_scenario": "default",  # Chaos scenario of the Kubernetes env (benchmarks/chaos_mesh/scenarios), None = no chaos
+    "history_window": 0,  # Samples of RPS/latency history behind the trend features (utils/history_features.py), 0 = snapshot only
+    "history_ewma_alpha": 0.3,  # Weight of the newest sample in the RPS/latency moving averages
+    "forecast_horizon": 0,  # Observe RPS/latency forecast this many action intervals ahead (utils/forecaster.py), 0 = off
+    "forecast_season_length": 0,  # Action intervals per load season for the forecaster, 0 = trend only
 }
 
 # Training settings
@@ -34,6 +41,36 @@ TRAINING_SETTINGS = {
     "total_timesteps": 20000,   # Increased from 2000 for more learning
     "eval_freq": 1024,         # Match n_steps for more frequent evaluation
     "n_eval_episodes": 5,      # Keep 5 evaluation episodes
+    "n_envs": 1,               # Parallel training environments (>1 runs each in its own process,
+                               # or all in one numpy batch with --batched)
+    "n_eval_envs": 1,          # Parallel evaluation environments
+    "vec_env_start_method": None,  # multiprocessing start method for workers (None = platform default)
+    "seed": None,              # Base seed; worker i is seeded with seed + i
+    "checkpoint_freq": 2048,   # Checkpoint every this many timesteps (see rl_model/checkpoint.py)...
+    "checkpoint_interval": 600,  # ...or every this many seconds, whichever comes first
+    "keep_checkpoints": 3,     # Checkpoints kept on disk, newest first
+}
+
+# Behavior-cloning pretraining from recorded traces (python -m rl_model.train --pretrain TRACE_DIR ...)
+PRETRAIN_CONFIG = {
+    "epochs": 200,             # passes over the recorded transitions
+    "batch_size": 64,          # transitions per gradient step
+    "learning_rate": 0.001,    # Adam learning rate
+    "value_coef": 0.5,         # weight of the value loss next to the behavior-cloning loss
+    "validation_split": 0.1,   # share of transitions held out to report accuracy on
+}
+
+# Hyperparameter sweeps over TRAINING_CONFIG on the batched simulator (python -m rl_model.sweep)
+SWEEP_SETTINGS = {
+    "total_timesteps": 50000,  # training timesteps per trial
+    "eval_interval": 5000,     # timesteps between evaluations, which are also checkpoints
+    "n_envs": 16,              # batched simulated environments per trial
+    "n_eval_episodes": 64,     # episodes per evaluation, the same seeds for every trial
+    "eval_seed": 10000,        # seed of the evaluation episodes
+    "grace_evals": 2,          # evaluations before a trial can be pruned
+    "min_trials_to_prune": 4,  # other trials needed at an evaluation before it can prune
+    "workers": None,           # trials run in parallel (None = number of cores)
+    "sweeps_dir": "./Results/sweeps",
 }
 
 # Directory paths
@@ -43,5 +80,38 @@ PATHS = {
     "logs_dir": "./Results/logs",
     "tensorboard_dir": "./Results/tensorboard",
     "models_dir": "./Results/models",
+    "checkpoints_dir": "./Results/checkpoints",
     "pod_history_plot": "pod_scaling_history.png"
-} 
\ No newline at end of file
+} 
+
+# Simulated environment parameters (used when training with --simulated)
+SIMULATION_CONFIG = {
+    "pod_capacity_rps": 12.0,          # requests/s one ready pod can serve
+    "base_latency_ms": 50.0,           # p95 latency of an idle deployment
+    "max_latency_ms": 5000.0,          # latency reported when nothing can serve traffic
+    "max_utilization": 0.995,          # cap on per-pod utilization in the queueing model
+    "pod_startup_delay": 20,           # seconds before a new pod serves traffic
+    "idle_cpu_percent": 2.0,           # CPU used by an idle pod (percent of one core)
+    "cpu_percent_per_rps": 2.0,        # CPU cost of serving 1 request/s
+    "pod_base_memory": 64 * 1024 * 1024,    # resident memory of an idle pod
+    "memory_per_rps": 512 * 1024,           # extra working set per request/s served
+    "memory_per_queued_request": 64 * 1024, # extra working set per backlogged request
+    "rps_per_user": 1.0,               # k6 users issue one request then sleep 1s
+    "baseline_users": 5,               # background traffic on top of the load profile
+    "peak_scale_range": (0.5, 1.5),    # per-episode multiplier on the load profile
+    "rps_noise": 0.05,                 # std of the log-normal noise on offered load
+    "latency_noise": 0.05,             # std of the log-normal noise on measured latency
+    "initial_replicas": None,          # None = random in [1, max_replicas // 2]
+    "chaos_scenario": None,            # scenario file or bundled name (benchmarks/chaos_mesh/scenarios), None = no faults
+    # Same shape as benchmarks/k6-test.js: (duration in seconds, target users)
+    "load_stages": [
+        (300, 100),
+        (1800, 100),
+        (300, 0),
+    ],
+    # Annotations the simulated deployment exposes to the reward function
+    "annotations": {
+        "latencySoftConstraint": "100",
+        "latencyHardConstraint": "250",
+    },
+}
@@ -4,11 +4,14 @@ import gymnasium as gym
 from gymnasium import spaces
 from kubernetes.client.rest import ApiException as KubernetesException
 from dotenv import load_dotenv
-from benchmarks.chaos_mesh.chaos_experiments import ChaosExperimentManager, PodKillException
-from utils.k8s_client import K8sClient
-from utils.prometheus_client import PrometheusClient
+from benchmarks.chaos_mesh.chaos_experiments import ChaosExperimentManager
+from benchmarks.chaos_mesh.chaos_scenarios import ChaosMeshBackend, ChaosScenarioEngine, PodKillException, load_scenario
+from utils.k8s_client import K8sClient, get_custom_objects_api
+from utils.prometheus_client import PrometheusClient, series_selectors, staleness
 from .reward import RewardCalculator
 from utils.state_builder import StateBuilder
+from utils.observation_features import ObservationFeatures
+from utils.trace_recorder import TraceRecorder, trace_directory
 from .config import TRAINING_CONFIG
 
 class MicroserviceEnv(gym.Env):
@@ -25,28 +28,56 @@ class MicroserviceEnv(gym.Env):
             shape=(5,),
             dtype=np.float32
         )
+        # Optionally followed by RPS/latency trend and forecast features (utils/observation_features.py)
+        self.features = ObservationFeatures.from_config(TRAINING_CONFIG)
+        if self.features is not None:
+            self.observation_space = self.features.observation_space(self.observation_space)
         self.deployment_name = deployment_name
         self.namespace = namespace
         self.prom_client = PrometheusClient()
         self.metric_window = TRAINING_CONFIG.get('metric_window', '30s')
         self.action_interval = TRAINING_CONFIG.get('action_interval', 30)
+        self.reset_mode = TRAINING_CONFIG.get('reset_mode', 'wait')
         self.pod_counts = []
         self.steps = []
         self.current_step = 0
         self.max_steps = 200
         self.k8s_client = K8sClient(self.deployment_name, self.namespace)
-        self.chaos_manager = ChaosExperimentManager(self.k8s_client.k8s_api, self.deployment_name, self.namespace)
+        self.chaos_manager = ChaosExperimentManager(get_custom_objects_api(), self.deployment_name, self.namespace)
+        # Experiments left behind by an interrupted run are removed in the background
+        self.chaos_manager.sweep_stale()
+        self.chaos_engine = None
+        chaos_scenario = TRAINING_CONFIG.get('chaos_scenario')
+        if chaos_scenario:
+            self.chaos_engine = ChaosScenarioEngine(
+                load_scenario(chaos_scenario),
+                ChaosMeshBackend(self.chaos_manager, self.action_interval, self._wait_for_pods_ready)
+            )
+        trace_dir = TRAINING_CONFIG.get('trace_dir')
+        self.trace_recorder = None
+        if trace_dir:
+            self.trace_recorder = TraceRecorder(trace_directory(trace_dir, self.namespace, self.deployment_name))
 
     def reset(self, seed=None, options=None):
         """
         Reset the environment to an initial state.
-        Waits for stabilization, scales pods to current count, and returns the initial state.
+        With reset_mode 'wait', waits for stabilization, scales pods to current count,
+        and waits again; with 'reuse', the episode starts from the deployment as it
+        is, once any scaling in progress has finished. Returns the initial state.
         """
         super().reset(seed=seed)
-        time.sleep(self.action_interval)
-        self._scale_pods(self._get_current_replicas())
-        time.sleep(self.action_interval)
-        state = self._get_state()
+        if self.chaos_engine is not None:
+            # Faults are drawn from the env's generator, so a seed fixes the fault sequence
+            self.chaos_engine.reset(self.np_random)
+        if self.reset_mode == 'reuse':
+            self._wait_for_pods_ready(self._get_current_replicas(), timeout=self.action_interval)
+        else:
+            time.sleep(self.action_interval)
+            self._scale_pods(self._get_current_replicas())
+            time.sleep(self.action_interval)
+        if self.features is not None:
+            self.features.reset()
+        state = self._with_features(self._get_state())
         self.current_step = 0
         return state, {}
 
@@ -58,8 +89,11 @@ class MicroserviceEnv(gym.Env):
         Returns:
             Tuple of (new_state, reward, done, truncated, info)
         """
+        state = np.zeros(5, dtype=np.float32)
         try:
-            state = self._get_state()
+            # Fetched once per step, for the trace recorder and the reward
+            annotations = self._get_annotations()
+            state = self._get_state(action, annotations)
             print(state, end=' ')
             replicas = int(state[2])
             replica_change = action - 1
@@ -68,7 +102,7 @@ class MicroserviceEnv(gym.Env):
                 print(f"No scaling (replicas remain {replicas}),", end=' ')
             elif target_replica < 1 or target_replica > self.max_replicas:
                 print(f"Invalid action, Reward: -1")
-                return state, -1, True, False, {
+                return self._with_features(state), -1, True, False, {
                     'current_replicas': replicas,
                     'action': action,
                     'invalid_action': True,
@@ -79,13 +113,12 @@ class MicroserviceEnv(gym.Env):
             else:
                 self._scale_pods(target_replica)
                 print(f"Scaled to {target_replica} replicas,", end=' ')
-            # Clean up any existing chaos experiments
-            self.chaos_manager.cleanup_chaos()
-            # Inject chaos randomly if none are active
-            if not self.chaos_manager.active_chaos_instances:
-                self.chaos_manager.inject_chaos(self._wait_for_pods_ready)
+            # Stop expired faults and start the ones the scenario schedules for this step;
+            # experiments are deleted in the background
+            if self.chaos_engine is not None:
+                self.chaos_engine.step()
             # Get new state after action and chaos
-            new_state = self._get_state()
+            new_state = self._with_features(self._get_state(annotations=annotations))
             # Print latency change if scaling occurred
             if replica_change != 0:
                 latency_change = new_state[3] - state[3]
@@ -93,7 +126,7 @@ class MicroserviceEnv(gym.Env):
             # Calculate reward and check if episode is done
             reward, done = RewardCalculator.calculate_reward(
                 new_state,
-                self._get_annotations(),
+                annotations,
                 self.max_replicas
             )
             print(f'Reward: {reward:.4f}')
@@ -122,15 +155,15 @@ class MicroserviceEnv(gym.Env):
             }
         except PodKillException as e:
             print(f"Pod kill exception: {e}, Reward: -50")
-            state = self._get_state()
+            state = self._with_features(self._get_state())
             return state, -50, True, False, {'error': 'All pods killed'}
         except KubernetesException as e:
             print(f"Kubernetes API Error: {e.reason}, Reward: -50")
-            state = self._get_state()
+            state = self._with_features(self._get_state())
             return state, -50, True, False, {'error': e.reason}
         except Exception as e:
             print(f"Unexpected error in step: {str(e)}")
-            return state, -10, True, False, {
+            return self._with_features(state), -10, True, False, {
                 'error': str(e),
                 'current_replicas': self._get_current_replicas(),
                 'unexpected_error': True
@@ -152,25 +185,38 @@ class MicroserviceEnv(gym.Env):
         """Get deployment annotations from Kubernetes."""
         return self.k8s_client.get_annotations()
 
-    def _get_state(self) -> np.ndarray:
+    def _with_features(self, state: np.ndarray) -> np.ndarray:
+        """Append the enabled observation features to a state returned to the agent."""
+        return state if self.features is None else self.features.update(state)
+
+    def _get_state(self, action: int = -1, annotations=None) -> np.ndarray:
         """
         Query Prometheus and Kubernetes to build the current state observation.
+        Args:
+            action: Action about to be taken on this observation, -1 if none.
+                Only used when recording a trace.
+            annotations: Deployment annotations already fetched for this step, recorded
+                with the trace; fetched from Kubernetes if None.
         Returns:
             Numpy array representing the state.
         """
         try:
-            cpu_usage_percent = self.prom_client.query(
-                f'sum(rate(container_cpu_usage_seconds_total{{namespace="{self.namespace}", pod=~"{self.deployment_name}-.*"}}[1m])) * 100'
-            )
-            memory_bytes = self.prom_client.query(
-                f'sum(container_memory_working_set_bytes{{namespace="{self.namespace}", pod=~"{self.deployment_name}-.*"}})'
-            )
-            p95_latency_ms = self.prom_client.query(
-                f'histogram_quantile(0.95, sum(rate(istio_request_duration_milliseconds_bucket{{reporter="destination", destination_workload="{self.deployment_name}"}}[5m])) by (le))'
-            )
-            rps = self.prom_client.query(
-                f'sum(rate(istio_requests_total{{reporter="destination", destination_workload="{self.deployment_name}"}}[1m]))'
-            )
+            queries = {
+                'cpu_usage_percent': f'sum(rate(container_cpu_usage_seconds_total{{namespace="{self.namespace}", pod=~"{self.deployment_name}-.*"}}[1m])) * 100',
+                'memory_bytes': f'sum(container_memory_working_set_bytes{{namespace="{self.namespace}", pod=~"{self.deployment_name}-.*"}})',
+                'p95_latency_ms': f'histogram_quantile(0.95, sum(rate(istio_request_duration_milliseconds_bucket{{reporter="destination", destination_workload="{self.deployment_name}"}}[5m])) by (le))',
+                'rps': f'sum(rate(istio_requests_total{{reporter="destination", destination_workload="{self.deployment_name}"}}[1m]))'
+            }
+            results = self.prom_client.query_many(queries, series_selectors(queries))
+            for name, result in results.items():
+                if result.status == 'error':
+                    print(f"Prometheus query for {name} failed: {result.error}")
+                elif result.timestamp is not None and staleness(result) > 2 * self.action_interval:
+                    print(f"Prometheus series for {name} is stale: newest sample {staleness(result):.0f}s old")
+            cpu_usage_percent = results['cpu_usage_percent'].value
+            memory_bytes = results['memory_bytes'].value
+            p95_latency_ms = results['p95_latency_ms'].value
+            rps = results['rps'].value
             n_replicas = self._get_current_replicas()
             max_memory_per_pod = TRAINING_CONFIG.get('max_memory_per_pod', 512 * 1024 * 1024)
             current_state = StateBuilder.build_state(
@@ -181,10 +227,31 @@ class MicroserviceEnv(gym.Env):
                 rps,
                 max_memory_per_pod
             )
+            if self.trace_recorder is not None:
+                self.trace_recorder.record(
+                    cpu_usage_percent,
+                    memory_bytes,
+                    n_replicas,
+                    p95_latency_ms,
+                    rps,
+                    action,
+                    annotations if annotations is not None else self._get_annotations()
+                )
             return current_state
         except Exception as e:
             print(f"Error getting state: {str(e)}")
-            return np.zeros(self.observation_space.shape, dtype=np.float32)
+            return np.zeros(5, dtype=np.float32)
+
+    def close(self):
+        """Remove remaining chaos experiments and flush any buffered trace rows."""
+        if self.chaos_engine is not None:
+            self.chaos_engine.stop_all()
+        self.chaos_manager.cleanup_chaos()
+        if not self.chaos_manager.wait_for_cleanup(timeout=60):
+            print("Some chaos experiments were not confirmed deleted")
+        if self.trace_recorder is not None:
+            self.trace_recorder.close()
+        super().close()
 
     def get_pod_history(self):
         """Return the history of pod counts and steps for analysis."""
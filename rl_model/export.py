@@ -0,0 +1,69 @@
+"""Export a trained PPO policy to a numpy-only .npz for utils.numpy_policy.NumpyPolicy"""
+import argparse
+import pickle
+import numpy as np
+from torch import nn
+from stable_baselines3 import PPO
+from stable_baselines3.common.torch_layers import FlattenExtractor
+
+ACTIVATION_NAMES = {
+    nn.Tanh: 'tanh',
+    nn.ReLU: 'relu',
+}
+
+
+def export_policy(model, path, vec_normalize=None):
+    """
+    Write the actor of a PPO MlpPolicy (and observation normalization, if any) to an .npz.
+    Args:
+        model: Trained PPO model with a Discrete action space.
+        path: Destination .npz file.
+        vec_normalize: Optional VecNormalize whose observation statistics the policy was trained with.
+    """
+    policy = model.policy
+    if not isinstance(policy.pi_features_extractor, FlattenExtractor):
+        raise ValueError("Only policies with a FlattenExtractor can be exported")
+    weights, biases, activations = [], [], []
+    for module in policy.mlp_extractor.policy_net:
+        if isinstance(module, nn.Linear):
+            weights.append(module.weight.detach().cpu().numpy())
+            biases.append(module.bias.detach().cpu().numpy())
+            activations.append('identity')
+        elif type(module) in ACTIVATION_NAMES:
+            activations[-1] = ACTIVATION_NAMES[type(module)]
+        else:
+            raise ValueError(f"Unsupported layer in policy network: {module}")
+    weights.append(policy.action_net.weight.detach().cpu().numpy())
+    biases.append(policy.action_net.bias.detach().cpu().numpy())
+    activations.append('identity')
+    arrays = {f'weight_{i}': weight for i, weight in enumerate(weights)}
+    arrays.update({f'bias_{i}': bias for i, bias in enumerate(biases)})
+    arrays['activations'] = np.array(activations)
+    arrays['n_layers'] = np.array(len(weights))
+    if vec_normalize is not None and vec_normalize.norm_obs:
+        arrays['obs_mean'] = vec_normalize.obs_rms.mean.astype(np.float32)
+        arrays['obs_var'] = vec_normalize.obs_rms.var.astype(np.float32)
+        arrays['clip_obs'] = np.array(vec_normalize.clip_obs)
+        arrays['epsilon'] = np.array(vec_normalize.epsilon)
+    np.savez(path, **arrays)
+    print(f"Exported policy to '{path}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a PPO model to a numpy-only .npz policy")
+    parser.add_argument("model", help="Path to the PPO model .zip")
+    parser.add_argument("output", help="Destination .npz file")
+    parser.add_argument("--vec-normalize", help="VecNormalize statistics saved during training")
+    args = parser.parse_args()
+
+    model = PPO.load(args.model, device='cpu')
+    vec_normalize = None
+    if args.vec_normalize:
+        # Only the statistics are needed, so the VecNormalize is not attached to an env
+        with open(args.vec_normalize, 'rb') as f:
+            vec_normalize = pickle.load(f)
+    export_policy(model, args.output, vec_normalize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Behavior-cloning pretraining of the PPO policy from recorded traces"""
+import numpy as np
+import torch
+from torch.nn import functional as F
+from .reward import RewardCalculator
+from utils.state_builder import StateBuilder
+from utils.observation_features import ObservationFeatures
+from utils.trace_recorder import load_trace
+from .config import TRAINING_CONFIG, SIMULATION_CONFIG, PRETRAIN_CONFIG
+
+
+def trace_transitions(trace, action_interval, max_replicas, max_memory_per_pod, gamma=0.99, features=None):
+    """
+    Turn a trace into (observation, action, reward) transitions.
+    Rows with a recorded action (the suggestion server's decisions) keep it.
+    A trace without any, such as a dataset built from Prometheus history while
+    another autoscaler (e.g. the HPA) was in charge, is sampled once per
+    action_interval, skipping points without a sample within half an interval,
+    and each action is the direction of the replica change to the next sample.
+    The reward of a transition is the reward of the state it leads to. Rows more than two action intervals apart start a new segment;
+    discounted returns and the observation features do not carry across segments.
+    Args:
+        trace: Dict of column name to array, as returned by load_trace.
+        action_interval: Seconds between actions.
+        max_replicas: Maximum allowed replicas, for the reward.
+        max_memory_per_pod: Max memory per pod in bytes, for the state.
+        gamma: Discount factor of the returns.
+        features: Optional ObservationFeatures appended to every state.
+    Returns:
+        Dict with observations (N, obs_dim), actions (N,), rewards (N,) and returns (N,).
+    """
+    timestamps = np.asarray(trace['timestamp'])
+    recorded = np.asarray(trace['action']) >= 0
+    if recorded.any():
+        rows = np.flatnonzero(recorded)
+        times = timestamps[rows]
+    else:
+        grid = np.arange(timestamps[0], timestamps[-1] + action_interval / 2, action_interval)
+        rows = np.maximum(np.searchsorted(timestamps, grid, side='right') - 1, 0)
+        # Grid points in a gap of the trace have no sample of their own; drop them,
+        # and every repeat of a row, so gaps split segments instead of becoming no-ops
+        sampled = np.abs(grid - timestamps[rows]) <= action_interval / 2
+        sampled[1:] &= rows[1:] != rows[:-1]
+        rows, times = rows[sampled], grid[sampled]
+    replicas = np.asarray(trace['replicas'])[rows]
+    # Drop rows without replicas; missing metrics (NaN) read as 0, like series without data
+    valid = replicas >= 1
+    rows, replicas, times = rows[valid], replicas[valid], times[valid]
+    if len(rows) < 2:
+        return None
+    column = lambda name: np.nan_to_num(np.asarray(trace[name])[rows])
+    states = StateBuilder.build_states(
+        column('cpu_usage_percent'),
+        column('memory_bytes'),
+        replicas,
+        column('p95_latency_ms'),
+        column('rps'),
+        max_memory_per_pod
+    )
+    if recorded.any():
+        actions = np.asarray(trace['action'])[rows].astype(np.int64)
+    else:
+        actions = (np.sign(np.diff(replicas, append=replicas[-1])) + 1).astype(np.int64)
+
+    soft = column('latency_soft_constraint')
+    hard = column('latency_hard_constraint')
+    defaults = SIMULATION_CONFIG['annotations']
+    unset = (soft == -1) | (hard == -1)
+    annotations = {
+        'latencySoftConstraint': np.where(unset, float(defaults['latencySoftConstraint']), soft),
+        'latencyHardConstraint': np.where(unset, float(defaults['latencyHardConstraint']), hard),
+    }
+    next_annotations = {name: values[1:] for name, values in annotations.items()}
+    rewards, terminated = RewardCalculator.calculate_rewards(states[1:], next_annotations, max_replicas)
+
+    # A transition needs the next row of the same segment
+    continues = np.diff(times) <= 2 * action_interval
+    observations = states
+    if features is not None:
+        starts = np.concatenate([[True], ~continues])
+        observations = []
+        for state, start in zip(states, starts):
+            if start:
+                features.reset()
+            observations.append(features.update(state))
+        observations = np.stack(observations)
+    returns = np.zeros(len(rewards), dtype=np.float32)
+    future = 0.0
+    for i in range(len(rewards) - 1, -1, -1):
+        if not continues[i]:
+            future = 0.0
+        elif terminated[i]:
+            future = rewards[i]
+        else:
+            future = rewards[i] + gamma * future
+        returns[i] = future
+    return {
+        'observations': observations[:-1][continues],
+        'actions': actions[:-1][continues],
+        'rewards': rewards[continues],
+        'returns': returns[continues],
+    }
+
+
+def load_demonstrations(trace_dirs, gamma=0.99):
+    """
+    Load the transitions of several traces (see trace_transitions), with
+    the action interval, limits and observation features of TRAINING_CONFIG.
+    Returns:
+        Dict with observations, actions, rewards and returns concatenated over all traces.
+    Raises:
+        ValueError: If no trace has a usable transition.
+    """
+    parts = []
+    for trace_dir in trace_dirs:
+        transitions = trace_transitions(
+            load_trace(trace_dir),
+            TRAINING_CONFIG.get('action_interval', 30),
+            TRAINING_CONFIG.get('max_replicas', 15),
+            TRAINING_CONFIG.get('max_memory_per_pod', 512 * 1024 * 1024),
+            gamma,
+            ObservationFeatures.from_config(TRAINING_CONFIG),
+        )
+        if transitions is None or not len(transitions['actions']):
+            print(f"No usable transitions in '{trace_dir}'")
+            continue
+        print(f"Loaded {len(transitions['actions'])} transitions from '{trace_dir}'")
+        parts.append(transitions)
+    if not parts:
+        raise ValueError("No usable transitions in the pretraining traces")
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def pretrain_policy(model, demonstrations, epochs=None, batch_size=None, learning_rate=None,
+                    value_coef=None, validation_split=None, seed=None):
+    """
+    Fit the policy of a PPO model to demonstrations before online training:
+    the action head by maximum likelihood of the demonstrated actions
+    (behavior cloning) and the value head to their discounted returns, so
+    PPO's first advantage estimates do not come from an untrained critic.
+    Arguments left as None default to PRETRAIN_CONFIG.
+    Args:
+        model: PPO model whose policy is trained in place.
+        demonstrations: Dict from load_demonstrations.
+        epochs: Passes over the training transitions.
+        batch_size: Transitions per gradient step.
+        learning_rate: Adam learning rate.
+        value_coef: Weight of the value loss.
+        validation_split: Share of the transitions held out to report accuracy on.
+        seed: Seed of the split and the minibatch order.
+    Returns:
+        Dict with the final policy and value losses, training accuracy and validation accuracy.
+    """
+    cfg = PRETRAIN_CONFIG
+    epochs = cfg['epochs'] if epochs is None else epochs
+    batch_size = cfg['batch_size'] if batch_size is None else batch_size
+    learning_rate = cfg['learning_rate'] if learning_rate is None else learning_rate
+    value_coef = cfg['value_coef'] if value_coef is None else value_coef
+    validation_split = cfg['validation_split'] if validation_split is None else validation_split
+
+    policy = model.policy
+    observations = demonstrations['observations']
+    if observations.shape[1:] != model.observation_space.shape:
+        raise ValueError(f"Demonstrations have observations of shape {observations.shape[1:]}, "
+                         f"the model expects {model.observation_space.shape}")
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(observations))
+    n_validation = int(len(order) * validation_split)
+    device = policy.device
+    tensors = {
+        'observations': torch.as_tensor(observations, dtype=torch.float32, device=device),
+        'actions': torch.as_tensor(demonstrations['actions'], dtype=torch.int64, device=device),
+        'returns': torch.as_tensor(demonstrations['returns'], dtype=torch.float32, device=device),
+    }
+    validation = torch.as_tensor(order[:n_validation], device=device)
+    training = order[n_validation:]
+
+    def accuracy(indices):
+        if not len(indices):
+            return float('nan')
+        with torch.no_grad():
+            predicted, _, _ = policy(tensors['observations'][indices], deterministic=True)
+        return (predicted == tensors['actions'][indices]).float().mean().item()
+
+    optimizer = torch.optim.Adam(policy.parameters(), lr=learning_rate)
+    policy.set_training_mode(True)
+    policy_loss = value_loss = torch.tensor(float('nan'))
+    for epoch in range(epochs):
+        rng.shuffle(training)
+        for start in range(0, len(training), batch_size):
+            batch = torch.as_tensor(training[start:start + batch_size], device=device)
+            values, log_prob, _ = policy.evaluate_actions(tensors['observations'][batch], tensors['actions'][batch])
+            policy_loss = -log_prob.mean()
+            value_loss = F.mse_loss(values.flatten(), tensors['returns'][batch])
+            optimizer.zero_grad()
+            (policy_loss + value_coef * value_loss).backward()
+            optimizer.step()
+        if (epoch + 1) % 10 == 0 or epoch + 1 == epochs:
+            print(f"Pretraining epoch {epoch + 1}/{epochs}: policy loss {policy_loss.item():.4f}, "
+                  f"value loss {value_loss.item():.4f}, validation accuracy {accuracy(validation):.3f}")
+    policy.set_training_mode(False)
+    return {
+        'policy_loss': policy_loss.item(),
+        'value_loss': value_loss.item(),
+        'train_accuracy': accuracy(torch.as_tensor(training, device=device)),
+        'validation_accuracy': accuracy(validation),
+    }
@@ -0,0 +1,172 @@
+import numpy as np
+import gymnasium as gym
+from gymnasium import spaces
+from .reward import RewardCalculator
+from .sim_env import p95_latency_ms
+from utils.state_builder import StateBuilder
+from utils.observation_features import ObservationFeatures
+from utils.trace_recorder import load_trace
+from .config import TRAINING_CONFIG, SIMULATION_CONFIG
+
+
+class ReplayEnv(gym.Env):
+    """
+    Replays a trace recorded with utils.trace_recorder.TraceRecorder or built
+    from Prometheus history with rl_model.build_dataset.
+    Load, CPU and memory come from the trace; the agent controls the replica
+    count and the recorded latency is rescaled with the simulator's queueing
+    model to the replica count the agent chose instead of the recorded one.
+    """
+    def __init__(self, trace_dir, verbose=0):
+        super().__init__()
+        self.max_replicas = TRAINING_CONFIG.get('max_replicas', 15)
+        # Action space: 0=down, 1=nothing, 2=up
+        self.action_space = spaces.Discrete(3)
+        # Observation space: [cpu, mem, replicas, latency, rps]
+        self.observation_space = spaces.Box(
+            low=np.array([0, 0, 1, 0, -100], dtype=np.float32),
+            high=np.array([500, 1, self.max_replicas, 5000, 100], dtype=np.float32),
+            shape=(5,),
+            dtype=np.float32
+        )
+        # Optionally followed by RPS/latency trend and forecast features (utils/observation_features.py)
+        self.features = ObservationFeatures.from_config(TRAINING_CONFIG)
+        if self.features is not None:
+            self.observation_space = self.features.observation_space(self.observation_space)
+        self.trace_dir = trace_dir
+        self.verbose = verbose
+        self.sim_config = SIMULATION_CONFIG
+        self.action_interval = TRAINING_CONFIG.get('action_interval', 30)
+        self.max_memory_per_pod = TRAINING_CONFIG.get('max_memory_per_pod', 512 * 1024 * 1024)
+        self.trace = load_trace(trace_dir)
+        # Drop rows recorded while the deployment had no replicas or replicas were unknown
+        valid = self.trace['replicas'] >= 1
+        if not valid.all():
+            self.trace = {name: values[valid] for name, values in self.trace.items()}
+        if not len(self.trace['timestamp']):
+            raise ValueError(f"Trace in {trace_dir} has no usable rows")
+        self.pod_counts = []
+        self.steps = []
+        self.current_step = 0
+        self.max_steps = 200
+        self._time = 0.0
+        self._replicas = 1
+        self._state = np.zeros(self.observation_space.shape, dtype=np.float32)
+
+    def reset(self, seed=None, options=None):
+        """
+        Start an episode at a random point of the trace (or at options['start_time'])
+        with the replica count recorded there, and return the initial state.
+        """
+        super().reset(seed=seed)
+        timestamps = self.trace['timestamp']
+        last_start = max(timestamps[-1] - self.max_steps * self.action_interval, timestamps[0])
+        if options and options.get('start_time') is not None:
+            self._time = float(options['start_time'])
+        elif last_start > timestamps[0]:
+            self._time = float(self.np_random.uniform(timestamps[0], last_start))
+        else:
+            self._time = float(timestamps[0])
+        self._replicas = int(self.trace['replicas'][self._row()])
+        if self.features is not None:
+            self.features.reset()
+        self._state = self._with_features(self._observe())
+        self.current_step = 0
+        return self._state, {}
+
+    def step(self, action: int) -> tuple:
+        """
+        Take an action against the replayed trace.
+        Args:
+            action: The action to take (0=down, 1=nothing, 2=up).
+        Returns:
+            Tuple of (new_state, reward, done, truncated, info)
+        """
+        state = self._state
+        replicas = self._replicas
+        replica_change = int(action) - 1
+        target_replica = replicas + replica_change
+        if replica_change != 0 and (target_replica < 1 or target_replica > self.max_replicas):
+            return state.copy(), -1, True, False, {
+                'current_replicas': replicas,
+                'action': action,
+                'invalid_action': True,
+                'cpu_usage': state[0],
+                'memory_usage': state[1],
+                'response_time': state[3]
+            }
+        self._replicas = target_replica
+        self._time += self.action_interval
+        new_state = self._with_features(self._observe())
+        self._state = new_state
+        reward, done = RewardCalculator.calculate_reward(
+            new_state,
+            self._get_annotations(),
+            self.max_replicas
+        )
+        if self.verbose:
+            print(f"{state} Replicas {replicas} -> {target_replica}, Reward: {reward:.4f}")
+        self.current_step += 1
+        self.steps.append(self.current_step)
+        self.pod_counts.append(target_replica)
+        info = {
+            'current_replicas': target_replica,
+            'action': action,
+            'cpu_usage': new_state[0],
+            'memory_usage': new_state[1],
+            'response_time': new_state[3],
+            'reward': reward
+        }
+        trace_ended = self._time >= self.trace['timestamp'][-1]
+        if (self.current_step >= self.max_steps or trace_ended) and not done:
+            info['truncated'] = True
+            return new_state, reward, False, True, info
+        return new_state, reward, done, False, info
+
+    def _row(self) -> int:
+        """Index of the last trace row recorded at or before the current time."""
+        return max(int(np.searchsorted(self.trace['timestamp'], self._time, side='right')) - 1, 0)
+
+    def _with_features(self, state: np.ndarray) -> np.ndarray:
+        """Append the enabled observation features to a state returned to the agent."""
+        return state if self.features is None else self.features.update(state)
+
+    def _observe(self) -> np.ndarray:
+        """Build the observation at the current time for the agent's replica count."""
+        cfg = self.sim_config
+        row = self._row()
+        # Metrics missing from a dataset (NaN) read as 0, like series without data
+        recorded_replicas = self.trace['replicas'][row]
+        rps = np.nan_to_num(self.trace['rps'][row])
+        replica_delta = self._replicas - recorded_replicas
+        # Rescale the queueing part of the latency to the agent's replica count
+        modelled_recorded = p95_latency_ms(rps, recorded_replicas, 0.0, cfg)
+        modelled_agent = p95_latency_ms(rps, self._replicas, 0.0, cfg)
+        latency = min(np.nan_to_num(self.trace['p95_latency_ms'][row]) * modelled_agent / modelled_recorded, cfg['max_latency_ms'])
+        cpu = max(np.nan_to_num(self.trace['cpu_usage_percent'][row]) + replica_delta * cfg['idle_cpu_percent'], 0.0)
+        memory = max(np.nan_to_num(self.trace['memory_bytes'][row]) + replica_delta * cfg['pod_base_memory'], 0.0)
+        return StateBuilder.build_state(
+            cpu,
+            memory,
+            self._replicas,
+            latency,
+            rps,
+            self.max_memory_per_pod
+        )
+
+    def _get_current_replicas(self) -> int:
+        """Get the replica count chosen by the agent."""
+        return self._replicas
+
+    def _get_annotations(self):
+        """Latency constraints recorded with the trace, or the simulator's defaults."""
+        row = self._row()
+        soft = self.trace['latency_soft_constraint'][row]
+        hard = self.trace['latency_hard_constraint'][row]
+        if soft == -1 or hard == -1:
+            return self.sim_config['annotations']
+        return {'latencySoftConstraint': soft, 'latencyHardConstraint': hard}
+
+    def get_pod_history(self):
+        """Return the history of pod counts and steps for analysis."""
+        return self.steps, self.pod_counts
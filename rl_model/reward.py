@@ -31,4 +31,29 @@ class RewardCalculator:
             else:
                 r2 = 1
         reward = 0.3 * r1 + 0.7 * r2
-        return reward, terminated 
\ No newline at end of file
+        return reward, terminated 
+
+    @staticmethod
+    def calculate_rewards(new_states: np.ndarray, annotations: dict, max_replicas: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized counterpart of calculate_reward for a batch of states.
+        Args:
+            new_states: The new states, shape (K, 5).
+            annotations: Deployment annotations dict; values may be scalars or arrays of shape (K,).
+            max_replicas: Maximum allowed replicas.
+        Returns:
+            Tuple of (rewards, terminated), both of shape (K,)
+        """
+        r1 = (max_replicas - new_states[:, 2]) / max_replicas
+        latency = new_states[:, 3]
+        latencySoftConstraint = np.asarray(annotations.get('latencySoftConstraint', -1), dtype=np.float64)
+        latencyHardConstraint = np.asarray(annotations.get('latencyHardConstraint', -1), dtype=np.float64)
+        constrained = (latencySoftConstraint != -1) & (latencyHardConstraint != -1)
+        hard_violation = constrained & (latency > latencyHardConstraint)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            soft_reward = 1.0 - (latency - latencySoftConstraint) / (latencyHardConstraint - latencySoftConstraint)
+        r2 = np.where(latency > latencyHardConstraint, -1.0,
+                      np.where(latency > latencySoftConstraint, soft_reward, 1.0))
+        r2 = np.where(constrained, r2, 0.0)
+        rewards = 0.3 * r1 + 0.7 * r2
+        return rewards.astype(np.float32), np.broadcast_to(hard_violation, rewards.shape).copy()
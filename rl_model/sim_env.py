@@ -0,0 +1,289 @@
+import math
+import numpy as np
+import gymnasium as gym
+from gymnasium import spaces
+from benchmarks.chaos_mesh.chaos_scenarios import (
+    ChaosScenarioEngine, PodKillException, SimulatedChaosBackend, load_scenario
+)
+from .reward import RewardCalculator
+from utils.state_builder import StateBuilder
+from utils.observation_features import ObservationFeatures
+from .config import TRAINING_CONFIG, SIMULATION_CONFIG
+
+
+def load_profile_knots(stages):
+    """
+    Convert k6-style stages into interpolation knots.
+    Args:
+        stages: List of (duration_seconds, target_users), starting from 0 users.
+    Returns:
+        Tuple of (times, users) arrays.
+    """
+    times = [0.0]
+    users = [0.0]
+    for duration, target in stages:
+        times.append(times[-1] + float(duration))
+        users.append(float(target))
+    return np.array(times), np.array(users)
+
+
+def users_at(t, times, users):
+    """Number of virtual users at time t (seconds); the profile repeats."""
+    return np.interp(np.mod(t, times[-1]), times, users)
+
+
+def p95_latency_ms(offered_rps, serving_pods, backlog, sim_config=SIMULATION_CONFIG):
+    """
+    Approximate the p95 latency of the deployment.
+    Queueing delay uses the Sakasegawa approximation of an M/M/c queue with one
+    server per pod; requests left in the backlog add the time needed to drain it.
+    Works on scalars and numpy arrays alike.
+    """
+    pod_capacity = sim_config['pod_capacity_rps']
+    max_latency = sim_config['max_latency_ms']
+    servers = np.maximum(serving_pods, 1e-6)
+    capacity = servers * pod_capacity
+    rho = np.clip(offered_rps / capacity, 0.0, sim_config['max_utilization'])
+    wait_ratio = rho ** (np.sqrt(2.0 * (servers + 1.0)) - 1.0) / (servers * (1.0 - rho))
+    latency = sim_config['base_latency_ms'] * (1.0 + wait_ratio) + 1000.0 * backlog / capacity
+    return np.where(serving_pods > 0, np.minimum(latency, max_latency), max_latency)
+
+
+def warmup_weights(action_interval, sim_config=SIMULATION_CONFIG):
+    """
+    Fraction of an action interval that a pod started i intervals ago spends
+    serving traffic, for every i until the pod is fully ready.
+    """
+    delay = float(sim_config['pod_startup_delay'])
+    slots = max(int(math.ceil(delay / action_interval)), 1)
+    ages = np.arange(1, slots + 1) * action_interval
+    return np.clip((ages - delay) / action_interval, 0.0, 1.0)
+
+
+class SimulatedMicroserviceEnv(gym.Env):
+    """
+    Drop-in replacement for MicroserviceEnv that simulates the deployment
+    instead of talking to Kubernetes and Prometheus.
+    Each step advances simulated time by action_interval seconds.
+    """
+    # Effect of active chaos faults on the simulation (see benchmarks/chaos_mesh/chaos_scenarios.py)
+    NO_FAULTS = {
+        'load_multiplier': 1.0,      # multiplier on offered load
+        'capacity_factor': 1.0,      # share of each pod's capacity left to the service
+        'latency_ms': 0.0,           # added to the measured latency
+        'cpu_percent_per_pod': 0.0,  # extra CPU used by every running pod
+        'memory_per_pod': 0,         # extra memory used by every running pod
+    }
+
+    def __init__(self, deployment_name='nginx', namespace='default', verbose=0, chaos_scenario=None):
+        super().__init__()
+        self.max_replicas = TRAINING_CONFIG.get('max_replicas', 15)
+        # Action space: 0=down, 1=nothing, 2=up
+        self.action_space = spaces.Discrete(3)
+        # Observation space: [cpu, mem, replicas, latency, rps]
+        self.observation_space = spaces.Box(
+            low=np.array([0, 0, 1, 0, -100], dtype=np.float32),
+            high=np.array([500, 1, self.max_replicas, 5000, 100], dtype=np.float32),
+            shape=(5,),
+            dtype=np.float32
+        )
+        # Peak simulated load goes past the RPS bound the live environment shares; observe it clipped
+        self.max_observed_rps = float(self.observation_space.high[4])
+        # Optionally followed by RPS/latency trend and forecast features (utils/observation_features.py)
+        self.features = ObservationFeatures.from_config(TRAINING_CONFIG)
+        if self.features is not None:
+            self.observation_space = self.features.observation_space(self.observation_space)
+        self.deployment_name = deployment_name
+        self.namespace = namespace
+        self.verbose = verbose
+        self.sim_config = SIMULATION_CONFIG
+        self.action_interval = TRAINING_CONFIG.get('action_interval', 30)
+        self.max_memory_per_pod = TRAINING_CONFIG.get('max_memory_per_pod', 512 * 1024 * 1024)
+        self.annotations = dict(self.sim_config['annotations'])
+        self.pod_counts = []
+        self.steps = []
+        self.current_step = 0
+        self.max_steps = 200
+        self._knots = load_profile_knots(self.sim_config['load_stages'])
+        self._warmup = warmup_weights(self.action_interval, self.sim_config)
+        # Simulation state
+        self._time = 0.0
+        self._peak_scale = 1.0
+        self._replicas = 1
+        self._ready = 1
+        self._starting = [0] * len(self._warmup)
+        self._backlog = 0.0
+        self._state = np.zeros(self.observation_space.shape, dtype=np.float32)
+        self.faults = dict(self.NO_FAULTS)
+        self.metrics = {}
+        self.chaos_engine = None
+        chaos_scenario = chaos_scenario or self.sim_config.get('chaos_scenario')
+        if chaos_scenario:
+            if not isinstance(chaos_scenario, dict):
+                chaos_scenario = load_scenario(chaos_scenario)
+            self.chaos_engine = ChaosScenarioEngine(chaos_scenario, SimulatedChaosBackend(self))
+
+    def reset(self, seed=None, options=None):
+        """
+        Reset the simulation to a random point of the load profile with all
+        pods ready, and return the initial state.
+        """
+        super().reset(seed=seed)
+        initial_replicas = self.sim_config.get('initial_replicas')
+        if initial_replicas is None:
+            initial_replicas = int(self.np_random.integers(1, max(self.max_replicas // 2, 1) + 1))
+        self._replicas = int(initial_replicas)
+        self._ready = self._replicas
+        self._starting = [0] * len(self._warmup)
+        self._backlog = 0.0
+        self._time = float(self.np_random.uniform(0, self._knots[0][-1]))
+        self._peak_scale = float(self.np_random.uniform(*self.sim_config['peak_scale_range']))
+        if self.chaos_engine is not None:
+            self.chaos_engine.reset(self.np_random)
+        if self.features is not None:
+            self.features.reset()
+        self._state = self._with_features(self._simulate_interval())
+        self.current_step = 0
+        return self._state, {}
+
+    def step(self, action: int) -> tuple:
+        """
+        Take an action in the simulated environment.
+        Args:
+            action: The action to take (0=down, 1=nothing, 2=up).
+        Returns:
+            Tuple of (new_state, reward, done, truncated, info)
+        """
+        state = self._state
+        replicas = self._replicas
+        replica_change = int(action) - 1
+        target_replica = replicas + replica_change
+        if replica_change != 0 and (target_replica < 1 or target_replica > self.max_replicas):
+            if self.verbose:
+                print(f"{state} Invalid action, Reward: -1")
+            # A copy, so the observation returned before is not the same object
+            return state.copy(), -1, True, False, {
+                'current_replicas': replicas,
+                'action': action,
+                'invalid_action': True,
+                'cpu_usage': state[0],
+                'memory_usage': state[1],
+                'response_time': state[3]
+            }
+        if replica_change != 0:
+            self._scale_pods(target_replica)
+        pods_killed = False
+        if self.chaos_engine is not None:
+            try:
+                self.chaos_engine.step()
+            except PodKillException as e:
+                # Ends the episode as MicroserviceEnv does; the deployment restarts the pods
+                if self.verbose:
+                    print(f"Pod kill exception: {e},", end=' ')
+                pods_killed = True
+        new_state = self._with_features(self._simulate_interval())
+        self._state = new_state
+        if pods_killed:
+            reward, done = -50, True
+        else:
+            reward, done = RewardCalculator.calculate_reward(
+                new_state,
+                self.annotations,
+                self.max_replicas
+            )
+        if self.verbose:
+            print(f"{state} Replicas {replicas} -> {target_replica}, Reward: {reward:.4f}")
+        self.current_step += 1
+        self.steps.append(self.current_step)
+        self.pod_counts.append(target_replica)
+        info = {
+            'current_replicas': target_replica,
+            'action': action,
+            'cpu_usage': new_state[0],
+            'memory_usage': new_state[1],
+            'response_time': new_state[3],
+            'reward': reward
+        }
+        if pods_killed:
+            info['error'] = 'All pods killed'
+        if self.current_step >= self.max_steps and not done:
+            info['truncated'] = True
+            return new_state, reward, False, True, info
+        return new_state, reward, done, False, info
+
+    def _scale_pods(self, replicas: int):
+        """Start new pods, or stop the youngest pods first when scaling down."""
+        if replicas > self._replicas:
+            self._starting[0] += replicas - self._replicas
+        else:
+            to_remove = self._replicas - replicas
+            for age in range(len(self._starting)):
+                removed = min(to_remove, self._starting[age])
+                self._starting[age] -= removed
+                to_remove -= removed
+            self._ready -= to_remove
+        self._replicas = replicas
+
+    def kill_pods(self, fraction):
+        """Kill a fraction of the running pods; the deployment restarts them from scratch."""
+        killed = int(math.ceil(self._replicas * fraction))
+        self._scale_pods(self._replicas - killed)
+        self._scale_pods(self._replicas + killed)
+
+    def _with_features(self, state: np.ndarray) -> np.ndarray:
+        """Append the enabled observation features to a state returned to the agent."""
+        return state if self.features is None else self.features.update(state)
+
+    def _simulate_interval(self) -> np.ndarray:
+        """
+        Advance the simulation by one action interval and build the observation
+        Prometheus would report at its end.
+        """
+        cfg = self.sim_config
+        self._time += self.action_interval
+        faults = self.faults
+        users = (users_at(self._time, *self._knots) * self._peak_scale + cfg['baseline_users']) * faults['load_multiplier']
+        offered = users * cfg['rps_per_user'] * self.np_random.lognormal(0.0, cfg['rps_noise'])
+        serving = (self._ready + float(np.dot(self._warmup, self._starting))) * faults['capacity_factor']
+        capacity = serving * cfg['pod_capacity_rps']
+        served = min(offered + self._backlog / self.action_interval, capacity)
+        # k6 users are closed-loop, so each has at most one request waiting
+        self._backlog = min(max(self._backlog + (offered - served) * self.action_interval, 0.0), users)
+        latency = p95_latency_ms(offered, serving, self._backlog, cfg)
+        latency = min(latency * self.np_random.lognormal(0.0, cfg['latency_noise']) + faults['latency_ms'],
+                      cfg['max_latency_ms'])
+        # Age starting pods; the oldest slot becomes ready
+        self._ready += self._starting[-1]
+        self._starting = [0] + self._starting[:-1]
+        running = self._replicas
+        cpu = running * (cfg['idle_cpu_percent'] + faults['cpu_percent_per_pod']) + served * cfg['cpu_percent_per_rps']
+        memory = (running * (cfg['pod_base_memory'] + faults['memory_per_pod']) + served * cfg['memory_per_rps'] +
+                  self._backlog * cfg['memory_per_queued_request'])
+        # Raw values as Prometheus would report them (served by benchmarks/local_stack)
+        self.metrics = {
+            'cpu_usage_percent': cpu,
+            'memory_bytes': memory,
+            'p95_latency_ms': latency,
+            'rps': served,
+            'replicas': self._replicas,
+        }
+        return StateBuilder.build_state(
+            cpu,
+            memory,
+            self._replicas,
+            latency,
+            min(served, self.max_observed_rps),
+            self.max_memory_per_pod
+        )
+
+    def _get_current_replicas(self) -> int:
+        """Get the current number of replicas for the simulated deployment."""
+        return self._replicas
+
+    def _get_annotations(self):
+        """Get the annotations of the simulated deployment."""
+        return self.annotations
+
+    def get_pod_history(self):
+        """Return the history of pod counts and steps for analysis."""
+        return self.steps, self.pod_counts
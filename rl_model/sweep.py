@@ -0,0 +1,312 @@
+"""
+Hyperparameter sweeps over TRAINING_CONFIG: many PPO trials in a process
+pool against the batched simulator, with pruning of poor trials and state
+on disk, so an interrupted sweep picks up where it stopped.
+
+    python -m rl_model.sweep rl_model/sweeps/ppo.yaml --name ppo-search
+    python -m rl_model.sweep --name ppo-search --summary
+
+The sweep directory (SWEEP_SETTINGS['sweeps_dir']/<name>) holds sweep.json
+with the settings and the configuration of every trial, fixed when the sweep
+is created, and one directory per trial with its latest checkpoint
+(model.zip) and status.json. Every trial is evaluated every eval_interval
+timesteps on the same seeded episodes and then checkpointed. After
+grace_evals evaluations, a trial is pruned when its best reward so far is below
+the median of the other trials' at the same evaluation (the median stopping
+rule), once at least min_trials_to_prune of them got there.
+Running the command again resumes running trials from their checkpoints and
+skips finished ones. results.csv has one row per trial, best first.
+"""
+import argparse
+import copy
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import yaml
+from .config import TRAINING_CONFIG, SWEEP_SETTINGS
+
+# TRAINING_CONFIG keys passed to PPO; other keys (e.g. history_window) configure the environment
+PPO_PARAMETERS = (
+    'learning_rate',
+    'n_steps',
+    'batch_size',
+    'n_epochs',
+    'gamma',
+    'gae_lambda',
+    'clip_range',
+    'ent_coef',
+    'vf_coef',
+    'max_grad_norm',
+    'target_kl',
+)
+RESULT_FIELDS = ('trial', 'status', 'timesteps', 'best_reward', 'last_reward', 'seconds')
+
+# TRAINING_CONFIG as imported, restored before every trial of a reused worker process
+_DEFAULT_TRAINING_CONFIG = copy.deepcopy(TRAINING_CONFIG)
+
+
+def sample_trials(spec):
+    """
+    The configurations of a sweep spec.
+    Args:
+        spec: Dict with 'parameters' (TRAINING_CONFIG key to a list of values or a
+            distribution), 'method' ('random' or 'grid'), and for random search
+            'trials' and 'seed'.
+    Returns:
+        List of dicts of TRAINING_CONFIG overrides.
+    Raises:
+        ValueError: For unknown keys or distributions.
+    """
+    parameters = spec.get('parameters') or {}
+    unknown = set(parameters) - set(TRAINING_CONFIG)
+    if unknown:
+        raise ValueError(f"Not TRAINING_CONFIG keys: {', '.join(sorted(unknown))}")
+    method = spec.get('method', 'random')
+    if method == 'grid':
+        if any(not isinstance(values, list) for values in parameters.values()):
+            raise ValueError("Grid sweeps only take lists of values")
+        names = list(parameters)
+        return [dict(zip(names, values)) for values in itertools.product(*parameters.values())]
+    if method != 'random':
+        raise ValueError(f"Unknown sweep method {method!r}")
+    rng = np.random.default_rng(spec.get('seed', 0))
+    trials = []
+    for _ in range(int(spec.get('trials', 10))):
+        config = {}
+        for name, values in parameters.items():
+            if isinstance(values, list):
+                value = values[rng.integers(len(values))]
+            elif 'uniform' in values:
+                value = float(rng.uniform(*values['uniform']))
+            elif 'log_uniform' in values:
+                low, high = np.log(values['log_uniform'])
+                value = float(np.exp(rng.uniform(low, high)))
+            elif 'int_uniform' in values:
+                low, high = values['int_uniform']
+                value = int(rng.integers(low, high + 1))
+            else:
+                raise ValueError(f"Unknown distribution for {name}: {values}")
+            config[name] = value.item() if isinstance(value, np.generic) else value
+        trials.append(config)
+    return trials
+
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    """Write a JSON file atomically, so an interrupted sweep never leaves a truncated one."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def should_prune(sweep_dir, trial, evals, settings):
+    """Median stopping rule: whether a trial's best reward after len(evals) evaluations is below the others' median."""
+    rung = len(evals)
+    if rung <= settings['grace_evals']:
+        return False
+    best = max(reward for _, reward in evals)
+    others = []
+    for name in os.listdir(sweep_dir):
+        status = read_json(os.path.join(sweep_dir, name, 'status.json'))
+        if name == trial or status is None or len(status['evals']) < rung:
+            continue
+        others.append(max(reward for _, reward in status['evals'][:rung]))
+    return len(others) >= settings['min_trials_to_prune'] and best < np.median(others)
+
+
+def run_trial(sweep_dir, trial, config, settings, use_wandb=False):
+    """
+    Train and evaluate one trial, resuming from its checkpoint if it has one.
+    Returns:
+        The trial's final status dict.
+    """
+    import torch
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.evaluation import evaluate_policy
+    from stable_baselines3.common.vec_env import VecMonitor
+    from .batch_env import BatchedSimulatedEnv
+
+    # Trials share the worker's cores with the other workers
+    torch.set_num_threads(1)
+    TRAINING_CONFIG.clear()
+    TRAINING_CONFIG.update(copy.deepcopy(_DEFAULT_TRAINING_CONFIG))
+    TRAINING_CONFIG.update(config)
+
+    trial_dir = os.path.join(sweep_dir, trial)
+    os.makedirs(trial_dir, exist_ok=True)
+    status_path = os.path.join(trial_dir, 'status.json')
+    model_path = os.path.join(trial_dir, 'model.zip')
+    status = read_json(status_path) or {'trial': trial, 'config': config, 'status': 'running', 'evals': [], 'seconds': 0.0}
+    if status['status'] != 'running':
+        return status
+
+    seed = settings.get('seed', 0) + int(trial.rsplit('-', 1)[-1])
+    env = BatchedSimulatedEnv(settings['n_envs'])
+    env.seed(seed + len(status['evals']))
+    env = VecMonitor(env)
+    eval_env = VecMonitor(BatchedSimulatedEnv(settings['n_eval_episodes']))
+    if status['evals'] and os.path.exists(model_path):
+        model = PPO.load(model_path, env=env, device='cpu')
+    else:
+        status['evals'] = []
+        model = PPO(
+            "MlpPolicy",
+            env,
+            seed=seed,
+            device='cpu',
+            **{name: TRAINING_CONFIG[name] for name in PPO_PARAMETERS if name in TRAINING_CONFIG}
+        )
+    run = None
+    if use_wandb:
+        import wandb
+        run = wandb.init(project="microservice-rl", group=os.path.basename(sweep_dir), name=trial,
+                         id=f"{os.path.basename(sweep_dir)}-{trial}", resume='allow', dir=trial_dir,
+                         config=TRAINING_CONFIG, reinit=True)
+
+    while model.num_timesteps < settings['total_timesteps'] and status['status'] == 'running':
+        start = time.perf_counter()
+        model.learn(settings['eval_interval'], reset_num_timesteps=False)
+        eval_env.seed(settings['eval_seed'])
+        reward, _ = evaluate_policy(model, eval_env, n_eval_episodes=settings['n_eval_episodes'], deterministic=True)
+        model.save(model_path)
+        status['evals'].append([model.num_timesteps, float(reward)])
+        status['seconds'] += time.perf_counter() - start
+        if model.num_timesteps >= settings['total_timesteps']:
+            status['status'] = 'completed'
+        elif should_prune(sweep_dir, trial, status['evals'], settings):
+            status['status'] = 'pruned'
+        write_json(status_path, status)
+        if run is not None:
+            run.log({'eval/mean_reward': reward}, step=model.num_timesteps)
+        print(f"{trial}: {model.num_timesteps} timesteps, eval reward {reward:.2f}"
+              f"{', pruned' if status['status'] == 'pruned' else ''}")
+    if run is not None:
+        run.finish()
+    env.close()
+    eval_env.close()
+    return status
+
+
+def summarize(sweep_dir):
+    """Write results.csv (one row per trial, best first) and return its rows."""
+    sweep = read_json(os.path.join(sweep_dir, 'sweep.json'))
+    parameters = sorted({name for config in sweep['trials'].values() for name in config})
+    rows = []
+    for trial, config in sweep['trials'].items():
+        status = read_json(os.path.join(sweep_dir, trial, 'status.json')) or {'status': 'pending', 'evals': []}
+        rewards = [reward for _, reward in status['evals']]
+        rows.append({
+            'trial': trial,
+            'status': status['status'],
+            'timesteps': status['evals'][-1][0] if status['evals'] else 0,
+            'best_reward': max(rewards) if rewards else None,
+            'last_reward': rewards[-1] if rewards else None,
+            'seconds': round(status.get('seconds', 0.0), 1),
+            **config,
+        })
+    rows.sort(key=lambda row: -np.inf if row['best_reward'] is None else row['best_reward'], reverse=True)
+    with open(os.path.join(sweep_dir, 'results.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(RESULT_FIELDS) + parameters)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def print_summary(rows):
+    print(f"{'trial':12} {'status':10} {'timesteps':>10} {'best':>9} {'last':>9}  parameters")
+    for row in rows:
+        best = '-' if row['best_reward'] is None else f"{row['best_reward']:.2f}"
+        last = '-' if row['last_reward'] is None else f"{row['last_reward']:.2f}"
+        parameters = ', '.join(f"{name}={value:.3g}" if isinstance(value, float) else f"{name}={value}"
+                               for name, value in row.items() if name not in RESULT_FIELDS)
+        print(f"{row['trial']:12} {row['status']:10} {row['timesteps']:>10} {best:>9} {last:>9}  {parameters}")
+
+
+def run_sweep(sweep_dir, spec=None, settings=None, workers=None, use_wandb=False):
+    """
+    Create a sweep from spec, or resume the one in sweep_dir, and run its unfinished trials.
+    Args:
+        sweep_dir: Directory of the sweep.
+        spec: Sweep spec (see sample_trials); ignored when the sweep already exists.
+        settings: Overrides of SWEEP_SETTINGS for a new sweep.
+        workers: Trials run in parallel, SWEEP_SETTINGS['workers'] by default.
+        use_wandb: Also log every trial to wandb.
+    Returns:
+        The rows of results.csv.
+    """
+    sweep_path = os.path.join(sweep_dir, 'sweep.json')
+    sweep = read_json(sweep_path)
+    if sweep is None:
+        if spec is None:
+            raise ValueError(f"No sweep in {sweep_dir}; pass a sweep spec to create one")
+        sweep = {
+            'spec': spec,
+            'settings': {**SWEEP_SETTINGS, **(settings or {})},
+            'trials': {f"trial-{i:03d}": config for i, config in enumerate(sample_trials(spec))},
+        }
+        os.makedirs(sweep_dir, exist_ok=True)
+        write_json(sweep_path, sweep)
+    elif spec is not None:
+        print(f"Resuming the existing sweep in {sweep_dir}; its stored spec and settings are used")
+    settings = sweep['settings']
+    pending = [trial for trial in sweep['trials']
+               if (read_json(os.path.join(sweep_dir, trial, 'status.json')) or {}).get('status', 'running') == 'running']
+    workers = workers or settings.get('workers') or os.cpu_count() or 1
+    print(f"{len(pending)} of {len(sweep['trials'])} trials to run with {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {trial: executor.submit(run_trial, sweep_dir, trial, sweep['trials'][trial], settings, use_wandb)
+                   for trial in pending}
+        for trial, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                # The trial stays 'running' and is retried when the sweep is resumed
+                print(f"{trial} failed: {e}")
+    return summarize(sweep_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run or resume a hyperparameter sweep on the batched simulator")
+    parser.add_argument("spec", nargs="?", help="Sweep spec (YAML or JSON); not needed to resume a sweep")
+    parser.add_argument("--name", help="Sweep name, defaults to the spec's file name")
+    parser.add_argument("--workers", type=int, help="Trials run in parallel, defaults to the number of cores")
+    parser.add_argument("--total-timesteps", type=int, help="Training timesteps per trial of a new sweep")
+    parser.add_argument("--eval-interval", type=int, help="Timesteps between evaluations of a new sweep")
+    parser.add_argument("--wandb", action="store_true", help="Also log every trial to wandb")
+    parser.add_argument("--summary", action="store_true", help="Only print the results of the sweep")
+    args = parser.parse_args()
+
+    if args.name is None and args.spec is None:
+        parser.error("Pass a sweep spec or --name")
+    name = args.name or os.path.splitext(os.path.basename(args.spec))[0]
+    sweep_dir = os.path.join(SWEEP_SETTINGS['sweeps_dir'], name)
+    if args.summary:
+        print_summary(summarize(sweep_dir))
+        return
+    spec = None
+    if args.spec:
+        with open(args.spec) as f:
+            spec = yaml.safe_load(f)
+    settings = {}
+    if args.total_timesteps:
+        settings['total_timesteps'] = args.total_timesteps
+    if args.eval_interval:
+        settings['eval_interval'] = args.eval_interval
+    rows = run_sweep(sweep_dir, spec, settings, args.workers, args.wandb)
+    print_summary(rows)
+    print(f"Results written to {os.path.join(sweep_dir, 'results.csv')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,20 @@
 import os
+import argparse
 import wandb
 from .env import MicroserviceEnv
+from .sim_env import SimulatedMicroserviceEnv
+from .batch_env import BatchedSimulatedEnv
+from .replay_env import ReplayEnv
 from stable_baselines3 import PPO
 from wandb.integration.sb3 import WandbCallback
-from stable_baselines3.common.vec_env import DummyVecEnv
-from stable_baselines3.common.monitor import Monitor
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecMonitor
+from stable_baselines3.common.env_util import make_vec_env
 from stable_baselines3.common.callbacks import EvalCallback
 
 from .callbacks import PodTrackingCallback
+from .checkpoint import CheckpointCallback, ResumablePPO, latest_checkpoint, load_checkpoint
+from .export import export_policy
+from .pretrain import load_demonstrations, pretrain_policy
 from .config import TRAINING_CONFIG, TRAINING_SETTINGS, PATHS
 
 def setup_directories():
@@ -17,19 +24,43 @@ def setup_directories():
             continue
         os.makedirs(path, exist_ok=True)
 
-def create_environment():
-    """Create and wrap the environment"""
-    env = MicroserviceEnv()
-    env = Monitor(env)
-    return DummyVecEnv([lambda: env])
-
-def create_callbacks(env, wandb_run):
+def create_environment(simulated=False, n_envs=1, seed=None, batched=False, trace_dir=None):
+    """
+    Create and wrap the environment.
+    With n_envs > 1 every environment runs in its own worker process and
+    worker i is seeded with seed + i. With batched=True all n_envs simulated
+    deployments are stepped together as numpy arrays in this process.
+    With trace_dir set, the environments replay that recorded trace.
+    """
+    if batched:
+        env = BatchedSimulatedEnv(n_envs)
+        env.seed(seed)
+        return VecMonitor(env)
+    env_kwargs = None
+    if trace_dir:
+        env_cls = ReplayEnv
+        env_kwargs = dict(trace_dir=trace_dir)
+    else:
+        env_cls = SimulatedMicroserviceEnv if simulated else MicroserviceEnv
+    if n_envs > 1:
+        return make_vec_env(
+            env_cls,
+            n_envs=n_envs,
+            seed=seed,
+            env_kwargs=env_kwargs,
+            vec_env_cls=SubprocVecEnv,
+            vec_env_kwargs=dict(start_method=TRAINING_SETTINGS["vec_env_start_method"]),
+        )
+    return make_vec_env(env_cls, n_envs=1, seed=seed, env_kwargs=env_kwargs, vec_env_cls=DummyVecEnv)
+
+def create_callbacks(env, wandb_run, n_envs=1):
     """Create all necessary callbacks"""
+    # EvalCallback counts calls, and each call advances all n_envs environments
     eval_callback = EvalCallback(
         env,
         best_model_save_path=PATHS["best_model_dir"],
         log_path=PATHS["logs_dir"],
-        eval_freq=TRAINING_SETTINGS["eval_freq"],
+        eval_freq=max(TRAINING_SETTINGS["eval_freq"] // n_envs, 1),
         deterministic=True,
         render=False,
         n_eval_episodes=TRAINING_SETTINGS["n_eval_episodes"],
@@ -43,58 +74,140 @@ def create_callbacks(env, wandb_run):
 
     pod_callback = PodTrackingCallback()
 
-    return [eval_callback, wandb_callback, pod_callback]
+    # Checkpoints carry the evaluation and pod histories, so a resumed run continues them
+    checkpoint_callback = CheckpointCallback(
+        PATHS["checkpoints_dir"],
+        checkpoint_freq=TRAINING_SETTINGS["checkpoint_freq"],
+        checkpoint_interval=TRAINING_SETTINGS["checkpoint_interval"],
+        keep=TRAINING_SETTINGS["keep_checkpoints"],
+        callbacks=[eval_callback, pod_callback],
+        wandb_run_id=wandb_run.id,
+    )
+
+    return [eval_callback, wandb_callback, pod_callback, checkpoint_callback]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the PPO autoscaling agent")
+    parser.add_argument(
+        "--simulated",
+        action="store_true",
+        help="Train against the simulated deployment instead of a live cluster",
+    )
+    parser.add_argument(
+        "--batched",
+        action="store_true",
+        help="Step all n_envs simulated deployments as one numpy batch (implies --simulated)",
+    )
+    parser.add_argument(
+        "--replay-trace",
+        metavar="TRACE_DIR",
+        help="Train against a trace recorded with TRAINING_CONFIG['trace_dir'] or the suggestion server's TRACE_DIR, or built with rl_model.build_dataset",
+    )
+    parser.add_argument(
+        "--pretrain",
+        nargs="+",
+        metavar="TRACE_DIR",
+        help="Warm-start the policy by behavior cloning on these traces (see PRETRAIN_CONFIG) before PPO",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume from the latest checkpoint in PATHS['checkpoints_dir'] (a new run if there is none)",
+    )
+    return parser.parse_args()
 
 def main():
-    # Initialize wandb
+    args = parse_args()
+    checkpoint = latest_checkpoint(PATHS["checkpoints_dir"]) if args.resume else None
+    if args.resume and checkpoint is None:
+        print(f"No checkpoint in '{PATHS['checkpoints_dir']}', starting a new run")
+
+    # Initialize wandb, continuing the checkpointed run when resuming
     wandb.init(
         project="microservice-rl",
         dir=PATHS["results_dir"],
-        config=TRAINING_CONFIG
+        config=TRAINING_CONFIG,
+        id=checkpoint['wandb_run_id'] if checkpoint else None,
+        resume="allow" if checkpoint else None,
     )
 
     # Setup directories
     setup_directories()
 
     # Create environments
-    env = create_environment()
-    eval_env = create_environment()
-
-    # Create callbacks
-    callbacks = create_callbacks(eval_env, wandb.run)
-
-    # Initialize the model
-    model = PPO(
-        "MlpPolicy",
-        env,
-        learning_rate=wandb.config.learning_rate,
-        n_steps=wandb.config.n_steps,
-        batch_size=wandb.config.batch_size,
-        n_epochs=wandb.config.n_epochs,
-        gamma=wandb.config.gamma,
-        gae_lambda=wandb.config.gae_lambda,
-        clip_range=wandb.config.clip_range,
-        ent_coef=wandb.config.ent_coef,
-        verbose=1,
-        tensorboard_log=PATHS["tensorboard_dir"],
-        device='cpu'  # Force CPU usage to avoid CUDA warning
+    n_envs = TRAINING_SETTINGS["n_envs"]
+    seed = TRAINING_SETTINGS["seed"]
+    simulated = args.simulated or args.batched
+    env = create_environment(simulated, n_envs, seed, args.batched, args.replay_trace)
+    eval_env = create_environment(
+        simulated,
+        TRAINING_SETTINGS["n_eval_envs"],
+        None if seed is None else seed + n_envs,
+        args.batched,
+        args.replay_trace,
     )
 
-    # Train the model
+    # Create callbacks
+    callbacks = create_callbacks(eval_env, wandb.run, n_envs)
+
+    if checkpoint:
+        model, env = load_checkpoint(checkpoint, env, callbacks, tensorboard_log=PATHS["tensorboard_dir"])
+    else:
+        # Initialize the model
+        model = ResumablePPO(
+            "MlpPolicy",
+            env,
+            learning_rate=wandb.config.learning_rate,
+            n_steps=wandb.config.n_steps,
+            batch_size=wandb.config.batch_size,
+            n_epochs=wandb.config.n_epochs,
+            gamma=wandb.config.gamma,
+            gae_lambda=wandb.config.gae_lambda,
+            clip_range=wandb.config.clip_range,
+            ent_coef=wandb.config.ent_coef,
+            verbose=1,
+            tensorboard_log=PATHS["tensorboard_dir"],
+            seed=seed,
+            device='cpu'  # Force CPU usage to avoid CUDA warning
+        )
+
+        # Fit the policy to recorded decisions, so PPO fine-tunes instead of starting from random
+        if args.pretrain:
+            demonstrations = load_demonstrations(args.pretrain, model.gamma)
+            pretrain_metrics = pretrain_policy(model, demonstrations, seed=seed)
+            wandb.log({f"pretrain/{name}": value for name, value in pretrain_metrics.items()})
+
+    # Train the model (only the remaining timesteps when resuming)
     model.learn(
-        total_timesteps=TRAINING_SETTINGS["total_timesteps"],
+        total_timesteps=max(TRAINING_SETTINGS["total_timesteps"] - model.num_timesteps, 0),
         callback=callbacks,
-        progress_bar=True
+        progress_bar=True,
+        reset_num_timesteps=checkpoint is None,
     )
+    checkpoint_callback = next(cb for cb in callbacks if isinstance(cb, CheckpointCallback))
+    if checkpoint_callback.preempted:
+        # Rerun with --resume to continue from the checkpoint just written
+        print("Training stopped by SIGTERM, resume with --resume")
+        env.close()
+        eval_env.close()
+        wandb.finish()
+        return
     print("Training done!")
 
-    # Save the final model
+    # Save the final model, plus a numpy export for the model server
     model.save("final_model.zip")
+    export_policy(model, "final_model.npz")
+    best_model_path = os.path.join(PATHS["best_model_dir"], "best_model.zip")
+    if os.path.exists(best_model_path):
+        export_policy(PPO.load(best_model_path, device='cpu'), os.path.join(PATHS["best_model_dir"], "best_model.npz"))
 
     # Plot pod scaling history
     pod_callback = next(cb for cb in callbacks if isinstance(cb, PodTrackingCallback))
     pod_callback.plot_pod_history(PATHS["pod_history_plot"])
 
+    env.close()
+    eval_env.close()
+
     # Close wandb
     wandb.finish()
 
@@ -1,50 +1,368 @@
-import requests
-from flask import Flask, request, jsonify
+import asyncio
+import aiohttp
+from quart import Quart, request, jsonify
 import datetime
 import os
-from utils.prometheus_client import PrometheusClient
+import time
+import atexit
+import contextvars
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from utils.prometheus_client import AsyncPrometheusClient, series_selectors, staleness
 from utils.k8s_client import K8sClient
+from utils.trace_recorder import TraceRecorder, trace_directory
+from utils.ttl_cache import AsyncTTLCache, LRUCache
+from utils.history_features import HistoryFeatures
+from utils.forecaster import HoltWintersForecaster
+from utils.instrumentation import (
+    TRACE_HEADER, DECISIONS, ERRORS, PROMETHEUS_QUERY_SECONDS,
+    current_trace_id, mark_worker_dead, metrics_payload, observe, start_trace, timed
+)
 import logging
 
 logging.basicConfig(level=logging.INFO)
-app = Flask(__name__)
+app = Quart(__name__)
 
 # Configuration
 RL_API_URL = os.getenv('RL_API_URL', 'http://model-service:8000/predict') 
+# Upper bound on the time spent answering one /suggestion request
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('REQUEST_TIMEOUT_SECONDS', 10))
+# Per-call timeouts for the model server and the Kubernetes API
+RL_API_TIMEOUT_SECONDS = float(os.getenv('RL_API_TIMEOUT_SECONDS', 2))
+K8S_TIMEOUT_SECONDS = float(os.getenv('K8S_TIMEOUT_SECONDS', 5))
+# Threads running the blocking Kubernetes client calls; a call that outlives its timeout keeps
+# its thread until it returns, so this also bounds how many such calls can pile up
+K8S_THREADS = int(os.getenv('K8S_THREADS', 32))
+# Maximum number of open connections to Prometheus and to the model server
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 100))
+# When set, every served suggestion is recorded under TRACE_DIR/<namespace>/<deployment>
+TRACE_DIR = os.getenv('TRACE_DIR')
 
+# Metrics are reused for this long; align with the Prometheus scrape interval
+METRICS_CACHE_TTL_SECONDS = float(os.getenv('METRICS_CACHE_TTL_SECONDS', 15))
+# Number of (namespace, deployment) entries kept before evicting the least recently used
+METRICS_CACHE_MAX_ENTRIES = int(os.getenv('METRICS_CACHE_MAX_ENTRIES', 1024))
 
-def fetch_prometheus_metrics(deployment, namespace):
-    """Fetch metrics from Prometheus using PrometheusClient and add current replicas from Kubernetes"""
-    # Prometheus queries
-    PROM_QUERIES = {
+# Samples of RPS/latency history per deployment behind the trend features sent to the model
+# (utils/history_features.py); 0 disables them. Set it to the history_window the model was trained
+# with, and METRICS_CACHE_TTL_SECONDS to its action_interval, since the history advances once per
+# fetched sample. Histories are kept per worker process.
+HISTORY_WINDOW = int(os.getenv('HISTORY_WINDOW', 0))
+HISTORY_EWMA_ALPHA = float(os.getenv('HISTORY_EWMA_ALPHA', 0.3))
+# RPS/latency forecasts (utils/forecaster.py), served on /forecast and sent to the model as its
+# 'forecast' features FORECAST_HORIZON steps ahead; 0 disables forecasting. The forecasters advance
+# one step every FORECAST_STEP_SECONDS; set it to the action_interval the model was trained with.
+FORECAST_HORIZON = int(os.getenv('FORECAST_HORIZON', 0))
+FORECAST_STEP_SECONDS = float(os.getenv('FORECAST_STEP_SECONDS', 30))
+# Steps per load season (one day of 30s steps), 0 for trend only
+FORECAST_SEASON_LENGTH = int(os.getenv('FORECAST_SEASON_LENGTH', 2880))
+# Most steps ahead /forecast answers for
+FORECAST_MAX_STEPS = int(os.getenv('FORECAST_MAX_STEPS', 2880))
+# Seconds of Prometheus history a new forecaster learns from
+FORECAST_BOOTSTRAP_SECONDS = float(os.getenv('FORECAST_BOOTSTRAP_SECONDS', 86400))
+# When set, forecasters are saved here every FORECAST_SAVE_INTERVAL_SECONDS and on shutdown,
+# and restored instead of relearnt after a restart
+FORECAST_STATE_DIR = os.getenv('FORECAST_STATE_DIR')
+FORECAST_SAVE_INTERVAL_SECONDS = float(os.getenv('FORECAST_SAVE_INTERVAL_SECONDS', 300))
+
+# One client per process so its keep-alive connection pool is shared by all requests
+prom_client = AsyncPrometheusClient(pool_size=HTTP_POOL_SIZE)
+metrics_cache = AsyncTTLCache(METRICS_CACHE_TTL_SECONDS, METRICS_CACHE_MAX_ENTRIES)
+# Evicted clients release their namespace's informer
+k8s_clients = LRUCache(METRICS_CACHE_MAX_ENTRIES, on_evict=lambda k8s_client: k8s_client.close())
+k8s_executor = ThreadPoolExecutor(max_workers=K8S_THREADS, thread_name_prefix='k8s')
+# Evicted entries start over (forecasters from their last save in FORECAST_STATE_DIR)
+histories = LRUCache(METRICS_CACHE_MAX_ENTRIES)
+forecasters = LRUCache(METRICS_CACHE_MAX_ENTRIES)  # (namespace, deployment) -> [forecaster, index of the step of its last update]
+forecaster_loads = {}  # (namespace, deployment) -> Task restoring or bootstrapping its forecaster
+forecast_saver = None
+# Pooled session to the model server, opened when the app starts serving
+rl_session = None
+
+trace_recorders = {}
+trace_recorders_lock = threading.Lock()
+
+# Namespaces and deployment names are DNS-1123 labels; anything else is rejected before it
+# reaches a Prometheus query, the Kubernetes API or a file path
+NAME_PATTERN = re.compile(r'[a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?')
+
+
+def invalid_names(deployment, namespace):
+    """An error response if deployment or namespace is not a DNS-1123 label, else None"""
+    for field, name in (('deployment', deployment), ('namespace', namespace)):
+        if not NAME_PATTERN.fullmatch(name):
+            return jsonify({"error": f"{field} must be a DNS-1123 label: at most 63 lowercase alphanumerics or '-'"}), 400
+    return None
+
+
+def record_trace(deployment, namespace, metrics, action, annotations=None):
+    """Append the metrics of a served suggestion, the chosen action and the latency constraints to the deployment's trace"""
+    key = (namespace, deployment)
+    with trace_recorders_lock:
+        recorder = trace_recorders.get(key)
+        if recorder is None:
+            recorder = TraceRecorder(trace_directory(TRACE_DIR, namespace, deployment))
+            trace_recorders[key] = recorder
+    recorder.record(
+        cpu_usage_percent=metrics['cpu_usage'] * 100,  # the cpu query returns cores
+        memory_bytes=metrics['memory_usage'],
+        replicas=metrics['replicas'],
+        p95_latency_ms=metrics['latency'],
+        rps=metrics['rps'],
+        action=action,
+        annotations=annotations
+    )
+
+
+@atexit.register
+def flush_traces():
+    for recorder in trace_recorders.values():
+        recorder.close()
+
+
+@app.before_serving
+async def open_sessions():
+    global rl_session, forecast_saver
+    rl_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE),
+        timeout=aiohttp.ClientTimeout(total=RL_API_TIMEOUT_SECONDS),
+    )
+    if FORECAST_HORIZON and FORECAST_STATE_DIR:
+        forecast_saver = asyncio.create_task(save_forecasters_periodically())
+
+
+@app.after_serving
+async def close_sessions():
+    if forecast_saver is not None:
+        forecast_saver.cancel()
+        save_forecasters()
+    await rl_session.close()
+    await prom_client.close()
+    # Hypercorn has no hook for exited workers; each worker cleans up after itself
+    mark_worker_dead(os.getpid())
+
+
+async def get_metrics(deployment, namespace):
+    """
+    Metrics for a deployment from the process-wide cache.
+    Concurrent requests for the same deployment share a single fetch.
+    """
+    with timed('metrics_fetch'):
+        metrics = await metrics_cache.get_or_load(
+            (namespace, deployment),
+            lambda: fetch_prometheus_metrics(deployment=deployment, namespace=namespace)
+        )
+    return dict(metrics) if metrics else metrics
+
+async def run_k8s(function, *args):
+    """Run a blocking Kubernetes client call on k8s_executor, keeping the trace ID, with K8S_TIMEOUT_SECONDS"""
+    context = contextvars.copy_context()
+    future = asyncio.get_running_loop().run_in_executor(k8s_executor, context.run, function, *args)
+    return await asyncio.wait_for(future, K8S_TIMEOUT_SECONDS)
+
+async def fetch_current_replicas(deployment, namespace):
+    """Read the replica count; the Kubernetes client is blocking, so it runs in a worker thread"""
+    k8s_client = k8s_clients.get((namespace, deployment))
+    if k8s_client is None:
+        k8s_client = K8sClient(deployment_name=deployment, namespace=namespace)
+        k8s_clients[(namespace, deployment)] = k8s_client
+    return await run_k8s(k8s_client.get_current_replicas)
+
+async def fetch_annotations(deployment, namespace):
+    """The deployment's annotations from the informer cache, {} if they cannot be read"""
+    k8s_client = k8s_clients.get((namespace, deployment))
+    if k8s_client is None:
+        return {}
+    try:
+        return await run_k8s(k8s_client.get_annotations)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logging.info(f"Error fetching annotations from Kubernetes: {e!r}")
+        return {}
+
+def prometheus_queries(deployment, namespace):
+    """Prometheus queries of the metrics of a deployment"""
+    return {
     'cpu_usage': f'sum(rate(container_cpu_usage_seconds_total{{namespace="{namespace}", pod=~"{deployment}-.*"}}[1m]))',
     'memory_usage': f'sum(container_memory_usage_bytes{{namespace="{namespace}", pod=~"{deployment}-.*"}})',
     'latency': f'histogram_quantile(0.95, sum(rate(istio_request_duration_milliseconds_bucket{{reporter="destination", destination_workload="{deployment}"}}[5m])) by (le))',
     'rps': f'sum(rate(istio_requests_total{{reporter="destination", destination_workload="{deployment}"}}[1m]))'
     }
+
+async def fetch_prometheus_metrics(deployment, namespace):
+    """Fetch metrics from Prometheus and current replicas from Kubernetes, all concurrently"""
     metrics = {}
-    prom_client = PrometheusClient()
-    for name, query in PROM_QUERIES.items():
-        value = prom_client.query(query)
-        metrics[name] = value
+    queries = prometheus_queries(deployment, namespace)
+    results, replicas = await asyncio.gather(
+        prom_client.query_many(queries, series_selectors(queries)),
+        fetch_current_replicas(deployment, namespace),
+        return_exceptions=True
+    )
+    if isinstance(results, BaseException):
+        raise results
+    for name, result in results.items():
+        observe(PROMETHEUS_QUERY_SECONDS.labels(name, result.status), result.latency)
+    for name, result in results.items():
+        if result.status == 'error':
+            ERRORS.labels('prometheus_query').inc()
+            logging.error(f"Prometheus query for {name} failed: {result.error}")
+            return None
+        # 'no_data' means the series is absent (e.g. no traffic yet), which reads as 0
+        metrics[name] = result.value
+    logging.info(f"[trace {current_trace_id.get()}] Prometheus fetch: " + ", ".join(
+        f"{name}={result.status} in {result.latency * 1000:.1f}ms" +
+        (f" ({staleness(result):.0f}s old)" if result.timestamp is not None else "")
+        for name, result in results.items()
+    ))
     # Add current replicas from Kubernetes
+    if isinstance(replicas, BaseException):
+        if isinstance(replicas, asyncio.TimeoutError):
+            ERRORS.labels('replica_read').inc()  # errors inside the client are counted by the client
+        logging.info(f"Error fetching replicas from Kubernetes: {replicas!r}")
+        replicas = None
+    metrics['replicas'] = replicas
+    # Histories and forecasters are only kept for deployments that exist
+    if replicas is None:
+        return metrics
+    if HISTORY_WINDOW:
+        metrics['history'] = update_history(deployment, namespace, metrics)
+    if FORECAST_HORIZON:
+        metrics['forecast'] = await update_forecast(deployment, namespace, metrics)
+    return metrics
+
+def update_history(deployment, namespace, metrics):
+    """Add a fresh sample to the deployment's history and return its trend features"""
+    history = histories.get((namespace, deployment))
+    if history is None:
+        history = HistoryFeatures(HISTORY_WINDOW, HISTORY_EWMA_ALPHA)
+        histories[(namespace, deployment)] = history
+    return history.update_samples((metrics['rps'], metrics['latency'])).tolist()
+
+async def update_forecast(deployment, namespace, metrics):
+    """Add the sample of the current step to the deployment's forecaster and return its 'forecast' features"""
+    entry = await get_forecaster(deployment, namespace)
+    forecaster, last_step = entry
+    step = int(time.time() // FORECAST_STEP_SECONDS)
+    if step > last_step:
+        if last_step >= 0 and step - last_step > 1:
+            forecaster.advance(step - last_step - 1)
+        forecaster.update_samples((metrics['rps'], metrics['latency']))
+        entry[1] = step
+    return forecaster.forecast(FORECAST_HORIZON).tolist()
+
+def forecast_state_path(deployment, namespace):
+    return os.path.join(FORECAST_STATE_DIR, namespace, f'{deployment}.npz')
+
+async def get_forecaster(deployment, namespace):
+    """
+    The forecaster of a deployment, restored from FORECAST_STATE_DIR or learnt from Prometheus history on first use.
+    Concurrent first requests share one load, which runs as its own task so a cancelled request does not cancel it.
+    """
+    key = (namespace, deployment)
+    entry = forecasters.get(key)
+    if entry is not None:
+        return entry
+    task = forecaster_loads.get(key)
+    if task is None:
+        task = asyncio.ensure_future(load_forecaster(deployment, namespace))
+        forecaster_loads[key] = task
+        task.add_done_callback(lambda _: forecaster_loads.pop(key, None))
+    return await asyncio.shield(task)
+
+async def load_forecaster(deployment, namespace):
+    forecaster = HoltWintersForecaster(FORECAST_SEASON_LENGTH)
+    last_step = -1
+    if FORECAST_STATE_DIR and os.path.exists(forecast_state_path(deployment, namespace)):
+        try:
+            last_step = forecaster.load(forecast_state_path(deployment, namespace))
+        except (OSError, KeyError, ValueError) as e:
+            logging.error(f"Could not restore the forecaster of {namespace}/{deployment}: {e}")
+            forecaster.reset()
+    if last_step < 0:
+        last_step = await bootstrap_forecaster(forecaster, deployment, namespace)
+    entry = forecasters[(namespace, deployment)] = [forecaster, last_step]
+    return entry
+
+async def bootstrap_forecaster(forecaster, deployment, namespace):
+    """
+    Feed a new forecaster the last FORECAST_BOOTSTRAP_SECONDS of RPS and latency from Prometheus.
+    Returns the index of the step of the last sample, -1 without history.
+    """
+    queries = prometheus_queries(deployment, namespace)
+    last_step = int(time.time() // FORECAST_STEP_SECONDS)
+    first_step = last_step - int(FORECAST_BOOTSTRAP_SECONDS // FORECAST_STEP_SECONDS)
+    start, end = first_step * FORECAST_STEP_SECONDS, last_step * FORECAST_STEP_SECONDS
     try:
-        k8s_client = K8sClient(deployment_name=deployment, namespace=namespace)
-        metrics['replicas'] = k8s_client.get_current_replicas()
+        with timed('forecast_bootstrap'):
+            series = await asyncio.gather(*(
+                prom_client.query_range(queries[name], start, end, FORECAST_STEP_SECONDS) for name in ('rps', 'latency')
+            ))
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        logging.info(f"Error fetching replicas from Kubernetes: {str(e)}")
-        metrics['replicas'] = None
-    return metrics
+        ERRORS.labels('forecast_bootstrap').inc()
+        logging.error(f"Could not load the history of {namespace}/{deployment} for forecasting: {e}")
+        return -1
+    # Steps without a sample (no traffic) read as 0
+    values = np.zeros((2, last_step - first_step + 1))
+    observed = np.zeros(values.shape[1], dtype=bool)
+    for i, (timestamps, samples) in enumerate(series):
+        steps = np.rint(timestamps / FORECAST_STEP_SECONDS).astype(np.int64) - first_step
+        values[i, steps] = samples
+        observed[steps] = True
+    if not observed.any():
+        return -1
+    for samples in values[:, np.argmax(observed):].T:
+        forecaster.update_samples(samples)
+    logging.info(f"Forecaster of {namespace}/{deployment} learnt from {observed.sum()} steps of history")
+    return last_step
+
+def save_forecasters():
+    for (namespace, deployment), (forecaster, last_step) in list(forecasters.items()):
+        path = forecast_state_path(deployment, namespace)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            forecaster.save(path, last_step)
+        except OSError as e:
+            logging.error(f"Could not save the forecaster of {namespace}/{deployment}: {e}")
 
-def get_rl_prediction(metrics):
+async def save_forecasters_periodically():
+    while True:
+        await asyncio.sleep(FORECAST_SAVE_INTERVAL_SECONDS)
+        await asyncio.to_thread(save_forecasters)
+
+async def get_rl_prediction(metrics):
     """Get prediction from RL model API"""
     try:
-        response = requests.post(RL_API_URL, json=metrics)
-        response.raise_for_status()
-        return response.json()
+        with timed('model_request'):
+            async with rl_session.post(RL_API_URL, json=metrics, headers={TRACE_HEADER: current_trace_id.get()}) as response:
+                response.raise_for_status()
+                return await response.json()
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        print(f"RL API error : {str(e)}")
-    return {'action': 0}
+        logging.error(f"RL API error : {e!r}")
+    # Keep the current replica count when no prediction is available
+    return {'action': 1}
+
+async def suggest(deployment, namespace):
+    """Fetch the metrics of a deployment and ask the RL model for an action"""
+    # 1. Fetch metrics from Prometheus
+    metrics = await get_metrics(deployment=deployment, namespace=namespace)
+    if not metrics:
+        return None
+    # 2. Get prediction from RL model
+    action = (await get_rl_prediction(metrics)).get('action')
+    DECISIONS.labels(action).inc()
+    logging.info(f"[trace {current_trace_id.get()}] Action: {action}, Replicas: {metrics['replicas']}, Latency: {metrics['latency']}, RPS: {metrics['rps']}")
+    if TRACE_DIR:
+        annotations = await fetch_annotations(deployment, namespace)
+        # Every chunk_size-th row compresses a chunk to disk; keep that off the event loop
+        await asyncio.to_thread(record_trace, deployment, namespace, metrics, action, annotations)
+    return action
 
 # Main endpoint for scaling recommendation
 @app.route('/suggestion', methods=['GET'])
@@ -55,24 +373,87 @@ async def get_suggestion():
         namespace = request.args.get('namespace', 'default')
     except KeyError as e:
         return jsonify({"error": f"Missing required query parameter: {e}"}), 400
+    error = invalid_names(deployment, namespace)
+    if error:
+        return error
+    # Continue the autoscaler's trace, or start one for direct callers
+    trace_id = start_trace(request.headers.get(TRACE_HEADER))
+    headers = {TRACE_HEADER: trace_id}
 
-    # 1. Fetch metrics from Prometheus
-    metrics = fetch_prometheus_metrics(deployment=deployment, namespace=namespace)
-    if not metrics:
+    try:
+        with timed('suggestion'):
+            action = await asyncio.wait_for(suggest(deployment, namespace), REQUEST_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return jsonify({
+            "status": "error",
+            "message": f"Suggestion timed out after {REQUEST_TIMEOUT_SECONDS}s"
+        }), 504, headers
+    if action is None:
         return jsonify({
             "status": "error",
             "message": "Failed to fetch metrics from Prometheus"
-        }), 500
-    # 2. Get prediction from RL model
-    action = get_rl_prediction(metrics).get('action')
-    logging.info(f"Action: {action}, Replicas: {metrics['replicas']}, Latency: {metrics['latency']}, RPS: {metrics['rps']}")
-    
+        }), 500, headers
+
     # 3. return suggested action
-    return {'action': action}
+    return {'action': action}, 200, headers
+
+# RPS and p95 latency forecasts for the next steps of a deployment
+@app.route('/forecast', methods=['GET'])
+async def get_forecast():
+    if not FORECAST_HORIZON:
+        return jsonify({"error": "Forecasting is disabled (set FORECAST_HORIZON)"}), 404
+    try:
+        deployment = request.args['deployment']
+        namespace = request.args.get('namespace', 'default')
+        steps = int(request.args.get('steps', FORECAST_HORIZON))
+    except KeyError as e:
+        return jsonify({"error": f"Missing required query parameter: {e}"}), 400
+    except ValueError:
+        return jsonify({"error": "steps must be an integer"}), 400
+    if not 1 <= steps <= FORECAST_MAX_STEPS:
+        return jsonify({"error": f"steps must be between 1 and {FORECAST_MAX_STEPS}"}), 400
+    error = invalid_names(deployment, namespace)
+    if error:
+        return error
+    trace_id = start_trace(request.headers.get(TRACE_HEADER))
+    headers = {TRACE_HEADER: trace_id}
+
+    try:
+        with timed('forecast'):
+            # Fetching the metrics also brings the forecaster up to date
+            metrics = await asyncio.wait_for(get_metrics(deployment, namespace), REQUEST_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return jsonify({
+            "status": "error",
+            "message": f"Forecast timed out after {REQUEST_TIMEOUT_SECONDS}s"
+        }), 504, headers
+    entry = forecasters.get((namespace, deployment))
+    if not metrics or entry is None:
+        return jsonify({
+            "status": "error",
+            "message": "Failed to fetch metrics from Prometheus"
+        }), 500, headers
+
+    forecaster, last_step = entry
+    forecasts = forecaster.forecast(np.arange(1, steps + 1))
+    return {
+        'deployment': deployment,
+        'namespace': namespace,
+        'step_seconds': FORECAST_STEP_SECONDS,
+        'timestamps': [(last_step + i) * FORECAST_STEP_SECONDS for i in range(1, steps + 1)],
+        'rps': forecasts[:, 0].tolist(),
+        'latency': forecasts[:, 1].tolist(),
+    }, 200, headers
+
+# Prometheus metrics of this service
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    body, content_type = metrics_payload(request.headers.get('Accept'))
+    return body, 200, {'Content-Type': content_type}
 
 # Health check endpoint
 @app.route('/health', methods=['GET'])
-def health_check():
+async def health_check():
     return jsonify({
         "status": "healthy",
         "timestamp": datetime.datetime.utcnow().isoformat()
@@ -80,5 +461,5 @@ def health_check():
     
 
 if __name__ == '__main__':
-    # This block is for local testing. In production, Gunicorn runs the app.
+    # This block is for local testing. In production, Hypercorn runs the app.
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+# Namespaces informers may watch, comma-separated; defaults to WATCH_NAMESPACE, the namespace
+# the RBAC Role grants list/watch on. Deployments elsewhere are read from the API server.
+INFORMER_NAMESPACES = frozenset(
+    namespace.strip()
+    for namespace in os.getenv('INFORMER_NAMESPACES', os.getenv('WATCH_NAMESPACE', 'default')).split(',')
+    if namespace.strip()
+)
+
+_informers = {}  # namespace -> [informer, number of holders]
+_informers_lock = threading.Lock()
+
+
+def get_informer(apps_api, namespace):
+    """
+    Return the process-wide informer of a namespace, starting it on first use.
+    Every call that returns an informer must be matched by release_informer.
+    Returns:
+        The informer, or None for namespaces outside INFORMER_NAMESPACES.
+    """
+    if namespace not in INFORMER_NAMESPACES:
+        return None
+    with _informers_lock:
+        entry = _informers.get(namespace)
+        if entry is None:
+            entry = _informers[namespace] = [DeploymentInformer(apps_api, namespace).start(), 0]
+        entry[1] += 1
+        return entry[0]
+
+
+def release_informer(namespace):
+    """Drop one holder of a namespace's informer; the last one stops it."""
+    with _informers_lock:
+        entry = _informers.get(namespace)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del _informers[namespace]
+            entry[0].stop()
+
+
+def parse_label_selector(selector):
+    """
+    Parse an equality-based label selector ("a=b,c!=d,e,!f").
+    Returns:
+        List of (key, operator, value) with operator one of '=', '!=', 'exists', '!exists'.
+    """
+    requirements = []
+    for term in (selector or '').split(','):
+        term = term.strip()
+        if not term:
+            continue
+        if '!=' in term:
+            key, value = term.split('!=', 1)
+            requirements.append((key.strip(), '!=', value.strip()))
+        elif '=' in term:
+            key, value = term.replace('==', '=').split('=', 1)
+            requirements.append((key.strip(), '=', value.strip()))
+        elif term.startswith('!'):
+            requirements.append((term[1:].strip(), '!exists', None))
+        elif ' ' in term or '(' in term:
+            raise ValueError(f"Unsupported label selector term: '{term}'")
+        else:
+            requirements.append((term, 'exists', None))
+    return requirements
+
+
+def matches(labels, requirements):
+    labels = labels or {}
+    for key, operator, value in requirements:
+        if operator == '=' and labels.get(key) != value:
+            return False
+        if operator == '!=' and labels.get(key) == value:
+            return False
+        if operator == 'exists' and key not in labels:
+            return False
+        if operator == '!exists' and key in labels:
+            return False
+    return True
+
+
+class DeploymentInformer:
+    """
+    Keeps an in-memory copy of the deployments of a namespace.
+    A background thread lists the deployments once, then follows a watch from
+    the listed resource version and relists after 410 Gone, on watch errors and
+    every resync_period seconds. Reads are served from the cache, indexed by name
+    and by label, so they cost no API-server round trip. The cache is eventually
+    consistent: a change shows up as soon as its watch event arrives.
+    """
+    def __init__(self, apps_api, namespace, resync_period=300, watch_timeout=60):
+        self.apps_api = apps_api
+        self.namespace = namespace
+        self.resync_period = resync_period
+        self.watch_timeout = watch_timeout
+        self._deployments = {}  # name -> V1Deployment
+        self._by_label = {}  # "key=value" -> set of names
+        self._resource_version = None
+        self._synced = False
+        self._changed = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'informer-{self.namespace}', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def has_synced(self):
+        return self._synced
+
+    def wait_for_sync(self, timeout=None):
+        """Block until the first list has been loaded; returns whether it was."""
+        with self._changed:
+            return self._changed.wait_for(self.has_synced, timeout)
+
+    def get(self, name):
+        """The cached deployment, or None if it does not exist (or the cache has not synced)."""
+        with self._changed:
+            return self._deployments.get(name)
+
+    def list(self, label_selector=None):
+        """Cached deployments matching an equality-based label selector, sorted by name."""
+        requirements = parse_label_selector(label_selector)
+        with self._changed:
+            names = None
+            for key, operator, value in requirements:
+                if operator == '=':
+                    indexed = self._by_label.get(f'{key}={value}', set())
+                    names = indexed if names is None else names & indexed
+            if names is None:
+                names = self._deployments.keys()
+            deployments = [self._deployments[name] for name in sorted(names)]
+        return [d for d in deployments if matches(d.metadata.labels, requirements)]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._list()
+                next_resync = time.monotonic() + self.resync_period
+                while not self._stopped.is_set() and time.monotonic() < next_resync:
+                    self._watch(min(self.watch_timeout, next_resync - time.monotonic()))
+            except ApiException as e:
+                if e.status != 410:
+                    print(f"Deployment informer for '{self.namespace}' failed: {e.reason}")
+                    self._stopped.wait(5)
+            except Exception as e:
+                print(f"Deployment informer for '{self.namespace}' failed: {e}")
+                self._stopped.wait(5)
+
+    def _list(self):
+        result = self.apps_api.list_namespaced_deployment(namespace=self.namespace)
+        with self._changed:
+            self._deployments = {}
+            self._by_label = {}
+            for deployment in result.items:
+                self._store(deployment)
+            self._resource_version = result.metadata.resource_version
+            self._synced = True
+            self._changed.notify_all()
+
+    def _watch(self, timeout):
+        w = watch.Watch()
+        for event in w.stream(
+            self.apps_api.list_namespaced_deployment,
+            namespace=self.namespace,
+            resource_version=self._resource_version,
+            timeout_seconds=max(int(timeout), 1),
+            _request_timeout=timeout + 5
+        ):
+            # Error events (e.g. 410 Gone once the resource version is too old) are raised by the stream
+            deployment = event['object']
+            with self._changed:
+                self._remove(deployment.metadata.name)
+                if event['type'] != 'DELETED':
+                    self._store(deployment)
+                self._resource_version = deployment.metadata.resource_version
+                self._changed.notify_all()
+            if self._stopped.is_set():
+                w.stop()
+
+    def _store(self, deployment):
+        name = deployment.metadata.name
+        self._deployments[name] = deployment
+        for key, value in (deployment.metadata.labels or {}).items():
+            self._by_label.setdefault(f'{key}={value}', set()).add(name)
+
+    def _remove(self, name):
+        deployment = self._deployments.pop(name, None)
+        if deployment is None:
+            return
+        for key, value in (deployment.metadata.labels or {}).items():
+            names = self._by_label.get(f'{key}={value}')
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self._by_label[f'{key}={value}']
@@ -0,0 +1,177 @@
+import os
+import numpy as np
+from utils.history_features import LATENCY_INDEX, RPS_INDEX
+
+# Columns of the state vector (see StateBuilder.build_state) that are forecast
+FORECAST = (RPS_INDEX, LATENCY_INDEX)
+
+# Appended to the state vector when forecasts are observation features, in this order
+FORECAST_FEATURE_NAMES = (
+    'rps_forecast',
+    'latency_forecast',
+)
+
+
+def forecast_feature_bounds(space):
+    """
+    Bounds of the forecast features of a state observation space.
+    Args:
+        space: Box of the 5-value state vector.
+    Returns:
+        Tuple of (low, high) arrays, one value per FORECAST_FEATURE_NAMES.
+    """
+    return space.low[list(FORECAST)], space.high[list(FORECAST)]
+
+
+class HoltWintersForecaster:
+    """
+    Additive Holt-Winters forecasts of RPS and p95 latency.
+    Every update folds one state into a level, a trend and (with season_length
+    set) one seasonal offset per position of the season, in O(1); forecasts
+    extrapolate the level and trend and add the seasonal offset of the
+    forecast step. The first season only initializes the model: the level is
+    its mean and the offsets its deviations from the mean, and forecasts are
+    flat until it is complete. Without a season it is Holt's linear-trend smoothing.
+    Steps are samples: feed one state per action interval and forecast a
+    number of action intervals ahead.
+    With n set, n independent forecasters (one per environment) are updated
+    together from states of shape (n, 5).
+    """
+    def __init__(self, season_length=0, alpha=0.5, beta=0.1, gamma=0.1, n=None):
+        self.season_length = max(int(season_length), 1)
+        self.alpha = alpha
+        self.beta = beta
+        # With a single position the offset would only compete with the level
+        self.gamma = gamma if self.season_length > 1 else 0.0
+        self.n = n
+        rows = 1 if n is None else n
+        series = len(FORECAST)
+        self.level = np.zeros((rows, series))
+        self.trend = np.zeros((rows, series))
+        self.seasonal = np.zeros((rows, self.season_length, series))
+        self.count = np.zeros(rows, dtype=np.int64)
+
+    def reset(self, rows=None):
+        """Forget everything learnt (by the selected rows only, if given)."""
+        rows = slice(None) if rows is None else rows
+        self.level[rows] = 0.0
+        self.trend[rows] = 0.0
+        self.seasonal[rows] = 0.0
+        self.count[rows] = 0
+
+    def update(self, states, rows=None):
+        """
+        Fold the next sample into the forecasters.
+        Args:
+            states: One state of shape (5,), or with n set, states of shape (n, 5)
+                (or (len(rows), 5) when rows is given).
+            rows: Indices of the forecasters to update, all by default.
+        """
+        self.update_samples(np.asarray(states)[..., FORECAST], rows)
+
+    def update_samples(self, samples, rows=None):
+        """
+        Fold the next RPS and latency samples into the forecasters, without the rest of a state.
+        Args:
+            samples: One (rps, latency) pair of shape (2,), or with n set, pairs of
+                shape (n, 2) (or (len(rows), 2) when rows is given).
+            rows: Indices of the forecasters to update, all by default.
+        """
+        # Rounded to float32 like the states forecasters are fed in training
+        samples = np.asarray(samples, dtype=np.float32)
+        rows = slice(None) if rows is None else rows
+        # Missing samples (NaN) read as 0, like series without data
+        y = np.nan_to_num(samples.reshape(-1, len(FORECAST)).astype(np.float64))
+        count = self.count[rows]
+        warmup = (count < self.season_length)[:, None]
+        index = np.arange(len(count))
+        position = count % self.season_length
+        seasonal = self.seasonal[rows]
+        offset = seasonal[index, position]
+        level, trend = self.level[rows], self.trend[rows]
+        new_level = self.alpha * (y - offset) + (1 - self.alpha) * (level + trend)
+        new_trend = self.beta * (new_level - level) + (1 - self.beta) * trend
+        new_offset = self.gamma * (y - new_level) + (1 - self.gamma) * offset
+        # During the first season: running mean as level, raw samples as offsets
+        new_level = np.where(warmup, level + (y - level) / (count[:, None] + 1), new_level)
+        seasonal[index, position] = np.where(warmup, y, new_offset)
+        season_complete = count + 1 == self.season_length
+        seasonal[season_complete] -= new_level[season_complete][:, None]
+        self.level[rows] = new_level
+        self.trend[rows] = np.where(warmup, 0.0, new_trend)
+        self.seasonal[rows] = seasonal
+        self.count[rows] = count + 1
+
+    def advance(self, steps, rows=None):
+        """
+        Skip steps samples that were never observed (e.g. while the service was down),
+        so the next update lands on the right position of the season. The level
+        and trend are left for that update to correct.
+        """
+        rows = slice(None) if rows is None else rows
+        self.count[rows] = np.where(self.count[rows] > 0, self.count[rows] + steps, 0)
+
+    def forecast(self, steps, rows=None):
+        """
+        Forecast RPS and latency steps samples after the last update.
+        Args:
+            steps: Number of steps ahead, or a 1-D array of them.
+            rows: Indices of the forecasters, all by default.
+        Returns:
+            Forecasts (never negative) of shape (2,) for one step count, (len(steps), 2)
+            for an array of them, with a leading (n,) dimension when n is set.
+        """
+        rows = slice(None) if rows is None else rows
+        horizon = np.atleast_1d(np.asarray(steps, dtype=np.int64))
+        count = self.count[rows]
+        position = (count[:, None] - 1 + horizon[None, :]) % self.season_length
+        seasonal = np.take_along_axis(self.seasonal[rows], position[:, :, None], axis=1)
+        seasonal *= (count >= self.season_length)[:, None, None]
+        forecasts = self.level[rows][:, None] + horizon[None, :, None] * self.trend[rows][:, None] + seasonal
+        forecasts = np.maximum(forecasts, 0.0).astype(np.float32)
+        if np.ndim(steps) == 0:
+            forecasts = forecasts[:, 0]
+        return forecasts[0] if self.n is None else forecasts
+
+    def save(self, path, last_step=-1):
+        """
+        Write the forecaster state to an .npz, atomically.
+        Args:
+            path: Destination file.
+            last_step: Index of the step of the last update, restored by load.
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                level=self.level,
+                trend=self.trend,
+                seasonal=self.seasonal,
+                count=self.count,
+                parameters=np.array([self.alpha, self.beta, self.gamma]),
+                last_step=np.array(last_step),
+            )
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """
+        Restore a state written by save.
+        Returns:
+            The last_step it was saved with.
+        Raises:
+            ValueError: If it was saved with a different season length, number of rows
+                or smoothing parameters.
+        """
+        with np.load(path) as data:
+            if data['seasonal'].shape != self.seasonal.shape:
+                raise ValueError(f"Forecaster state in {path} has shape {data['seasonal'].shape}, "
+                                 f"expected {self.seasonal.shape}")
+            parameters = np.array([self.alpha, self.beta, self.gamma])
+            if not np.allclose(data['parameters'], parameters):
+                raise ValueError(f"Forecaster state in {path} has alpha, beta, gamma {data['parameters'].tolist()}, "
+                                 f"expected {parameters.tolist()}")
+            self.level = data['level']
+            self.trend = data['trend']
+            self.seasonal = data['seasonal']
+            self.count = data['count']
+            return int(data['last_step'])
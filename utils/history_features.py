@@ -0,0 +1,132 @@
+import numpy as np
+
+# Columns of the state vector (see StateBuilder.build_state) that get trend features
+LATENCY_INDEX = 3
+RPS_INDEX = 4
+TRACKED = (RPS_INDEX, LATENCY_INDEX)
+
+# Appended to the state vector, in this order
+FEATURE_NAMES = (
+    'rps_delta',
+    'latency_delta',
+    'rps_ewma',
+    'latency_ewma',
+    'rps_slope',
+    'latency_slope',
+)
+
+
+def history_feature_bounds(space):
+    """
+    Bounds of the history features of a state observation space.
+    Args:
+        space: Box of the 5-value state vector.
+    Returns:
+        Tuple of (low, high) arrays, one value per FEATURE_NAMES.
+    """
+    low = space.low[list(TRACKED)]
+    high = space.high[list(TRACKED)]
+    span = high - low
+    return np.concatenate([-span, low, -span]), np.concatenate([span, high, span])
+
+
+class HistoryFeatures:
+    """
+    Trend features over the last window samples of RPS and latency.
+    Every update appends one state to a ring buffer and returns it followed by
+    FEATURE_NAMES: the change since the previous sample, an exponentially
+    weighted moving average and the least-squares slope over the window (per
+    sample). The slope is maintained from running sums, so an update costs
+    O(1) regardless of the window; the sums are recomputed from the buffer
+    once per window to keep rounding errors from accumulating.
+    With n set, n independent histories (one per environment) are updated
+    together from states of shape (n, 5).
+    """
+    def __init__(self, window=8, ewma_alpha=0.3, n=None):
+        if window < 1:
+            raise ValueError("History window must be at least 1 sample")
+        self.window = window
+        self.ewma_alpha = ewma_alpha
+        self.n = n
+        rows = 1 if n is None else n
+        series = len(TRACKED)
+        self._buffer = np.zeros((rows, window, series))
+        self._count = np.zeros(rows, dtype=np.int64)
+        self._last = np.zeros((rows, series))
+        self._ewma = np.zeros((rows, series))
+        self._sum = np.zeros((rows, series))  # sum of the values in the window
+        self._weighted_sum = np.zeros((rows, series))  # sum of position * value, oldest at position 0
+
+    def reset(self, rows=None):
+        """Forget the history (of the selected rows only, if given)."""
+        rows = slice(None) if rows is None else rows
+        self._count[rows] = 0
+        self._sum[rows] = 0.0
+        self._weighted_sum[rows] = 0.0
+
+    def update(self, states, rows=None):
+        """
+        Append states to the history.
+        Args:
+            states: One state of shape (5,), or with n set, states of shape (n, 5)
+                (or (len(rows), 5) when rows is given).
+            rows: Indices of the histories to update, all by default.
+        Returns:
+            The states followed by the history features, as float32.
+        """
+        states = np.asarray(states, dtype=np.float32)
+        features = self.update_samples(states[..., TRACKED], rows)
+        return np.concatenate([states, features], axis=-1)
+
+    def update_samples(self, samples, rows=None):
+        """
+        Append RPS and latency samples to the history, without the rest of a state.
+        Args:
+            samples: One (rps, latency) pair of shape (2,), or with n set, pairs of
+                shape (n, 2) (or (len(rows), 2) when rows is given).
+            rows: Indices of the histories to update, all by default.
+        Returns:
+            The history features (FEATURE_NAMES), as float32.
+        """
+        # Rounded to float32 like the states the features are computed from in training
+        samples = np.asarray(samples, dtype=np.float32)
+        rows = slice(None) if rows is None else rows
+        # Missing samples (NaN) read as 0, like series without data
+        y = np.nan_to_num(samples.reshape(-1, len(TRACKED)).astype(np.float64))
+        count = self._count[rows]
+        first = (count == 0)[:, None]
+        full = (count >= self.window)[:, None]
+        position = count % self.window
+        buffer = self._buffer[rows]
+        index = np.arange(len(count))
+
+        # Drop the oldest sample once the window is full; the others move one position down
+        total = self._sum[rows] - np.where(full, buffer[index, position], 0.0)
+        weighted = np.where(full, self._weighted_sum[rows] - total, self._weighted_sum[rows])
+        total += y
+        weighted += np.minimum(count, self.window - 1)[:, None] * y
+        buffer[index, position] = y
+        count = count + 1
+        wrapped = (count % self.window == 0)
+        if wrapped.any():
+            # The buffer is in order (oldest first) right after a wrap
+            total[wrapped] = buffer[wrapped].sum(axis=1)
+            weighted[wrapped] = np.einsum('w,rws->rs', np.arange(self.window), buffer[wrapped])
+
+        delta = np.where(first, 0.0, y - self._last[rows])
+        ewma = np.where(first, y, self.ewma_alpha * y + (1 - self.ewma_alpha) * self._ewma[rows])
+        samples = np.minimum(count, self.window)[:, None].astype(np.float64)
+        positions = samples * (samples - 1) / 2
+        squares = (samples - 1) * samples * (2 * samples - 1) / 6
+        denominator = samples * squares - positions ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(denominator > 0, (samples * weighted - positions * total) / denominator, 0.0)
+
+        self._buffer[rows] = buffer
+        self._count[rows] = count
+        self._sum[rows] = total
+        self._weighted_sum[rows] = weighted
+        self._last[rows] = y
+        self._ewma[rows] = ewma
+        features = np.concatenate([delta, ewma, slope], axis=1).astype(np.float32)
+        return features[0] if self.n is None else features
@@ -0,0 +1,112 @@
+"""
+Prometheus metrics and trace IDs shared by the autoscaler, suggestion server and model server.
+Each service exposes the metrics it recorded on /metrics; the job label tells them apart.
+
+A decision cycle gets a trace ID in the autoscaler, which is passed on in the
+X-Trace-Id header to the suggestion server and from there to the model server.
+Every service logs it and attaches it as an exemplar to the stage durations it
+records, exposed in the OpenMetrics format.
+
+Services run with several worker processes (gunicorn, hypercorn) set
+PROMETHEUS_MULTIPROC_DIR to an empty directory, so /metrics aggregates all workers.
+The multiprocess collector drops exemplars, so in that mode every stage duration
+is printed with its trace ID instead, and a worker's live gauges are removed
+when it exits (mark_worker_dead); its counters and histograms stay in the totals.
+"""
+import contextvars
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, start_http_server
+from prometheus_client.exposition import choose_encoder
+
+TRACE_HEADER = 'X-Trace-Id'
+# Metrics of all worker processes are aggregated through PROMETHEUS_MULTIPROC_DIR
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+# Trace ID of the decision being handled by the current thread or task
+current_trace_id = contextvars.ContextVar('trace_id', default=None)
+
+# From sub-millisecond cache hits up to the scale readiness timeout
+STAGE_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    'maestro_stage_duration_seconds',
+    'Time spent in one stage of the scaling decision path',
+    ['stage'],
+    buckets=STAGE_BUCKETS
+)
+PROMETHEUS_QUERY_SECONDS = Histogram(
+    'maestro_prometheus_query_duration_seconds',
+    'Duration of one Prometheus query made for a scaling decision',
+    ['query', 'status'],
+    buckets=STAGE_BUCKETS
+)
+DECISIONS = Counter(
+    'maestro_decisions',
+    'Scaling actions decided (0=down, 1=nothing, 2=up)',
+    ['action']
+)
+ERRORS = Counter(
+    'maestro_errors',
+    'Failures in the scaling decision path, by stage',
+    ['stage']
+)
+
+
+def start_trace(trace_id=None):
+    """Make trace_id (a new one if None) the trace of the current thread or task and return it."""
+    trace_id = trace_id or uuid.uuid4().hex[:16]
+    current_trace_id.set(trace_id)
+    return trace_id
+
+
+def observe(histogram, seconds):
+    """Record a duration, with the current trace ID as exemplar (single-process mode only)."""
+    trace_id = current_trace_id.get()
+    histogram.observe(seconds, {'trace_id': trace_id} if trace_id and not MULTIPROCESS else None)
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as one stage; exceptions are counted as errors of the stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.labels(stage).inc()
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe(STAGE_SECONDS.labels(stage), seconds)
+        # Without exemplars, the logs are what links a slow stage to its decision
+        trace_id = current_trace_id.get()
+        if MULTIPROCESS and trace_id:
+            print(f"[trace {trace_id}] {stage}: {seconds * 1000:.1f}ms")
+
+
+def metrics_payload(accept_header=None):
+    """
+    Render the metrics of this process (or of all workers in multiprocess mode).
+    Returns:
+        Tuple of (body bytes, content type) for a /metrics response.
+    """
+    registry = REGISTRY
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    encoder, content_type = choose_encoder(accept_header or '')
+    return encoder(registry), content_type
+
+
+def mark_worker_dead(pid):
+    """Remove the live gauges of an exited worker process in multiprocess mode."""
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+
+
+def start_metrics_server(port):
+    """Serve /metrics on its own port from a background thread (for services without a web server)."""
+    start_http_server(port)
@@ -1,53 +1,213 @@
+import os
 import time
-from kubernetes import client, config
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from kubernetes import client, config, watch
+from kubernetes.client.rest import ApiException
+from utils.deployment_informer import get_informer, release_informer
+from utils.instrumentation import ERRORS, timed
 
-class K8sClient:
-    def __init__(self, deployment_name, namespace):
+_apps_api = None
+_custom_objects_api = None
+_apps_api_lock = threading.Lock()
+# Informers of the namespaces list_deployments has listed
+_listing_informers = {}
+# Connections kept open to the API server; readiness watches of concurrent scale actions each hold one
+K8S_CONNECTION_POOL_SIZE = int(os.getenv('K8S_CONNECTION_POOL_SIZE', 32))
+# Runs the readiness waits of non-blocking scale actions
+_readiness_executor = ThreadPoolExecutor(max_workers=K8S_CONNECTION_POOL_SIZE, thread_name_prefix='k8s-readiness')
+
+def load_config():
+    """
+    Configure the Kubernetes client: in-cluster config when running in a pod,
+    otherwise KUBERNETES_API_URL (e.g. the local stand-in in benchmarks/local_stack)
+    or the local kubeconfig.
+    """
+    try:
         config.load_incluster_config()
-        self.k8s_api = client.AppsV1Api()
+    except config.ConfigException:
+        api_url = os.getenv('KUBERNETES_API_URL')
+        if not api_url:
+            config.load_kube_config()
+            return
+        configuration = client.Configuration()
+        configuration.host = api_url
+        client.Configuration.set_default(configuration)
+
+def get_apps_api():
+    """Load the client config once per process and share one AppsV1Api (and its connection pool)."""
+    global _apps_api
+    with _apps_api_lock:
+        if _apps_api is None:
+            load_config()
+            configuration = client.Configuration.get_default_copy()
+            configuration.connection_pool_maxsize = K8S_CONNECTION_POOL_SIZE
+            _apps_api = client.AppsV1Api(client.ApiClient(configuration))
+        return _apps_api
+
+def get_custom_objects_api():
+    """Share one CustomObjectsApi (used for Chaos Mesh experiments) on the same configuration."""
+    global _custom_objects_api
+    apps_api = get_apps_api()
+    with _apps_api_lock:
+        if _custom_objects_api is None:
+            _custom_objects_api = client.CustomObjectsApi(apps_api.api_client)
+        return _custom_objects_api
+
+class K8sClient:
+    def __init__(self, deployment_name, namespace, use_informer=True):
+        self.k8s_api = get_apps_api()
         self.deployment_name = deployment_name
         self.namespace = namespace
+        # Reads are served from the namespace's shared informer cache once it has synced;
+        # namespaces without an informer (see INFORMER_NAMESPACES) are read from the API server
+        self.informer = get_informer(self.k8s_api, namespace) if use_informer else None
+
+    def close(self):
+        """Release the namespace's informer; it stops once no client holds it."""
+        if self.informer is not None:
+            release_informer(self.namespace)
+            self.informer = None
 
     def read_deployment(self):
         return self.k8s_api.read_namespaced_deployment(
             name=self.deployment_name, namespace=self.namespace
         )
 
-    def scale_deployment(self, replicas):
-        deployment = self.read_deployment()
-        deployment.spec.replicas = int(replicas)
-        self.k8s_api.patch_namespaced_deployment(
-            name=self.deployment_name,
-            namespace=self.namespace,
-            body=deployment
-        )
-        self.wait_for_pods_ready(replicas)
-        time.sleep(3)
+    def cached_deployment(self):
+        """The deployment from the informer cache, or from the API server if the cache cannot serve it."""
+        if self.informer is not None and self.informer.has_synced():
+            deployment = self.informer.get(self.deployment_name)
+            if deployment is not None:
+                return deployment
+        return self.read_deployment()
+
+    def scale_deployment(self, replicas, wait=True, timeout=60):
+        """
+        Set the replica count through the /scale subresource.
+        Args:
+            replicas: Desired number of replicas.
+            wait: Block until the rollout is ready (or the timeout expires).
+            timeout: Seconds to wait for readiness.
+        Returns:
+            Whether all replicas became ready (True without waiting).
+        """
+        self._patch_scale(replicas)
+        if wait:
+            return self.wait_for_pods_ready(replicas, timeout)
+        return True
+
+    def scale_deployment_async(self, replicas, timeout=60):
+        """
+        Set the replica count and wait for readiness in the background.
+        Returns:
+            A Future resolving to whether all replicas became ready.
+        """
+        self._patch_scale(replicas)
+        # The wait keeps the caller's trace ID
+        context = contextvars.copy_context()
+        return _readiness_executor.submit(context.run, self.wait_for_pods_ready, replicas, timeout)
+
+    def _patch_scale(self, replicas):
+        with timed('scale_patch'):
+            self.k8s_api.patch_namespaced_deployment_scale(
+                name=self.deployment_name,
+                namespace=self.namespace,
+                body={'spec': {'replicas': int(replicas)}}
+            )
 
     def wait_for_pods_ready(self, expected_replicas, timeout=60):
-        start_time = time.time()
-        while time.time() - start_time < timeout:
+        """
+        Wait until the deployment reports expected_replicas ready and available.
+        Status changes are followed with a watch on the deployment instead of polling.
+        Returns:
+            True when ready, False on timeout, deletion or a replica count changed by someone else.
+        """
+        with timed('readiness_wait'):
+            ready = self._wait_until_ready(expected_replicas, timeout)
+        if not ready:
+            ERRORS.labels('readiness_wait').inc()
+        return ready
+
+    def _wait_until_ready(self, expected_replicas, timeout):
+        deadline = time.monotonic() + timeout
+        deployment = self.read_deployment()
+        while True:
+            ready = self._readiness(deployment, expected_replicas)
+            if ready is not None:
+                return ready
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
+                deployment = self._next_deployment_update(deployment.metadata.resource_version, remaining)
+            except ApiException as e:
+                if e.status != 410:
+                    print(f"Error watching pod readiness: {e.reason}")
+                    time.sleep(min(1, max(deadline - time.monotonic(), 0)))
+                # Watch expired or failed: start again from a fresh read
                 deployment = self.read_deployment()
-                if deployment.spec.replicas != expected_replicas:
-                    print(f"Deployment replicas mismatch: expected {expected_replicas}, got {deployment.spec.replicas}")
-                    return False
-                if (deployment.status.ready_replicas == expected_replicas and 
-                    deployment.status.available_replicas == expected_replicas):
-                    print(f"All {expected_replicas} pods are ready")
-                    return True
-                print(f"Waiting for pods: {deployment.status.ready_replicas}/{expected_replicas} ready")
-                time.sleep(2)
-            except Exception as e:
-                print(f"Error checking pod readiness: {str(e)}")
-                time.sleep(2)
+            if deployment is None:
+                print(f"Deployment {self.deployment_name} was deleted while waiting for pods")
+                return False
         print(f"Timeout waiting for {expected_replicas} pods to be ready")
         return False
 
+    def _next_deployment_update(self, resource_version, timeout):
+        """Block until the deployment changes after resource_version; None if it was deleted."""
+        w = watch.Watch()
+        deployment = None
+        for event in w.stream(
+            self.k8s_api.list_namespaced_deployment,
+            namespace=self.namespace,
+            field_selector=f'metadata.name={self.deployment_name}',
+            resource_version=resource_version,
+            timeout_seconds=max(int(timeout), 1),
+            _request_timeout=timeout + 5
+        ):
+            w.stop()
+            if event['type'] == 'DELETED':
+                return None
+            deployment = event['object']
+        # The watch timed out without changes; the caller checks its deadline
+        return deployment or self.read_deployment()
+
+    @staticmethod
+    def _readiness(deployment, expected_replicas):
+        """True when ready, False when waiting is pointless, None to keep waiting."""
+        if deployment.spec.replicas != expected_replicas:
+            print(f"Deployment replicas mismatch: expected {expected_replicas}, got {deployment.spec.replicas}")
+            return False
+        status = deployment.status
+        observed = (status.observed_generation or 0) >= (deployment.metadata.generation or 0)
+        if (observed and (status.ready_replicas or 0) == expected_replicas and
+                (status.available_replicas or 0) == expected_replicas):
+            print(f"All {expected_replicas} pods are ready")
+            return True
+        print(f"Waiting for pods: {status.ready_replicas or 0}/{expected_replicas} ready")
+        return None
+
     def get_current_replicas(self):
-        deployment = self.read_deployment()
+        with timed('replica_read'):
+            deployment = self.cached_deployment()
         return deployment.spec.replicas
 
     def get_annotations(self):
-        deployment = self.read_deployment()
-        return deployment.metadata.annotations or {} 
\ No newline at end of file
+        deployment = self.cached_deployment()
+        return deployment.metadata.annotations or {} 
+
+def list_deployments(namespace, label_selector=None):
+    """List the deployments of a namespace, optionally filtered by a label selector."""
+    if namespace not in _listing_informers:
+        # Held for the life of the process: the namespace is listed again every discovery
+        _listing_informers[namespace] = get_informer(get_apps_api(), namespace)
+    informer = _listing_informers[namespace]
+    if informer is not None and informer.has_synced():
+        try:
+            return informer.list(label_selector)
+        except ValueError:
+            pass  # Set-based selectors are left to the API server
+    return get_apps_api().list_namespaced_deployment(
+        namespace=namespace, label_selector=label_selector or ''
+    ).items
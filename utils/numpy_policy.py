@@ -0,0 +1,64 @@
+import numpy as np
+
+ACTIVATIONS = {
+    'tanh': np.tanh,
+    'relu': lambda x: np.maximum(x, 0),
+    'identity': lambda x: x,
+}
+
+
+class NumpyPolicy:
+    """
+    Deterministic inference for a PPO MlpPolicy exported with rl_model.export.
+    Needs only numpy, and predicts the same actions as
+    model.predict(observation, deterministic=True).
+    """
+    def __init__(self, weights, biases, activations, obs_mean=None, obs_var=None, clip_obs=None, epsilon=1e-8):
+        self.weights = weights
+        self.biases = biases
+        self.activations = [ACTIVATIONS[name] for name in activations]
+        self.obs_mean = obs_mean
+        self.obs_var = obs_var
+        self.clip_obs = clip_obs
+        self.epsilon = epsilon
+        self.observation_dim = weights[0].shape[1]
+
+    @classmethod
+    def load(cls, path):
+        """Load a policy from an exported .npz file."""
+        with np.load(path) as data:
+            n_layers = int(data['n_layers'])
+            weights = [data[f'weight_{i}'] for i in range(n_layers)]
+            biases = [data[f'bias_{i}'] for i in range(n_layers)]
+            activations = [str(name) for name in data['activations']]
+            normalization = {}
+            if 'obs_mean' in data:
+                normalization = dict(
+                    obs_mean=data['obs_mean'],
+                    obs_var=data['obs_var'],
+                    clip_obs=float(data['clip_obs']),
+                    epsilon=float(data['epsilon']),
+                )
+        return cls(weights, biases, activations, **normalization)
+
+    def predict(self, observation, deterministic=True):
+        """
+        Predict actions the way stable-baselines3 does.
+        Args:
+            observation: One observation of shape (obs_dim,) or a batch of shape (n, obs_dim).
+            deterministic: Only deterministic (greedy) actions are supported.
+        Returns:
+            Tuple of (actions, None); actions is a scalar array for a single observation.
+        """
+        if not deterministic:
+            raise ValueError("NumpyPolicy only supports deterministic predictions")
+        x = np.asarray(observation, dtype=np.float32)
+        single = x.ndim == 1
+        x = x.reshape(-1, self.observation_dim)
+        if self.obs_mean is not None:
+            x = np.clip((x - self.obs_mean) / np.sqrt(self.obs_var + self.epsilon), -self.clip_obs, self.clip_obs)
+            x = x.astype(np.float32)
+        for weight, bias, activation in zip(self.weights, self.biases, self.activations):
+            x = activation(x @ weight.T + bias)
+        actions = np.argmax(x, axis=1)
+        return (actions[0] if single else actions), None
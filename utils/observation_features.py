@@ -0,0 +1,86 @@
+import numpy as np
+from utils.history_features import FEATURE_NAMES as HISTORY_FEATURE_NAMES, HistoryFeatures, history_feature_bounds
+from utils.forecaster import FORECAST_FEATURE_NAMES, HoltWintersForecaster, forecast_feature_bounds
+
+# Optional feature groups appended to the 5-value state, in observation order, by the
+# request field that carries them to the model server
+FEATURE_GROUPS = (
+    ('history', HISTORY_FEATURE_NAMES),
+    ('forecast', FORECAST_FEATURE_NAMES),
+)
+
+
+def feature_groups(extra_features):
+    """
+    The feature groups a model taking extra_features values beyond the state was trained with.
+    Raises:
+        ValueError: If no combination of groups has that many features.
+    """
+    for mask in range(2 ** len(FEATURE_GROUPS)):
+        groups = [group for i, group in enumerate(FEATURE_GROUPS) if mask & (1 << i)]
+        if sum(len(names) for _, names in groups) == extra_features:
+            return groups
+    raise ValueError(f"No combination of observation features has {extra_features} values")
+
+
+class ObservationFeatures:
+    """
+    Optional features appended to the state vector: RPS/latency trend features
+    over the last history_window samples (see utils/history_features.py),
+    then RPS/latency forecasts forecast_horizon samples ahead (see utils/forecaster.py).
+    With n set, n environments are updated together from states of shape (n, 5).
+    """
+    def __init__(self, history_window=0, ewma_alpha=0.3, forecast_horizon=0, season_length=0, n=None):
+        self.history = HistoryFeatures(history_window, ewma_alpha, n) if history_window else None
+        self.forecaster = HoltWintersForecaster(season_length, n=n) if forecast_horizon else None
+        self.forecast_horizon = forecast_horizon
+
+    @classmethod
+    def from_config(cls, config, n=None):
+        """The features enabled in TRAINING_CONFIG, or None if there are none."""
+        history_window = config.get('history_window', 0)
+        forecast_horizon = config.get('forecast_horizon', 0)
+        if not history_window and not forecast_horizon:
+            return None
+        return cls(history_window, config.get('history_ewma_alpha', 0.3),
+                   forecast_horizon, config.get('forecast_season_length', 0), n)
+
+    def observation_space(self, space):
+        """Extend the Box of the state vector with the bounds of the enabled features."""
+        from gymnasium import spaces
+        low, high = [space.low], [space.high]
+        if self.history is not None:
+            bounds = history_feature_bounds(space)
+            low.append(bounds[0])
+            high.append(bounds[1])
+        if self.forecaster is not None:
+            bounds = forecast_feature_bounds(space)
+            low.append(bounds[0])
+            high.append(bounds[1])
+        return spaces.Box(
+            low=np.concatenate(low).astype(np.float32),
+            high=np.concatenate(high).astype(np.float32),
+            dtype=np.float32
+        )
+
+    def reset(self, rows=None):
+        """Start new episodes (of the selected rows only, if given)."""
+        if self.history is not None:
+            self.history.reset(rows)
+        if self.forecaster is not None:
+            self.forecaster.reset(rows)
+
+    def update(self, states, rows=None):
+        """
+        Add the next states and append the features to them.
+        Returns:
+            The states followed by the enabled features, as float32.
+        """
+        observations = np.asarray(states, dtype=np.float32)
+        if self.history is not None:
+            observations = self.history.update(states, rows)
+        if self.forecaster is not None:
+            self.forecaster.update(states, rows)
+            forecasts = self.forecaster.forecast(self.forecast_horizon, rows)
+            observations = np.concatenate([observations, forecasts], axis=-1)
+        return observations
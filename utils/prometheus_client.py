@@ -1,16 +1,254 @@
 import os
+import re
+import time
+import asyncio
+import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
 from prometheus_api_client import PrometheusConnect
 
+# Outcome of one instant query.
+# status is 'ok', 'no_data' (the query matched no series) or 'error'; value is
+# 0.0 unless status is 'ok'. latency is the request duration in seconds and
+# timestamp the Unix time of the newest raw sample behind the value. An instant
+# query only reports its own evaluation time, so timestamp is None unless
+# query_many was given a series selector for the query.
+QueryResult = namedtuple('QueryResult', ['value', 'status', 'latency', 'timestamp', 'error'])
+
+
+# First series selector of a PromQL expression, e.g. istio_requests_total{reporter="destination"}
+SELECTOR_PATTERN = re.compile(r'[a-zA-Z_:][a-zA-Z0-9_:]*\{[^}]*\}')
+
+
+def series_selectors(queries):
+    """The series selector behind each query of a dict, for query_many's staleness."""
+    selectors = {}
+    for name, query in queries.items():
+        match = SELECTOR_PATTERN.search(query)
+        if match:
+            selectors[name] = match.group(0)
+    return selectors
+
+
+# Label naming the query each series of a sample_times_query result belongs to
+SAMPLE_TIME_LABEL = 'query'
+
+
+def sample_times_query(selectors):
+    """
+    PromQL for the time of the newest sample behind each of several series selectors,
+    in one round trip: one series per selector, labelled with its name under SAMPLE_TIME_LABEL.
+    """
+    return ' or '.join(
+        f'label_replace(max(timestamp({selector})), "{SAMPLE_TIME_LABEL}", "{name}", "", "")'
+        for name, selector in selectors.items()
+    )
+
+
+def parse_sample_times(result):
+    """Dict of name to Unix time from the result series of a sample_times_query."""
+    return {series['metric'].get(SAMPLE_TIME_LABEL): float(series['value'][1]) for series in result}
+
+
+def staleness(result):
+    """Seconds since the newest raw sample behind a QueryResult, None if unknown."""
+    return None if result.timestamp is None else time.time() - result.timestamp
+
+
+def with_sample_time(result, sample_time):
+    """A QueryResult with the time of its newest sample as timestamp, when both are known."""
+    if result.status != 'ok' or sample_time is None:
+        return result
+    return result._replace(timestamp=sample_time)
+
+
 class PrometheusClient:
-    def __init__(self, url=None):
+    def __init__(self, url=None, pool_size=8, timeout=10):
         if url is None:
             url = os.getenv("PROMETHEUS_URL", "http://prometheus-nodeport.monitoring.svc.cluster.local:9090")
-        self.prom = PrometheusConnect(url=url)
+        # Keep-alive connections are reused across queries and across decisions
+        self.session = requests.Session()
+        self.prom = PrometheusConnect(url=url, session=self.session, timeout=timeout)
+        # Size the connection pool for concurrent queries, keeping the client's retry policy
+        retry = self.session.get_adapter(self.prom.url).max_retries
+        self.session.mount(self.prom.url, HTTPAdapter(max_retries=retry, pool_maxsize=pool_size))
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='prometheus-query')
 
     def query(self, query):
+        result = self.query_result(query)
+        if result.status == 'error':
+            print(f"Prometheus query failed: {query}, error: {result.error}")
+        return result.value
+
+    def query_result(self, query):
+        """Run one instant query and return a QueryResult."""
+        start = time.perf_counter()
         try:
             result = self.prom.custom_query(query)
-            return float(result[0]['value'][1]) if result else 0.0
         except Exception as e:
-            print(f"Prometheus query failed: {query}, error: {str(e)}")
-            return 0.0
+            return QueryResult(0.0, 'error', time.perf_counter() - start, None, str(e))
+        latency = time.perf_counter() - start
+        if not result:
+            return QueryResult(0.0, 'no_data', latency, None, None)
+        return QueryResult(float(result[0]['value'][1]), 'ok', latency, None, None)
+
+    def query_range(self, query, start, end, step):
+        """
+        Run a range query.
+        Args:
+            query: PromQL query.
+            start: Unix time of the first sample (rounded to whole seconds).
+            end: Unix time of the last sample (rounded to whole seconds).
+            step: Seconds between samples.
+        Returns:
+            Tuple of (timestamps, values) numpy arrays of the first series, empty without data.
+        Raises:
+            Exception: If the query fails.
+        """
+        result = self.prom.custom_query_range(
+            query,
+            start_time=datetime.datetime.fromtimestamp(start, datetime.timezone.utc),
+            end_time=datetime.datetime.fromtimestamp(end, datetime.timezone.utc),
+            step=f'{step}s'
+        )
+        if not result:
+            return np.array([]), np.array([])
+        samples = np.array(result[0]['values'], dtype=np.float64)
+        return samples[:, 0], samples[:, 1]
+
+    def query_many(self, queries, selectors=None):
+        """
+        Run several instant queries concurrently over the pooled session, so a
+        batch costs about one round trip instead of one per query.
+        Args:
+            queries: Dict of name to PromQL query.
+            selectors: Optional dict of name to the series selector behind the query
+                (e.g. 'container_memory_usage_bytes{namespace="default"}'); the time
+                of its newest sample, queried alongside, becomes the result's timestamp.
+        Returns:
+            Dict of name to QueryResult.
+        """
+        selectors = {name: selector for name, selector in (selectors or {}).items() if name in queries}
+        futures = {name: self._executor.submit(self.query_result, query) for name, query in queries.items()}
+        sample_times = self._executor.submit(self.sample_times, selectors) if selectors else None
+        results = {name: future.result() for name, future in futures.items()}
+        if sample_times is not None:
+            times = sample_times.result()
+            for name in selectors:
+                results[name] = with_sample_time(results[name], times.get(name))
+        return results
+
+    def sample_times(self, selectors):
+        """Time of the newest sample behind each named series selector, in one query; {} if it fails."""
+        try:
+            return parse_sample_times(self.prom.custom_query(sample_times_query(selectors)))
+        except Exception:
+            return {}
+
+
+class AsyncPrometheusClient:
+    """
+    asyncio counterpart of PrometheusClient built on aiohttp.
+    The session (and its keep-alive connection pool) is created on first use,
+    inside the running event loop.
+    """
+    def __init__(self, url=None, pool_size=100, timeout=10):
+        if url is None:
+            url = os.getenv("PROMETHEUS_URL", "http://prometheus-nodeport.monitoring.svc.cluster.local:9090")
+        self.url = url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self):
+        # Imported here so the synchronous client does not depend on aiohttp
+        import aiohttp
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def _instant_query(self, query):
+        """The result series of an instant query."""
+        async with self._get_session().get(f"{self.url}/api/v1/query", params={'query': query}) as response:
+            if response.status != 200:
+                body = await response.text()
+                raise Exception(f"HTTP Status Code {response.status} ({body!r})")
+            return (await response.json())['data']['result']
+
+    async def query_result(self, query):
+        """Run one instant query and return a QueryResult."""
+        start = time.perf_counter()
+        try:
+            result = await self._instant_query(query)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return QueryResult(0.0, 'error', time.perf_counter() - start, None, str(e) or type(e).__name__)
+        latency = time.perf_counter() - start
+        if not result:
+            return QueryResult(0.0, 'no_data', latency, None, None)
+        return QueryResult(float(result[0]['value'][1]), 'ok', latency, None, None)
+
+    async def query_range(self, query, start, end, step):
+        """
+        Run a range query.
+        Args:
+            query: PromQL query.
+            start: Unix time of the first sample.
+            end: Unix time of the last sample.
+            step: Seconds between samples.
+        Returns:
+            Tuple of (timestamps, values) numpy arrays of the first series, empty without data.
+        Raises:
+            Exception: If the query fails.
+        """
+        params = {'query': query, 'start': start, 'end': end, 'step': step}
+        async with self._get_session().get(f"{self.url}/api/v1/query_range", params=params) as response:
+            if response.status != 200:
+                body = await response.text()
+                raise Exception(f"HTTP Status Code {response.status} ({body!r})")
+            result = (await response.json())['data']['result']
+        if not result:
+            return np.array([]), np.array([])
+        samples = np.array(result[0]['values'], dtype=np.float64)
+        return samples[:, 0], samples[:, 1]
+
+    async def query_many(self, queries, selectors=None):
+        """
+        Run several instant queries concurrently.
+        Args:
+            queries: Dict of name to PromQL query.
+            selectors: Optional dict of name to series selector, as for PrometheusClient.query_many.
+        Returns:
+            Dict of name to QueryResult.
+        """
+        selectors = {name: selector for name, selector in (selectors or {}).items() if name in queries}
+        values = await asyncio.gather(
+            *(self.query_result(query) for query in queries.values()),
+            *([self.sample_times(selectors)] if selectors else [])
+        )
+        results = dict(zip(queries.keys(), values))
+        if selectors:
+            times = values[-1]
+            for name in selectors:
+                results[name] = with_sample_time(results[name], times.get(name))
+        return results
+
+    async def sample_times(self, selectors):
+        """Time of the newest sample behind each named series selector, in one query; {} if it fails."""
+        try:
+            return parse_sample_times(await self._instant_query(sample_times_query(selectors)))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return {}
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -33,4 +33,41 @@ class StateBuilder:
             n_replicas,
             p95_latency_ms,
             rps
-        ], dtype=np.float32) 
\ No newline at end of file
+        ], dtype=np.float32) 
+
+    @staticmethod
+    def build_states(
+        cpu_usage_percent: np.ndarray,
+        memory_bytes: np.ndarray,
+        n_replicas: np.ndarray,
+        p95_latency_ms: np.ndarray,
+        rps: np.ndarray,
+        max_memory_per_pod: int = 512 * 1024 * 1024
+    ) -> np.ndarray:
+        """
+        Vectorized counterpart of build_state for a batch of deployments.
+        Args:
+            cpu_usage_percent: CPU usage in percent, shape (K,).
+            memory_bytes: Total memory usage in bytes, shape (K,).
+            n_replicas: Number of replicas, shape (K,).
+            p95_latency_ms: 95th percentile latency in ms, shape (K,).
+            rps: Requests per second, shape (K,).
+            max_memory_per_pod: Max memory per pod in bytes.
+        Returns:
+            Numpy array of shape (K, 5), one state per row.
+        """
+        n_replicas = np.asarray(n_replicas, dtype=np.float64)
+        total_max_memory = max_memory_per_pod * n_replicas
+        memory_normalized = np.divide(
+            memory_bytes,
+            total_max_memory,
+            out=np.zeros_like(total_max_memory),
+            where=total_max_memory > 0
+        )
+        return np.stack([
+            cpu_usage_percent,
+            memory_normalized,
+            n_replicas,
+            p95_latency_ms,
+            rps
+        ], axis=-1).astype(np.float32)
@@ -0,0 +1,115 @@
+import os
+import glob
+import time
+import threading
+import numpy as np
+
+# Columns stored for every observation, in file order
+TRACE_COLUMNS = (
+    'timestamp',
+    'cpu_usage_percent',
+    'memory_bytes',
+    'replicas',
+    'p95_latency_ms',
+    'rps',
+    'action',
+    'latency_soft_constraint',
+    'latency_hard_constraint',
+)
+# Written last by rl_model.build_dataset into a directory of one .npy file per column
+DATASET_METADATA = 'dataset.json'
+
+
+class TraceRecorder:
+    """
+    Appends observations to a directory of compressed columnar .npz chunks.
+    Rows are buffered in memory and written as a new chunk every chunk_size
+    rows, so a crash loses at most one chunk and existing files are never rewritten.
+    """
+    def __init__(self, directory, chunk_size=256):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+        # Several processes may record the same deployment, so every writer gets its own prefix
+        self._prefix = f"{int(time.time())}-{os.getpid()}"
+        self._sequence = 0
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def record(self, cpu_usage_percent, memory_bytes, replicas, p95_latency_ms, rps,
+               action=-1, annotations=None, timestamp=None):
+        """
+        Record one observation.
+        Args:
+            cpu_usage_percent: CPU usage in percent.
+            memory_bytes: Total memory usage in bytes.
+            replicas: Number of replicas.
+            p95_latency_ms: 95th percentile latency in ms.
+            rps: Requests per second.
+            action: Action chosen for this observation, -1 if none.
+            annotations: Deployment annotations dict, for the latency constraints.
+            timestamp: Unix time of the observation, defaults to now.
+        """
+        annotations = annotations or {}
+        row = (
+            time.time() if timestamp is None else timestamp,
+            cpu_usage_percent,
+            memory_bytes,
+            replicas if replicas is not None else -1,
+            p95_latency_ms,
+            rps,
+            action if action is not None else -1,
+            float(annotations.get('latencySoftConstraint', -1)),
+            float(annotations.get('latencyHardConstraint', -1)),
+        )
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) >= self.chunk_size:
+                self._write_chunk()
+
+    def flush(self):
+        """Write buffered rows to a new chunk."""
+        with self._lock:
+            if self._rows:
+                self._write_chunk()
+
+    def close(self):
+        self.flush()
+
+    def _write_chunk(self):
+        data = np.array(self._rows, dtype=np.float64)
+        self._rows = []
+        path = os.path.join(self.directory, f"chunk-{self._prefix}-{self._sequence:06d}.npz")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **{name: data[:, i] for i, name in enumerate(TRACE_COLUMNS)})
+        # Readers never see a partially written chunk
+        os.replace(tmp_path, path)
+        self._sequence += 1
+
+
+def load_trace(directory):
+    """
+    Load every chunk recorded in a directory, or a dataset built by rl_model.build_dataset.
+    Dataset columns are memory-mapped read-only rather than read into memory.
+    Returns:
+        Dict of column name to numpy array, sorted by timestamp.
+    """
+    if os.path.exists(os.path.join(directory, DATASET_METADATA)):
+        return {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in TRACE_COLUMNS}
+    paths = sorted(glob.glob(os.path.join(directory, 'chunk-*.npz')))
+    if not paths:
+        raise FileNotFoundError(f"No trace chunks found in {directory}")
+    columns = {name: [] for name in TRACE_COLUMNS}
+    for path in paths:
+        with np.load(path) as chunk:
+            for name in TRACE_COLUMNS:
+                columns[name].append(chunk[name])
+    trace = {name: np.concatenate(values) for name, values in columns.items()}
+    order = np.argsort(trace['timestamp'], kind='stable')
+    return {name: values[order] for name, values in trace.items()}
+
+
+def trace_directory(root, namespace, deployment):
+    """Directory holding the trace of one deployment under a trace root."""
+    return os.path.join(root, namespace, deployment)
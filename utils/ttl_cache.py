@@ -0,0 +1,151 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class LRUCache:
+    """
+    Mapping that keeps at most max_entries keys, evicting the least recently
+    used; get and assignment count as a use. on_evict, if given, is called with
+    every evicted value. Not thread-safe.
+    """
+    def __init__(self, max_entries=1024, on_evict=None):
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            return default
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def __setitem__(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+
+    def items(self):
+        """Snapshot of the (key, value) pairs, least recently used first."""
+        return list(self._entries.items())
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TTLCache:
+    """
+    Thread-safe cache with per-entry time-to-live and LRU eviction.
+    Concurrent get_or_load calls for the same missing key are coalesced:
+    only the first caller runs the loader and the others wait for its result.
+    """
+    def __init__(self, ttl, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> Future of the running load
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader, cache_none=False):
+        """
+        Return the cached value for key, or load it with loader().
+        Args:
+            key: Hashable cache key.
+            loader: Callable producing the value on a miss.
+            cache_none: Whether a None result is cached (by default it is
+                treated as a failed load and retried on the next call).
+        Returns:
+            The cached or freshly loaded value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            return future.result()
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._inflight[key]
+            if value is not None or cache_none:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class AsyncTTLCache:
+    """
+    asyncio counterpart of TTLCache for use inside a single event loop.
+    Loads run as their own task, so a caller that is cancelled (e.g. by a
+    request timeout) does not cancel the load other callers are waiting on.
+    """
+    def __init__(self, ttl, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> Task of the running load
+
+    async def get_or_load(self, key, loader, cache_none=False):
+        """
+        Return the cached value for key, or load it by awaiting loader().
+        Args:
+            key: Hashable cache key.
+            loader: Coroutine function producing the value on a miss.
+            cache_none: Whether a None result is cached.
+        Returns:
+            The cached or freshly loaded value.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            return entry[1]
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, cache_none))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader, cache_none):
+        try:
+            value = await loader()
+        finally:
+            del self._inflight[key]
+        if value is not None or cache_none:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)